@@ -0,0 +1,132 @@
+"""
+Compare the thread and asyncio crawl engines in pages/sec against a
+local stub of letterboxd (see stub_server.py), which answers every
+request after --latency seconds, like a remote server would.
+
+    python3 -m benchmarks.crawl_bench --depth 1 --population 2000
+    python3 -m benchmarks.crawl_bench --latency 0   # CPU bound
+"""
+import io
+import sys
+import time
+import asyncio
+import argparse
+import contextlib
+import crawl
+from lmatch import pipeline, profile_crawler
+from benchmarks.stub_server import StubServer, StubSite
+
+
+class NullDao:
+    """ Stands in for dao.MovieDao, there's no database in the benchmark. """
+
+    def ensureIndexes(self):
+        pass
+
+    def updateMovie(self, film):
+        pass
+
+    def findMovie(self, url):
+        return None
+
+    def findMovies(self, urls):
+        return []
+
+    def close(self):
+        pass
+
+    def fetchAllMovies(self, callback):
+        pass
+
+
+def _work_left(crawler, max_depth):
+    with crawler.lock_:
+        return any(p.depth <= max_depth
+                   for p in crawler.queued_ | crawler.ongoing_)
+
+
+def bench_threads(crawler, workers, max_depth):
+    threads = [crawl.LbThread(crawler, i + 1, max_depth)
+               for i in range(workers)]
+    for t in threads:
+        t.start()
+
+    while any(t.is_alive() for t in threads) \
+            and _work_left(crawler, max_depth):
+        time.sleep(.05)
+
+    crawler.stop_parsing()
+    for t in threads:
+        t.join()
+
+
+def bench_async(crawler, workers, max_depth):
+    asyncio.run(crawl.crawl_async(crawler, workers, max_depth))
+
+
+ENGINES = {"threads": bench_threads, "async": bench_async}
+
+
+def run(engine, site, workers, max_depth, latency=0):
+    with StubServer(site, latency=latency) as server:
+        crawl.BASE_URL = server.base_url
+        crawl.movie_facade = crawl.MovieFacade(NullDao())
+
+        crawler = profile_crawler.ProfileCrawler()
+        crawler.enqueue("u0")
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ENGINES[engine](crawler, workers, max_depth)
+        elapsed = time.perf_counter() - start
+
+        return (len(crawler.parsed_), server.requests, elapsed)
+
+
+def print_stages():
+    print("    {}".format(crawl.fetch_stats))
+    if crawl.parse_pool is not None:
+        print("    {}".format(crawl.parse_pool))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=list(ENGINES) + ["both"],
+                        default="both")
+    parser.add_argument("--population", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=.1,
+                        help="seconds the stub server takes to answer each "
+                             "request (default: .1)")
+    parser.add_argument("--parse-processes", type=int, default=0,
+                        help="parse in a pool of processes (threads only)")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse listings as they are downloaded "
+                             "(threads only)")
+    args = parser.parse_args(argv)
+    crawl.stream_pages = args.stream
+
+    if args.parse_processes:
+        crawl.parse_pool = pipeline.ParsePool(args.parse_processes)
+
+    site = StubSite(args.population)
+    engines = list(ENGINES) if args.engine == "both" else [args.engine]
+    for engine in engines:
+        crawl.fetch_stats = pipeline.StageStats("fetch")
+        workers = args.threads if engine == "threads" else args.workers
+        (parsed, pages, elapsed) = run(engine, site, workers, args.depth,
+                                       args.latency)
+        print("{:8} {:5} workers: {:6} profiles, {:7} pages in {:7.2f}s "
+              "-> {:8.1f} pages/sec".format(engine, workers, parsed, pages,
+                                            elapsed, pages / elapsed))
+        if engine == "threads":
+            print_stages()
+
+    if crawl.parse_pool is not None:
+        crawl.parse_pool.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,79 @@
+"""
+Cost of ProfileCrawler.on_parsed for a profile that follows many users,
+in a crawler that already knows a lot of them. Compared with enqueueing
+the followed users one at a time, as on_parsed used to.
+
+    python3 -m benchmarks.enqueue_bench --known 1000000 --following 5000
+"""
+import gc
+import time
+import random
+import argparse
+from lmatch.profile_crawler import ProfileCrawler
+
+
+def crawler_with(known):
+    c = ProfileCrawler()
+    c.replay(["q", "user{}".format(i), 2] for i in range(known))
+    return c
+
+
+def followings(known, following, rounds, new_ratio):
+    """ Lists of followed users, part known, part never seen. """
+    rnd = random.Random(1)
+    fresh = 0
+    for _ in range(rounds):
+        users = []
+        for _ in range(following):
+            if rnd.random() < new_ratio:
+                users.append("new{}".format(fresh))
+                fresh += 1
+            else:
+                users.append("user{}".format(rnd.randrange(known)))
+        yield users
+
+
+def bench(name, known, lists, parse):
+    c = crawler_with(known)
+    # like timeit, keep the collector (and its passes over the 1M
+    # objects of the crawler) out of the measurement
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    for (i, users) in enumerate(lists):
+        parse(c, "parsed{}".format(i), users)
+    elapsed = time.perf_counter() - start
+    gc.enable()
+    total = sum(len(users) for users in lists)
+    print("{:12} {:8.1f} ms/profile {:6.2f} us/followed user".format(
+        name, elapsed * 1000 / len(lists), elapsed * 1e6 / total))
+
+
+def one_at_a_time(c, username, following):
+    for f in following:
+        c.enqueue(f, 1)
+    c.on_parsed(username, 0, [], {})
+
+
+def batched(c, username, following):
+    c.on_parsed(username, 0, following, {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--known", type=int, default=1000000,
+                        help="users the crawler knows already")
+    parser.add_argument("--following", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--new", type=float, default=0.2,
+                        help="ratio of followed users never seen before")
+    args = parser.parse_args(argv)
+
+    lists = list(followings(args.known, args.following, args.rounds,
+                            args.new))
+    bench("one at a time", args.known, lists, one_at_a_time)
+    bench("batched", args.known, lists, batched)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Startup time and memory of MovieFacade loading the whole movies
+collection versus filling a bounded cache on demand, for catalogues of
+growing size. Uses mongomock, so no database server is needed.
+
+    python3 -m benchmarks.film_cache_bench --sizes 10000 100000
+"""
+import io
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+import contextlib
+import mongomock
+import crawl
+from lmatch import dao, film
+
+
+def make_db(size):
+    db = dao.MovieDao(mongomock.MongoClient())
+    db.collection_movies_.insert_many(
+        [{'_id': i, 'url': "film-{}".format(i), 'name': "Film {}".format(i),
+          'avg_rate': 5.0} for i in range(size)])
+    return db
+
+
+def run(db, size, cache_size, lookups):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        facade = crawl.MovieFacade(db, cache_size)
+    startup = time.perf_counter() - start
+    (memory, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # a crawl mostly sees popular films, skew the lookups towards them
+    urls = ["film-{}".format(int(random.paretovariate(1.2)) % size)
+            for _ in range(lookups)]
+    start = time.perf_counter()
+    for url in urls:
+        facade.getId(url)
+    lookup = time.perf_counter() - start
+
+    return (startup, memory, lookup, facade.hash_table_)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10000, 50000, 100000])
+    parser.add_argument("--cache-size", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        db = make_db(size)
+        for cache_size in (None, args.cache_size):
+            (startup, memory, lookup, cache) = run(db, size, cache_size,
+                                                   args.lookups)
+            print("{:7} films, {:>11}: startup {:7.3f}s, {:8.1f} KiB, "
+                  "{} lookups in {:6.3f}s {}".format(
+                      size, "eager" if cache_size is None
+                      else "lru({})".format(cache_size),
+                      startup, memory / 1024, args.lookups, lookup,
+                      "" if cache_size is None else "[{}]".format(cache)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,82 @@
+"""
+Throughput of crawl_profile when many threads resolve overlapping film
+lists at the same time, with the film cache behind one global lock (as
+MovieFacade used to be) versus the single-flight facade.
+
+    python3 -m benchmarks.film_contention_bench --workers 40 --latency .01
+"""
+import io
+import sys
+import time
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import crawl
+from lmatch import parse, profile_crawler
+from benchmarks.crawl_bench import NullDao
+from benchmarks.stub_server import StubServer, StubSite
+
+
+class GlobalLockFacade(crawl.MovieFacade):
+    """ MovieFacade before single-flight: one lock for the whole miss. """
+
+    def __init__(self, db):
+        crawl.MovieFacade.__init__(self, db)
+        self.lock_ = threading.Lock()
+
+    def getId(self, movie_url):
+        with self.lock_:
+            if movie_url not in self.hash_table_:
+                film = parse.parse_film(crawl.get_page('/film/' + movie_url))
+                self.store(movie_url, film)
+
+            return self.hash_table_[movie_url]
+
+
+FACADES = {"global-lock": GlobalLockFacade,
+           "single-flight": crawl.MovieFacade}
+
+
+def run(facade, site, latency, workers, profiles):
+    with StubServer(site, latency) as server:
+        crawl.BASE_URL = server.base_url
+        crawl.movie_facade = FACADES[facade](NullDao())
+        crawler = profile_crawler.ProfileCrawler()
+
+        jobs = [profile_crawler.Profile("u{}".format(i), 0)
+                for i in range(profiles)]
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(lambda p: crawl.crawl_profile(crawler, p),
+                              jobs))
+        elapsed = time.perf_counter() - start
+
+        films = len(crawl.movie_facade.hash_table_)
+        return (len(crawler.parsed_), films, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=40)
+    parser.add_argument("--profiles", type=int, default=200)
+    parser.add_argument("--catalogue", type=int, default=8,
+                        help="variants of the films list, more means "
+                             "less overlap between profiles")
+    parser.add_argument("--latency", type=float, default=.005,
+                        help="seconds the stub server takes per request")
+    args = parser.parse_args(argv)
+
+    site = StubSite(args.profiles, args.catalogue)
+    for facade in FACADES:
+        (parsed, films, elapsed) = run(facade, site, args.latency,
+                                       args.workers, args.profiles)
+        print("{:14} {:5} profiles, {:6} films in {:7.2f}s "
+              "-> {:7.1f} profiles/sec".format(facade, parsed, films,
+                                               elapsed, parsed / elapsed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,70 @@
+"""
+Time and peak memory of lmatch.graph on synthetic following graphs: a
+few dozen followings per profile, most of them going to a small set of
+popular profiles, the way they do on letterboxd.
+
+    python3 -m benchmarks.graph_bench --nodes 100000 1000000 --following 20
+"""
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+from lmatch import graph
+
+
+def edges(nodes, following, seed=1):
+    rnd = np.random.default_rng(seed)
+    degrees = rnd.poisson(following, nodes)
+    src = np.repeat(np.arange(nodes, dtype=np.int32), degrees)
+    # power law popularity, the most followed being random profiles
+    popular = rnd.permutation(nodes).astype(np.int32)
+    rank = (nodes * rnd.random(len(src)) ** 3).astype(np.int64)
+    # in no particular order, the way a crawl finds them
+    order = rnd.permutation(len(src))
+    return (src[order], popular[rank[order]])
+
+
+def measure(name, fn, size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("  {:24} {:7.3f}s  peak {:7.1f} MiB ({:.1f}x the graph)".format(
+        name, elapsed, peak / 2**20, peak / size))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+",
+                        default=[100000, 1000000])
+    parser.add_argument("--following", type=int, default=20,
+                        help="average followings per profile")
+    args = parser.parse_args(argv)
+
+    for n in args.nodes:
+        (src, dst) = edges(n, args.following)
+        # what the CSR arrays take
+        size = 4 * len(src) + 8 * (n + 1)
+        print("{} nodes, {} edges, {:.1f} MiB".format(n, len(src),
+                                                      size / 2**20))
+        g = measure("build", lambda: graph.FollowGraph.from_edges(
+            src, dst, n), size)
+        del src, dst
+        measure("in-degree top 100", lambda: g.top(g.in_degree(), 100),
+                size)
+        rank = measure("pagerank", g.pagerank, size)
+        top = g.top(rank, 1)[0]
+        measure("components", g.components, size)
+        measure("reversed", g.reversed, size)
+        for k in (1, 2, 3):
+            hood = measure("{}-hop followers of top".format(k),
+                           lambda: g.neighbourhood(top, k, "in"), size)
+            print("  {:24} {} nodes".format("", len(hood)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,54 @@
+"""
+Microseconds per page of each parser function, for each parser backend,
+on the pages in tests/data.
+
+    python3 -m benchmarks.parse_bench
+"""
+import os
+import sys
+import argparse
+import timeit
+from lmatch import parse, parse_regex
+
+BACKENDS = {"find": parse, "regex": parse_regex}
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+
+# function -> pages it's meant for
+CASES = {
+    "following": ["jlcordeiro_following_1.html"],
+    "movies_watched": ["jlcordeiro_watched_1.html",
+                       "tommyatlon_watched_1.html"],
+    "next_page": ["jlcordeiro_following_1.html",
+                  "jlcordeiro_watched_1.html"],
+    "last_page": ["jlcordeiro_watched_1.html"],
+    "parse_film": ["film_the-way-back-2020.html"],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200,
+                        help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print("{:16} {:30} {:>10} {:>10}".format("function", "page",
+                                            *BACKENDS))
+    for (function, pages) in CASES.items():
+        for name in pages:
+            with open(os.path.join(DATA_DIR, name)) as f:
+                page = f.read()
+
+            timings = []
+            for backend in BACKENDS.values():
+                fn = getattr(backend, function)
+                best = min(timeit.repeat(lambda: fn(page), number=args.number,
+                                         repeat=args.repeat))
+                timings.append(1e6 * best / args.number)
+
+            print("{:16} {:30} {:>8.1f}us {:>8.1f}us".format(
+                function, name, *timings))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,98 @@
+"""
+Memory taken by the profiles of a synthetic crawl state, read back from
+journal records: plain profiles (a __dict__ each, following lists of
+strings) versus the __slots__ profiles, with interned usernames and
+following lists of ids.
+
+    python3 -m benchmarks.profile_memory_bench --profiles 1000000
+"""
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from lmatch.profile_crawler import ProfileCrawler
+from lmatch.ratings import Ratings
+
+
+class PlainProfile:
+    """ Profile as it was: attributes in a __dict__. """
+
+    def __init__(self, username, depth=0, following=None, movies=None):
+        self.username = username
+        self.depth = depth
+        self.following = following
+        self.movies = movies
+
+    def __hash__(self):
+        return hash(self.username)
+
+    def __eq__(self, other):
+        return self.username == other.username
+
+
+def synthetic(profiles, parsed, following):
+    """ Journal lines: `parsed` profiles following others, queued rest. """
+    rnd = random.Random(1)
+    for i in range(profiles):
+        username = "user{}".format(i)
+        if i < parsed:
+            followed = ["user{}".format(rnd.randrange(profiles))
+                        for _ in range(following)]
+            record = ["p", username, 1, followed, []]
+        else:
+            record = ["q", username, 2]
+        yield json.dumps(record)
+
+
+def load_plain(lines):
+    queued = set()
+    parsed = set()
+    for line in lines:
+        record = json.loads(line)
+        if record[0] == "q":
+            queued.add(PlainProfile(record[1], record[2]))
+        else:
+            parsed.add(PlainProfile(record[1], record[2], record[3],
+                                    Ratings(record[4])))
+    return (queued, parsed)
+
+
+def load_compact(lines):
+    c = ProfileCrawler()
+    c.replay(json.loads(line) for line in lines)
+    return c
+
+
+def measure(name, load, lines, profiles):
+    tracemalloc.start()
+    start = time.perf_counter()
+    state = load(lines)
+    elapsed = time.perf_counter() - start
+    (memory, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:8} {:8.1f} MiB {:6.1f} bytes/profile, loaded in {:5.2f}s".format(
+        name, memory / 2**20, memory / profiles, elapsed))
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=1000000)
+    parser.add_argument("--parsed", type=int, default=50000,
+                        help="how many of the profiles are parsed")
+    parser.add_argument("--following", type=int, default=100,
+                        help="users followed by each parsed profile")
+    args = parser.parse_args(argv)
+
+    lines = list(synthetic(args.profiles, args.parsed, args.following))
+
+    # the username table is shared by the whole process, so this one goes
+    # first, while it is empty
+    state = measure("compact", load_compact, lines, args.profiles)
+    del state
+    measure("plain", load_plain, lines, args.profiles)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Latency and throughput of lmatch.query_service under concurrent clients,
+each on a keep-alive connection of its own, against what answering one
+query from scratch takes (load the matrix, build the engine, query), on
+a synthetic crawl. Halfway through, the matrix is replaced, to see the
+reload happen under load.
+
+The service runs in a process of its own, as it would.
+
+    python3 -m benchmarks.query_bench --profiles 10000 --clients 1 4 16
+    python3 -m benchmarks.query_bench --socket   # over a Unix socket
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+from lmatch import query_service, ratings, similarity
+from benchmarks.similarity_bench import build
+
+
+def serve(path, socket_path, urls):
+    service = query_service.QueryService(path, poll=.1)
+    server = query_service.QueryServer(service, socket_path=socket_path)
+    urls.put(server.url)
+    server.serve_forever()
+
+
+def queries(rnd, profiles):
+    user = "user{}".format(rnd.randrange(profiles))
+    kind = rnd.choice(("top", "match", "common"))
+    if kind == "top":
+        return (kind, "/top?user={}&k=20".format(user))
+    if kind == "match":
+        return (kind, "/match?user={}&limit=100".format(user))
+    return (kind, "/common?user={}&other=user{}".format(
+        user, rnd.randrange(profiles)))
+
+
+def client(url, profiles, count, seed, latencies, errors):
+    rnd = random.Random(seed)
+    conn = query_service.connect(url)
+    try:
+        for _ in range(count):
+            (kind, path) = queries(rnd, profiles)
+            start = time.perf_counter()
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            latencies.setdefault(kind, []).append(
+                time.perf_counter() - start)
+            if response.status != 200:
+                errors.append(response.status)
+    finally:
+        conn.close()
+
+
+def wait_reload(url, since, reloaded):
+    """ Seconds from since to the service's first reload. """
+    conn = query_service.connect(url)
+    try:
+        while True:
+            conn.request("GET", "/status")
+            if json.loads(conn.getresponse().read())["generation"]:
+                reloaded.append(time.perf_counter() - since)
+                return
+            time.sleep(.005)
+    finally:
+        conn.close()
+
+
+def run(url, profiles, clients, count):
+    latencies = [{} for _ in range(clients)]
+    errors = []
+    threads = [threading.Thread(target=client, args=(
+        url, profiles, count, i, latencies[i], errors))
+        for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    print("{:3} clients: {:7.1f} queries/s, {} errors".format(
+        clients, clients * count / elapsed, len(errors)))
+    for kind in ("top", "match", "common"):
+        times = np.array([t for l in latencies for t in l.get(kind, [])])
+        print("    {:6} p50 {:6.2f}ms  p99 {:6.2f}ms".format(
+            kind, 1000 * np.percentile(times, 50),
+            1000 * np.percentile(times, 99)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=10000)
+    parser.add_argument("--ratings", type=int, default=300,
+                        help="average ratings per profile")
+    parser.add_argument("--films", type=int, default=100000)
+    parser.add_argument("--clients", type=int, nargs="+",
+                        default=[1, 4, 16])
+    parser.add_argument("--queries", type=int, default=50,
+                        help="queries per client")
+    parser.add_argument("--socket", action="store_true",
+                        help="over a Unix socket rather than TCP")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "crawl.ratings")
+        matrix = build(args.profiles, args.ratings, args.films)
+        matrix.save(path)
+
+        start = time.perf_counter()
+        similarity.SimilarityEngine(ratings.RatingsMatrix.load(path)) \
+            .matches("user1")
+        print("{} profiles, {} ratings. One query from scratch: {:.2f}s"
+              .format(args.profiles, len(matrix.ids),
+                      time.perf_counter() - start))
+
+        urls = multiprocessing.Queue()
+        server = multiprocessing.Process(target=serve, args=(
+            path, os.path.join(tmp, "lmatch.sock") if args.socket else None,
+            urls), daemon=True)
+        server.start()
+        url = urls.get()
+        print("serving at {}".format(url))
+
+        for clients in args.clients:
+            run(url, args.profiles, clients, args.queries)
+
+        # a new matrix, while clients keep querying the old one
+        build(args.profiles, args.ratings, args.films, seed=2).save(path)
+        reloaded = []
+        watcher = threading.Thread(target=wait_reload, args=(
+            url, time.perf_counter(), reloaded))
+        watcher.start()
+        print("while reloading:")
+        run(url, args.profiles, max(args.clients), args.queries)
+        watcher.join()
+        print("reloaded {:.2f}s after the new matrix was saved".format(
+            reloaded[0]))
+
+        server.terminate()
+        server.join()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,81 @@
+"""
+Memory and disk used by the ratings of a synthetic crawl: dicts and JSON
+pairs (as in dump.lmatch) versus Ratings arrays and a RatingsMatrix file.
+
+    python3 -m benchmarks.ratings_bench --profiles 10000 --ratings 500
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from lmatch import ratings
+
+
+def synthetic(profiles, per_profile, films):
+    rnd = random.Random(1)
+    for i in range(profiles):
+        ids = rnd.sample(range(films), per_profile)
+        yield ("user{}".format(i), {f: rnd.randint(0, 10) for f in ids})
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    (memory, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (result, memory, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--ratings", type=int, default=500,
+                        help="ratings per profile")
+    parser.add_argument("--films", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    data = list(synthetic(args.profiles, args.ratings, args.films))
+    total = args.profiles * args.ratings
+    tmp = tempfile.mkdtemp()
+
+    (dicts, memory, _) = measure(lambda: [(u, dict(m)) for (u, m) in data])
+    print("dicts:        {:8.1f} MiB, {:5.1f} bytes/rating".format(
+        memory / 2**20, memory / total))
+    del dicts
+
+    (arrays, memory, _) = measure(
+        lambda: [(u, ratings.Ratings(m)) for (u, m) in data])
+    print("Ratings:      {:8.1f} MiB, {:5.1f} bytes/rating".format(
+        memory / 2**20, memory / total))
+    del arrays
+
+    json_path = os.path.join(tmp, "dump.json")
+    with open(json_path, "w") as f:
+        json.dump([[u, [[k, v] for (k, v) in m.items()]]
+                   for (u, m) in data], f)
+    (_, memory, elapsed) = measure(lambda: json.load(open(json_path)))
+    print("json pairs:   {:8.1f} MiB on disk, load {:6.3f}s, {:8.1f} MiB"
+          .format(os.path.getsize(json_path) / 2**20, elapsed,
+                  memory / 2**20))
+
+    matrix_path = os.path.join(tmp, "crawl.ratings")
+    ratings.RatingsMatrix.from_profiles(data).save(matrix_path)
+    (_, memory, elapsed) = measure(
+        lambda: ratings.RatingsMatrix.load(matrix_path))
+    print("matrix mmap:  {:8.1f} MiB on disk, load {:6.3f}s, {:8.1f} MiB"
+          .format(os.path.getsize(matrix_path) / 2**20, elapsed,
+                  memory / 2**20))
+
+    os.remove(json_path)
+    os.remove(matrix_path)
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
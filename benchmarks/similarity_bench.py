@@ -0,0 +1,82 @@
+"""
+Time of one stats.py style query (one profile against everyone) with the
+sparse-matrix SimilarityEngine, versus the pure Python loop stats.py used
+to run, on synthetic crawls.
+
+    python3 -m benchmarks.similarity_bench --profiles 10000 100000
+"""
+import sys
+import time
+import argparse
+from array import array
+import numpy as np
+from lmatch import ratings, similarity
+
+
+def build(profiles, per_profile, films, seed=1):
+    rnd = np.random.default_rng(seed)
+    usernames = []
+    offsets = [0]
+    ids = []
+    for i in range(profiles):
+        row = np.unique((rnd.pareto(1.0, rnd.poisson(per_profile)) * 100)
+                        .astype(np.int64) % films).astype(np.int32)
+        ids.append(row)
+        offsets.append(offsets[-1] + len(row))
+        usernames.append("user{}".format(i))
+
+    ids = np.concatenate(ids)
+    rates = rnd.integers(0, 11, len(ids)).astype(np.int8)
+    return ratings.RatingsMatrix(usernames, array('q', offsets),
+                                 array('i', ids.tobytes()),
+                                 array('b', rates.tobytes()))
+
+
+def python_loop(matrix, username):
+    main = matrix.get(username)
+    matches = []
+    for (other, movies) in matrix.rows():
+        if other == username:
+            continue
+        deltas = [r - main[f] for (f, r) in movies.items()
+                  if r != 0 and f in main]
+        matches.append([other, len(deltas),
+                        (sum(deltas) * 1.0 / len(deltas)) if sum(deltas)
+                        else 0])
+    # sorting once, the old stats.py sorted on every iteration
+    return sorted(matches, key=lambda m: abs(m[2]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", type=int, nargs="+",
+                        default=[10000, 100000])
+    parser.add_argument("--ratings", type=int, default=300,
+                        help="average ratings per profile")
+    parser.add_argument("--films", type=int, default=200000)
+    parser.add_argument("--python-up-to", type=int, default=10000,
+                        help="skip the python loop on bigger crawls")
+    args = parser.parse_args(argv)
+
+    for n in args.profiles:
+        matrix = build(n, args.ratings, args.films)
+        start = time.perf_counter()
+        engine = similarity.SimilarityEngine(matrix)
+        print("{:7} profiles, {:9} ratings: engine built in {:.3f}s"
+              .format(n, len(matrix.ids), time.perf_counter() - start))
+
+        for metric in similarity.METRICS:
+            start = time.perf_counter()
+            engine.matches("user0", metric)
+            print("    {:8} {:8.1f} ms".format(
+                metric, 1000 * (time.perf_counter() - start)))
+
+        if n <= args.python_up_to:
+            start = time.perf_counter()
+            python_loop(matrix, "user0")
+            print("    {:8} {:8.1f} ms".format(
+                "python", 1000 * (time.perf_counter() - start)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
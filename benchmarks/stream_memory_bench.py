@@ -0,0 +1,116 @@
+"""
+Peak memory of the fetching threads, per thread, when listings are read
+whole and then parsed (response.text) versus parsed as they are
+downloaded (lmatch.parse_stream), against a local stub of letterboxd
+whose films pages are made `--scale` times longer.
+
+Each mode runs in a process of its own, so that its peak RSS is its own.
+The peak of what Python allocated (tracemalloc) is reported next to it:
+RSS also counts what the allocator keeps around, in one arena per
+thread, for small blocks like the streamed chunks.
+
+    python3 -m benchmarks.stream_memory_bench --threads 40 --scale 20
+"""
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from lmatch import parse, parse_stream, pipeline
+from lmatch.http_client import HttpClient
+from benchmarks.stub_server import StubServer, StubSite, FILMS_PAGES
+
+
+class LongPagesSite(StubSite):
+    """ StubSite with the films on each films page repeated `scale` times. """
+
+    def __init__(self, scale: int):
+        StubSite.__init__(self)
+        self.scale = scale
+
+    def films(self, username: str, page: int) -> str:
+        text = StubSite.films(self, username, page)
+        first = text.find("<li class=\"poster-container")
+        last = text.rfind("</li>", 0, text.rfind("poster-container"))
+        last = text.find("</li>", last + 1) + len("</li>")
+        return text[:first] + text[first:last] * self.scale + text[last:]
+
+
+def buffered(client, url):
+    return pipeline.parse_listing(parse.movies_watched, client.get(url).text)
+
+
+def streaming(client, url):
+    response = client.get(url, stream=True)
+    try:
+        return parse_stream.parse_chunks(parse.movies_watched,
+                                         client.iter_text(response))
+    finally:
+        response.close()
+
+
+MODES = {"buffered": buffered, "streaming": streaming}
+
+
+def rss() -> int:
+    """ Resident memory of this process, in bytes (Linux). """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def peak_rss() -> int:
+    """ Peak resident memory of this process, in bytes (Linux). """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def child(mode, base_url, threads, pages):
+    fetch = MODES[mode]
+    client = HttpClient(threads)
+    urls = ["{}u{}/films/page/{}".format(base_url, i, 1 + i % FILMS_PAGES)
+            for i in range(pages)]
+    before = rss()
+    tracemalloc.start()
+    with ThreadPoolExecutor(threads) as pool:
+        start = time.perf_counter()
+        films = sum(pool.map(lambda url: len(fetch(client, url)[0]), urls))
+        elapsed = time.perf_counter() - start
+    (_, traced) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    grown = peak_rss() - before
+    print("{:9} {:3} threads: peak {:7.1f} KiB/thread allocated, "
+          "RSS +{:7.1f} KiB/thread, {:6.1f} pages/s, {} films".format(
+              mode, threads, traced / 1024 / threads, grown / 1024 / threads,
+              pages / elapsed, films))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--scale", type=int, default=20,
+                        help="times longer than the usual films page")
+    parser.add_argument("--mode", choices=list(MODES), default=None,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--url", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mode is not None:
+        child(args.mode, args.url, args.threads, args.pages)
+        return
+
+    site = LongPagesSite(args.scale)
+    print("films pages of {:.0f} KiB".format(
+        len(site.films("u0", 1).encode()) / 1024))
+    with StubServer(site) as server:
+        for mode in MODES:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.stream_memory_bench",
+                 "--mode", mode, "--url", server.base_url,
+                 "--threads", str(args.threads),
+                 "--pages", str(args.pages)], check=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
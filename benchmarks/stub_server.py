@@ -0,0 +1,238 @@
+"""
+Local HTTP server that impersonates letterboxd.com using the pages in
+tests/data. Used by the benchmarks so that different crawl engines can
+be compared without touching the real website.
+
+The site it serves is synthetic:
+    - there are `population` users, named u0 .. u<population - 1>.
+    - every user follows 26 others (spread over 2 'following' pages).
+    - every user watched films spread over 7 'films' pages. With the
+      default `catalogue` of 1 every user watched the same films. With
+      a bigger one, each page is drawn from one of `catalogue` variants
+      of the films list, so users' lists overlap only partially.
+    - every film page is the same one.
+"""
+import gzip
+import os
+import re
+import time
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lmatch import parse
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+
+FILMS_PAGES = 7
+
+
+def _read(name: str) -> str:
+    with open(os.path.join(DATA_DIR, name)) as f:
+        return f.read()
+
+
+class StubSite:
+    """ Renders the pages of the synthetic site. """
+
+    def __init__(self, population: int = 1000, catalogue: int = 1):
+        self.population = population
+        self.catalogue = catalogue
+        self.following_ = [_read("jlcordeiro_following_1.html"),
+                           _read("jlcordeiro_following_2.html")]
+        self.names_ = [parse.following(p) for p in self.following_]
+        self.films_ = {1: _read("jlcordeiro_watched_1.html"),
+                       3: _read("jlcordeiro_watched_3.html"),
+                       FILMS_PAGES: _read("jlcordeiro_watched_7.html")}
+        self.film_ = _read("film_the-way-back-2020.html")
+
+    def user_id(self, username: str) -> int:
+        return int(username[1:])
+
+    def following(self, username: str, page: int) -> str:
+        text = self.following_[page - 1]
+        base = self.user_id(username) * 26 + (page - 1) * 25
+        for (i, name) in enumerate(self.names_[page - 1]):
+            followed = "u{}".format((base + i + 1) % self.population)
+            text = text.replace("href=\"/{}/\"".format(name),
+                                "href=\"/{}/\"".format(followed))
+        return text.replace("/jlcordeiro/", "/{}/".format(username))
+
+    def films(self, username: str, page: int) -> str:
+        if page == 1 or page == FILMS_PAGES:
+            text = self.films_[page]
+        else:
+            text = self.films_[3].replace(
+                "<a class=\"next\" href=\"/jlcordeiro/films/page/4/\"",
+                "<a class=\"next\" href=\"/jlcordeiro/films/page/{}/\""
+                .format(page + 1))
+
+        if self.catalogue > 1:
+            variant = (self.user_id(username) + page) % self.catalogue
+            text = text.replace("data-target-link=\"/film/",
+                                "data-target-link=\"/film/v{}-"
+                                .format(variant))
+
+        return text.replace("/jlcordeiro/", "/{}/".format(username))
+
+    def film(self, slug: str) -> str:
+        return self.film_
+
+    def render(self, path: str):
+        """ Returns the page for `path` or None if it doesn't exist. """
+        path = path.strip("/")
+
+        m = re.fullmatch(r"(u\d+)/following/page/([12])", path)
+        if m:
+            return self.following(m.group(1), int(m.group(2)))
+
+        m = re.fullmatch(r"(u\d+)/films/(?:by/date/)?page/(\d+)", path)
+        if m and 1 <= int(m.group(2)) <= FILMS_PAGES:
+            return self.films(m.group(1), int(m.group(2)))
+
+        m = re.fullmatch(r"film/([^/]+)", path)
+        if m:
+            return self.film(m.group(1))
+
+        return None
+
+
+class StubServer:
+    """
+    Threaded HTTP/1.1 server for a StubSite, listening on localhost on a
+    random port. Counts the requests served. Every response can be
+    delayed by `latency` seconds, to mimic a remote server.
+
+    Pages carry an ETag, a request with a matching If-None-Match gets a
+    304 (counted in not_modified).
+
+    To exercise clients' throttling, the server can answer 429 (with a
+    Retry-After) past `limit` requests per second, and 503 to one in
+    every `fail_every` requests.
+
+    With compress, pages are sent gzipped to the clients that accept it
+    (counted in compressed).
+    """
+
+    def __init__(self, site: StubSite = None, latency: float = 0,
+                 limit: float = None, retry_after: str = "1",
+                 fail_every: int = 0, compress: bool = False):
+        self.site = site if site is not None else StubSite()
+        self.latency = latency
+        self.limit = limit
+        self.retry_after = retry_after
+        self.fail_every = fail_every
+        self.compress = compress
+        self.requests = 0
+        self.not_modified = 0
+        self.throttled = 0
+        self.failed = 0
+        self.compressed = 0
+        self.allowance_ = limit
+        self.checked_ = time.monotonic()
+        self.lock_ = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in two writes: without this, a
+            # kept-alive connection waits on the client's delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with server.lock_:
+                    server.requests += 1
+                    status = server.refuse()
+
+                if status is not None:
+                    self.send_response(status)
+                    if status == 429 and server.retry_after is not None:
+                        self.send_header("Retry-After", server.retry_after)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                body = server.site.render(self.path)
+                status = 200 if body is not None else 404
+                payload = (body or "").encode()
+                etag = "\"{:08x}\"".format(zlib.crc32(payload))
+
+                if status == 200 \
+                        and self.headers.get("If-None-Match") == etag:
+                    with server.lock_:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                encoding = None
+                if server.compress and "gzip" in self.headers.get(
+                        "Accept-Encoding", ""):
+                    encoding = "gzip"
+                    payload = gzip.compress(payload)
+                    with server.lock_:
+                        server.compressed += 1
+
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                if encoding is not None:
+                    self.send_header("Content-Encoding", encoding)
+                self.send_header("Content-Length", str(len(payload)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd_ = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd_.daemon_threads = True
+        self.thread_ = threading.Thread(target=self.httpd_.serve_forever,
+                                        daemon=True)
+
+    def refuse(self):
+        """
+        Status to answer a request with instead of the page, None to
+        serve it: 429 past `limit` requests per second (token bucket),
+        503 for one in every `fail_every` requests. Locked by the caller.
+        """
+        if self.fail_every and self.requests % self.fail_every == 0:
+            self.failed += 1
+            return 503
+
+        if self.limit is not None:
+            now = time.monotonic()
+            self.allowance_ = min(self.limit, self.allowance_ +
+                                  (now - self.checked_) * self.limit)
+            self.checked_ = now
+            if self.allowance_ < 1:
+                self.throttled += 1
+                return 429
+            self.allowance_ -= 1
+
+        return None
+
+    @property
+    def base_url(self) -> str:
+        return "http://127.0.0.1:{}/".format(self.httpd_.server_address[1])
+
+    def start(self) -> str:
+        self.thread_.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.httpd_.shutdown()
+        self.httpd_.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -1,10 +1,21 @@
+import os
 import sys
-import json
 import time
+import asyncio
+import logging
 import argparse
 import threading
-from requests import session
-from lmatch import profile_crawler, parse, dao, film
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from lmatch import profile_crawler, parse, dao, film, async_crawler, \
+    journal, lru, parse_regex, pipeline, ratings, singleflight, frontier, \
+    job_queue, http_cache, throttle, http_client, metrics, parse_stream, \
+    checkpoint, film_stats
+
+log = logging.getLogger("crawl")
+
+# what MovieFacade.fetchId gets back from the cache when the film isn't in it
+_MISSING = object()
 
 
 class MovieFacade:
@@ -12,147 +23,862 @@ class MovieFacade:
     Class to bridge movies between crawler and database layer.
     Inserts into DB if a movie has never been seen before.
     Caches the url -> id mapping.
+
+    By default every movie in the DB is cached at startup. If a
+    cache_size is given, the cache starts empty and is filled on demand
+    from the DB instead, keeping only the cache_size most recently used
+    movies.
+
+    Cache hits don't take any lock (other than the LRU's own). Misses go
+    through a single-flight map, so that threads asking for the same film
+    wait for one fetch while films that differ are fetched in parallel.
+    The time spent waiting on the locks of both is observed in
+    lmatch_lock_wait_seconds{lock="film_cache" / "film_flights"}.
     """
-    def __init__(self):
-        self.lock_ = threading.Lock()
+    def __init__(self, db=None, cache_size=None):
+        self.flights_ = singleflight.SingleFlight(
+            metrics.TimedLock("film_flights"))
+        self.db_ = db if db is not None else dao.MovieDao()
+        self.lazy_ = cache_size is not None
+
+        if self.lazy_:
+            self.db_.ensureIndexes()
+            self.hash_table_ = lru.LruCache(cache_size,
+                                            metrics.TimedLock("film_cache"))
+            return
+
         self.hash_table_ = {}
 
         def cacheOne(m):
             self.hash_table_[m.url] = int(m.id)
-            print("Loaded ", m.url, " from db.")
+            log.debug("Loaded %s from db.", m.url)
 
-        self.db_ = dao.MovieDao()
         self.db_.fetchAllMovies(lambda m: cacheOne(m))
 
+    def cache(self, movie_url, film_id):
+        if self.lazy_:
+            self.hash_table_.put(movie_url, film_id)
+        else:
+            self.hash_table_[movie_url] = film_id
+
+    def lookup(self, movie_url):
+        return self.hash_table_.get(movie_url)
+
+    def load(self, movie_url):
+        """ Look for a movie missing from the cache in the DB. """
+        if not self.lazy_:
+            return None
+
+        film = self.db_.findMovie(movie_url)
+        if film is None:
+            return None
+
+        self.cache(movie_url, int(film.id))
+        return int(film.id)
+
+    def preload(self, movie_urls):
+        """ Bring all the movies missing from the cache in one DB query. """
+        if not self.lazy_:
+            return
+
+        missing = [url for url in movie_urls if url not in self.hash_table_]
+        if missing:
+            for film in self.db_.findMovies(missing):
+                self.cache(film.url, int(film.id))
+
+    def store(self, movie_url, film):
+        self.db_.updateMovie(film)
+        self.cache(movie_url, int(film.id))
+        return int(film.id)
+
+    def fetchId(self, movie_url):
+        # it may have been stored since the caller missed the cache. One
+        # get, as it may also be evicted again between two calls
+        film_id = self.hash_table_.get(movie_url, _MISSING)
+        if film_id is not _MISSING:
+            return film_id
+
+        film_id = self.load(movie_url)
+        if film_id is not None:
+            return film_id
+
+        film = parse_page(parse.parse_film, get_page('/film/' + movie_url))
+        return self.store(movie_url, film)
+
     def getId(self, movie_url):
-        with self.lock_:
-            # if the url hasn't been found yet, get it.
-            if movie_url not in self.hash_table_:
-                film = parse.parse_film(get_page('/film/' + movie_url))
-                self.db_.updateMovie(film)
-                self.hash_table_[movie_url] = int(film.id)
+        film_id = self.lookup(movie_url)
+        if film_id is not None:
+            return film_id
+
+        return self.flights_.do(movie_url, lambda: self.fetchId(movie_url))
+
+
+movie_facade = None
 
-            return self.hash_table_[movie_url]
+# page parsing backends, see benchmarks/parse_bench.py
+PARSERS = {"find": parse, "regex": parse_regex}
 
+BASE_URL = "https://letterboxd.com/"
+
+# optional pool of processes to parse pages in (see --parse-processes)
+parse_pool = None
+fetch_stats = pipeline.StageStats("fetch")
+
+fetch_seconds = metrics.REGISTRY.histogram(
+    "lmatch_fetch_seconds", "Time to fetch a page, retries included")
+
+# optional on-disk cache of the pages (see --http-cache)
+response_cache = None
+
+# parse listings as they are downloaded (see --stream)
+stream_pages = False
+
+# threads fetching the remaining pages of listings, see pages_pool
+PAGE_WORKERS = 16
+
+# connections for the default number of threads, for crawl.py used as a
+# library (the benchmarks do). main replaces it with a client sized for
+# the number of threads it starts, with the backend picked (see --http)
+s = http_client.HttpClient(40 + PAGE_WORKERS)
+# what pages are fetched with: s, behind a rate limiter once main sets it up
+client = s
+
+def fetch(path):
+    """ The page at path, through the response cache if there is one. """
+    log.debug("fetching %s", path)
+    start = time.perf_counter()
+    if response_cache is None:
+        page = http_cache.Page(BASE_URL + path,
+                               client.get(BASE_URL + path).text, True)
+    else:
+        page = http_cache.get(client, BASE_URL + path, response_cache)
+    seconds = time.perf_counter() - start
+    fetch_stats.record(seconds, len(page.text))
+    fetch_seconds.observe(seconds)
+    return page
 
-movie_facade = MovieFacade()
 
-s = session()
 def get_page(path):
-    print(":: ", path)
-    base_url = "https://letterboxd.com/"
-    return s.get(base_url + path).text
+    return fetch(path).text
+
+
+def parse_seconds(fn):
+    """ Histogram of the time spent parsing pages with fn. """
+    return metrics.REGISTRY.histogram(
+        "lmatch_parse_seconds",
+        "Time to parse a page, waiting for the parse pool included",
+        parser=fn.__module__ + "." + fn.__name__)
+
+
+def parse_page(fn, page_text):
+    """ Run a parse function, in the parse pool if there is one. """
+    with parse_seconds(fn).time():
+        if parse_pool is None:
+            return fn(page_text)
+        return parse_pool.call(fn, page_text)
+
 
+def parse_listing(parser, page_text):
+    """ (entries, next page, last page), see pipeline.parse_listing. """
+    with parse_seconds(parser).time():
+        if parse_pool is None:
+            return pipeline.parse_listing(parser, page_text)
+        return parse_pool.listing(parser, page_text)
+
+
+def fetch_listing(parser, path):
+    """
+    (entries, next page, last page) of the page at path. If the response
+    cache has the page and the server says it didn't change, so does
+    what was parsed out of it. With stream_pages, the page is parsed
+    while it is downloaded.
+    """
+    if stream_pages:
+        return stream_listing(parser, path)
+    if response_cache is None:
+        return parse_listing(parser, get_page(path))
+
+    page = fetch(path)
+    key = parser.__module__ + "." + parser.__name__
+    if not page.modified:
+        listing = response_cache.parsed(page.url, key)
+        if listing is not None:
+            return tuple(listing)
+
+    listing = parse_listing(parser, page.text)
+    response_cache.store_parsed(page.url, key, listing)
+    return listing
+
+
+def stream_listing(parser, path):
+    """
+    fetch_listing, with the page parsed a chunk at a time as it is
+    downloaded (see lmatch.parse_stream) rather than read whole first.
+    """
+    log.debug("streaming %s", path)
+    listing = parse_stream.for_parser(parser)
+    entries = []
+    parsing = 0.0
+    start = time.perf_counter()
+    response = client.get(BASE_URL + path, stream=True)
+    try:
+        for chunk in s.iter_text(response):
+            parse_start = time.perf_counter()
+            entries.extend(listing.feed(chunk))
+            parsing += time.perf_counter() - parse_start
+        entries.extend(listing.close())
+    finally:
+        response.close()
+
+    seconds = time.perf_counter() - start - parsing
+    fetch_stats.record(seconds, listing.chars)
+    fetch_seconds.observe(seconds)
+    parse_seconds(parser).observe(parsing)
+    return (entries, listing.next_page, listing.last_page)
+
+
+# pool used to fetch the remaining pages of a listing once the first page
+# tells us how many there are. It is shared by all threads, to put a bound
+# on the number of requests in flight.
+pages_pool = ThreadPoolExecutor(max_workers=PAGE_WORKERS)
 
 def crawl(profiles, profile, first_page, parser):
-    result = []
-    page_next = first_page
+    if profiles.keep_parsing is False:
+        return None
+
+    try:
+        (result, page_next, last_page) = fetch_listing(parser, first_page)
+    except:
+        return None
+
+    # if we know how many pages there are, fetch them all at once
+    if last_page is not None:
+        paths = [parse.page_path(first_page, n)
+                 for n in range(2, last_page + 1)]
+        try:
+            # map() gives back the pages in order
+            for entries in pages_pool.map(
+                    lambda path: fetch_listing(parser, path)[0],
+                    paths):
+                result.extend(entries)
+        except:
+            return None
+
+        return result if profiles.keep_parsing else None
+
+    # otherwise, follow the "next" links one at a time
     while page_next is not None:
         if profiles.keep_parsing is False:
             return None
 
         try:
-            page_text = get_page(page_next)
+            (entries, page_next, _) = fetch_listing(parser, page_next)
         except:
             return None
-
-        result.extend(parser(page_text))
-        page_next = parse.next_page(page_text)
+        result.extend(entries)
 
     return result
 
+def film_ids(movies):
+    """ film id -> rating, in the order of the (url, rating) pairs. """
+    movie_facade.preload([url for (url, _) in movies])
+
+    movie_id_to_rating = {}
+    for (url, rating) in movies:
+        try:
+            this_id = movie_facade.getId(url)
+            movie_id_to_rating[this_id] = rating
+        except:
+            log.warning("Failed to get: %s.", url)
+    return movie_id_to_rating
+
+
+def crawl_recent(profiles, profile):
+    """
+    Films of a parsed profile added or re-rated since it was crawled, as
+    (film id -> rating, id of the newest film). Walks its films by date,
+    newest first, and stops at the first page that has the profile's
+    high-water mark or only films it already had, with the same ratings.
+    """
+    path = profile.username + "/films/by/date/page/1"
+    delta = {}
+    newest = None
+    while path is not None:
+        if profiles.keep_parsing is False:
+            return None
+
+        try:
+            (entries, path, _) = fetch_listing(parse.movies_watched, path)
+        except:
+            return None
+
+        ratings = film_ids(entries)
+        if newest is None and ratings:
+            newest = next(iter(ratings))
+
+        caught_up = True
+        for (film_id, rating) in ratings.items():
+            if film_id == profile.newest:
+                return (delta, newest)
+            if profile.movies.get(film_id) != rating:
+                delta[film_id] = rating
+                caught_up = False
+        if caught_up:
+            break
+
+    return (delta, newest if newest is not None else profile.newest)
+
+
 def crawl_profile(profiles, source_profile):
     following = crawl(profiles, source_profile.username,
                       source_profile.username + "/following/page/1",
                       parse.following)
 
+    if source_profile.movies is not None:
+        # parsed before, queued again by ProfileCrawler.refresh
+        recent = crawl_recent(profiles, source_profile)
+        if following and recent is not None:
+            profiles.on_refreshed(source_profile, following, *recent)
+        else:
+            profiles.abandon(source_profile)
+        return
+
     movies = crawl(profiles, source_profile.username,
                    source_profile.username + "/films/page/1",
                    parse.movies_watched)
 
     if following and movies:
+        profiles.on_parsed(source_profile.username, source_profile.depth,
+                following, film_ids(movies))
+    else:
+        profiles.abandon(source_profile)
 
-        movie_id_to_rating = {}
-        for (url, rating) in movies:
-            try:
-                this_id = movie_facade.getId(url)
-                movie_id_to_rating[this_id] = rating
-            except:
-                print("Failed to get: {}.".format(movie_url))
 
-        profiles.on_parsed(source_profile.username, source_profile.depth,
-                following, movie_id_to_rating)
+def crawling_elsewhere(profiles):
+    """ Whether a process sharing the frontier profiles is on a job. """
+    return not isinstance(profiles, profile_crawler.ProfileCrawler) \
+        and profiles.counts()[1] > 0
+
+
+class Workers:
+    """
+    Count of the threads crawling a profile. When the queue has no job up
+    to the depth limit and none of them is busy, no new jobs can show up
+    and the crawl is over. With a shared frontier, only once nobody else
+    is busy either.
+    """
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        self.busy_ = 0
+
+    def next_job(self, profiles, max_depth=None):
+        """ A job, None if there is none now, False if there never will. """
+        with self.lock_:
+            profile = profiles.next_job(max_depth)
+            if profile is None:
+                if self.busy_ or crawling_elsewhere(profiles):
+                    return None
+                return False
+            self.busy_ += 1
+            return profile
+
+    def done(self):
+        with self.lock_:
+            self.busy_ -= 1
+
 
 class LbThread (threading.Thread):
-    def __init__(self, profiles, thread_id, max_depth = None):
+    def __init__(self, profiles, thread_id, max_depth = None, workers = None):
         threading.Thread.__init__(self)
         self.profiles = profiles
         self.thread_id = thread_id
         self.max_depth = max_depth
+        self.workers = workers if workers is not None else Workers()
 
     def run(self):
         while self.profiles.keep_parsing is True:
-            profile = self.profiles.next_job()
-            if profile is None:
-                time.sleep(.5)
-            elif profile.depth > self.max_depth:
+            profile = self.workers.next_job(self.profiles, self.max_depth)
+            if profile is False:
                 return
-            else:
-                crawl_profile(self.profiles, profile)
-
-
-def main(argv=None):
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "first_profile",
-        metavar="LETTERBOXD_PROFILE",
-        help="username of the profile to use as the top of the crawl tree",
-    )
-    args = parser.parse_args(argv)
-
-    crawler = profile_crawler.ProfileCrawler()
-
-    dump_filename = 'dump.lmatch'
-    try:
-        with open(dump_filename, 'r') as infile:
-            crawler.loads(infile.read())
-            infile.close()
-    except FileNotFoundError:
-        crawler.enqueue(args.first_profile)
+            elif profile is None:
+                time.sleep(.5)
+                continue
 
+            try:
+                crawl_profile(self.profiles, profile)
+            finally:
+                self.workers.done()
+
+
+def register_gauges(crawler):
+    """ Queue sizes and HTTP client state, read when metrics are. """
+    registry = metrics.REGISTRY
+    for (i, state) in enumerate(("parsed", "ongoing", "queued")):
+        registry.gauge("lmatch_profiles", "Profiles, by state",
+                       lambda i=i: crawler.counts()[i], state=state)
+    registry.gauge("lmatch_fetch_pages_per_second",
+                   "Pages fetched per second since the crawl started",
+                   fetch_stats.rate)
+    registry.gauge("lmatch_http_connection_reuse_ratio",
+                   "Share of the requests that reused a connection",
+                   s.stats.reuse_rate)
+    registry.gauge("lmatch_http_connection_wait_seconds",
+                   "Time spent waiting for a free connection, in total",
+                   lambda: s.stats.wait_time)
+    if client is not s:
+        registry.gauge("lmatch_throttle_rate",
+                       "Requests per second the rate limiter allows",
+                       lambda: client.limiter.rate)
+    if parse_pool is not None:
+        registry.gauge("lmatch_parse_pool_queued",
+                       "Pages waiting for or being parsed in the pool",
+                       lambda: parse_pool.queued)
+
+
+def log_status(crawler):
+    log.info("%d parsed. %d ongoing. %d queued.", *crawler.counts())
+    log.info("%s. latency: p50 %.0f ms, p99 %.0f ms", fetch_stats,
+             1000 * fetch_seconds.quantile(.5),
+             1000 * fetch_seconds.quantile(.99))
+    log.info("HTTP: %s", s)
+    if response_cache is not None:
+        log.info("Page cache: %s", response_cache)
+    if client is not s:
+        log.info("Throttle: %s", client)
+    if parse_pool is not None:
+        log.info("%s", parse_pool)
+
+
+def run_threads(crawler, workers, max_depth):
     threads = []
-    for i in range(40):
-        thread = LbThread(crawler, i + 1, 3)
+    busy = Workers()
+    for i in range(workers):
+        thread = LbThread(crawler, i + 1, max_depth, busy)
         thread.start()
         threads.append(thread)
 
     try:
         while True:
-            print("{} parsed. {} ongoing. {} queued.".format(len(crawler.parsed_),
-                                                             len(crawler.ongoing_),
-                                                             len(crawler.queued_)))
+            log_status(crawler)
             time.sleep(10)
 
             # all threads stopped
             if not any([t.is_alive() for t in threads]):
-                print("Ended successfully.")
+                log.info("Ended successfully.")
                 break
     except KeyboardInterrupt:
         crawler.stop_parsing()
 
-    print("Waiting for ongoing threads")
+    log.info("Waiting for ongoing threads")
     for t in threads:
        t.join()
 
-    print("Moving ongoing jobs back to queued")
-    crawler.cancel_ongoing_jobs()
 
-    print("Saving state to persistence layer")
-    with open(dump_filename, 'w') as outfile:
-        json.dump(crawler.dump(), outfile)
+async def crawl_async(crawler, workers, max_depth):
+    limits = httpx.Limits(max_connections=workers,
+                          max_keepalive_connections=workers)
+    async with httpx.AsyncClient(http2=True, limits=limits,
+                                 timeout=30) as http:
+        if client is not s:
+            # same limiter and retries as the threads engine
+            http = throttle.ThrottledSession(
+                http, client.limiter, client.retries,
+                errors=(httpx.HTTPError,))
+
+            async def get(url):
+                return await http.get_async(url)
+        else:
+            get = http.get
+
+        async def fetch(path):
+            log.debug("fetching %s", path)
+            start = time.perf_counter()
+            text = (await get(BASE_URL + path)).text
+            seconds = time.perf_counter() - start
+            fetch_stats.record(seconds, len(text))
+            fetch_seconds.observe(seconds)
+            return text
+
+        engine = async_crawler.AsyncCrawler(crawler, fetch, movie_facade,
+                                            workers=workers,
+                                            max_in_flight=workers * 4,
+                                            max_depth=max_depth,
+                                            parser=parse)
+        await engine.run()
+
+
+def run_async(crawler, workers, max_depth):
+    try:
+        asyncio.run(crawl_async(crawler, workers, max_depth))
+        log.info("Ended successfully.")
+    except KeyboardInterrupt:
+        crawler.stop_parsing()
+
+
+def setup_logging(level):
+    """ Log at level, the HTTP libraries only from WARNING below DEBUG. """
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # at INFO, httpx logs every request
+    for name in ("httpx", "httpcore"):
+        logging.getLogger(name).setLevel(
+            logging.NOTSET if level == "DEBUG" else logging.WARNING)
+
+
+def open_frontier(spec):
+    """ Shared frontier from a --frontier argument. """
+    if spec.startswith("redis://"):
+        import redis
+        return frontier.RedisFrontier(redis.Redis.from_url(spec))
+    if spec.startswith("sqlite:"):
+        return frontier.SqliteFrontier(spec[len("sqlite:"):])
+    raise ValueError("unknown frontier: {}".format(spec))
+
+
+def open_crawler(first_profile, journal_filename, dump_filename, priority):
+    """ Crawler kept in this process, recovered from its journal. """
+    resume = os.path.exists(journal_filename)
+    crawler = profile_crawler.ProfileCrawler(
+        journal.Journal(journal_filename), priority)
+
+    if resume:
+        log.info("Recovering state from journal")
+        crawler.replay(journal.read(journal_filename))
+    elif os.path.exists(dump_filename):
+        # state saved by previous versions, moved into the journal below
+        with open(dump_filename, 'r') as infile:
+            crawler.loads(infile.read())
+            infile.close()
+    else:
+        crawler.enqueue(first_profile)
+
+    crawler.compact_journal()
+    return crawler
+
+
+def load_film_stats(crawler, stats_dao):
+    """
+    The film stats saved in the DB, to be kept up to date from there on.
+    If they don't count as many ratings as the profiles parsed have (the
+    first time, or after a crawl that stopped before saving them), they
+    are computed again out of every profile.
+    """
+    start = time.time()
+    stats = stats_dao.fetchAllStats()
+    profiles = list(crawler.parsed_profiles())
+    if stats.count() != sum(len(p.movies) for p in profiles):
+        log.info("Film stats out of date, computing them again")
+        stats = film_stats.FilmStats.from_ratings(p.movies for p in profiles)
+    log.info("%s in %.1fs", stats, time.time() - start)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "first_profile",
+        metavar="LETTERBOXD_PROFILE",
+        help="username of the profile to use as the top of the crawl tree",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["threads", "async"],
+        default="threads",
+        help="crawl with a pool of threads or with the asyncio engine",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="number of workers (default: 40 threads / 500 async tasks)",
+    )
+    parser.add_argument(
+        "--film-cache",
+        type=int,
+        default=None,
+        metavar="SIZE",
+        help="load films from the DB on demand, caching at most SIZE of them "
+             "(default: load every film at startup)",
+    )
+    parser.add_argument(
+        "--db-batch",
+        type=int,
+        default=None,
+        metavar="SIZE",
+        help="buffer new films and write them to the DB in batches of SIZE "
+             "(default: write each film as soon as it is found)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=list(PARSERS),
+        default="find",
+        help="page parsing backend (default: find)",
+    )
+    parser.add_argument(
+        "--parse-processes",
+        type=int,
+        default=0,
+        metavar="N",
+        help="parse pages in a pool of N processes (threads engine only, "
+             "default: parse them in the thread that fetched them)",
+    )
+    parser.add_argument(
+        "--priority",
+        choices=list(job_queue.PRIORITIES),
+        default="depth",
+        help="order in which queued profiles are crawled: shallowest or most "
+             "followed first (default: depth)",
+    )
+    parser.add_argument(
+        "--frontier",
+        default=None,
+        metavar="URL",
+        help="share the queue of profiles with other crawlers, in a SQLite "
+             "database (sqlite:PATH) or a Redis server (redis://HOST:PORT/DB) "
+             "(default: keep it in this process, in crawl.journal)",
+    )
+    parser.add_argument(
+        "--http-cache",
+        default=None,
+        metavar="PATH",
+        help="keep the pages in a cache file at PATH and, when crawling "
+             "again, only download and parse the ones that changed "
+             "(threads engine only)",
+    )
+    parser.add_argument(
+        "--http-cache-size",
+        type=int,
+        default=1024,
+        metavar="MIB",
+        help="evict the least recently used pages from the cache past MIB "
+             "megabytes (default: 1024)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="crawl the profiles parsed before again, only as far back as "
+             "the films they had then",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=20,
+        help="requests per second to start at. Halved whenever the website "
+             "pushes back, raised slowly otherwise (default: 20)",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=100,
+        help="requests per second never to go over (default: 100)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=5,
+        help="times to retry a page that failed or was throttled "
+             "(default: 5)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="parse the following and films pages as they are downloaded, "
+             "without holding them whole (threads engine only)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="DEBUG logs every page and profile (default: INFO)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        metavar="PORT",
+        help="serve metrics on localhost:PORT, at /metrics (Prometheus text "
+             "format) and /metrics.json",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        metavar="PATH",
+        help="write a JSON snapshot of the metrics to PATH every 10 seconds",
+    )
+    parser.add_argument(
+        "--film-stats",
+        action="store_true",
+        help="keep the statistics of every film over the profiles crawled "
+             "up to date, and save the ones that changed next to the films "
+             "in the DB at every checkpoint",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=300,
+        metavar="SECONDS",
+        help="checkpoint the journal in the background every SECONDS, "
+             "and whenever it is due (default: 300)",
+    )
+    parser.add_argument(
+        "--ratings-interval",
+        type=float,
+        default=3600,
+        metavar="SECONDS",
+        help="rebuild crawl.ratings, for serve.py, at the first checkpoint "
+             "every SECONDS (default: 3600), and at exit. It is built out "
+             "of every profile parsed so far: that takes time in proportion "
+             "to them",
+    )
+    parser.add_argument(
+        "--http",
+        choices=list(http_client.BACKENDS),
+        default="requests",
+        help="HTTP client of the threads engine (default: requests)",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="fetch pages over HTTP/2 (--http httpx only)",
+    )
+    parser.add_argument(
+        "--no-compression",
+        action="store_true",
+        help="don't ask for compressed pages",
+    )
+    args = parser.parse_args(argv)
+    setup_logging(args.log_level)
+    if args.refresh and args.frontier is not None:
+        parser.error("--refresh can't be used with --frontier")
+    if args.film_stats and args.frontier is not None:
+        parser.error("--film-stats can't be used with --frontier")
+    if args.priority != "depth" and args.frontier is not None:
+        parser.error("--priority {} can't be used with --frontier, which "
+                     "hands out the shallowest profiles first"
+                     .format(args.priority))
+    if args.engine == "async":
+        for (option, value) in (("--http-cache", args.http_cache),
+                                ("--parse-processes", args.parse_processes),
+                                ("--stream", args.stream)):
+            if value:
+                parser.error("{} can't be used with --engine async"
+                             .format(option))
+    if args.http2 and args.http != "httpx":
+        parser.error("--http2 needs --http httpx")
+    if args.stream and (args.http_cache is not None or args.parse_processes):
+        parser.error("--stream can't be used with --http-cache or "
+                     "--parse-processes")
+    workers = args.workers or (500 if args.engine == "async" else 40)
+
+    global parse
+    parse = PARSERS[args.parser]
+
+    global stream_pages
+    stream_pages = args.stream
+
+    global parse_pool
+    if args.parse_processes:
+        parse_pool = pipeline.ParsePool(args.parse_processes)
+
+    # one connection for every thread that can be fetching a page, in
+    # place of the default client, closed with its connection pool
+    global s, client
+    s.close()
+    s = http_client.HttpClient(workers + PAGE_WORKERS, backend=args.http,
+                               http2=args.http2,
+                               compress=not args.no_compression)
+    client = throttle.ThrottledSession(
+        s, throttle.RateLimiter(args.rate, max_rate=args.max_rate),
+        retries=args.retries, errors=s.errors)
+
+    global response_cache
+    if args.http_cache is not None:
+        response_cache = http_cache.ResponseCache(
+            args.http_cache, max_bytes=args.http_cache_size * 2**20)
+
+    global movie_facade
+    movie_facade = MovieFacade(dao.MovieDao(batch_size=args.db_batch),
+                               cache_size=args.film_cache)
+
+    journal_filename = 'crawl.journal'
+    ratings_filename = 'crawl.ratings'
+    dump_filename = 'dump.lmatch'
 
+    if args.frontier is not None:
+        crawler = open_frontier(args.frontier)
+        # a no-op if someone else already started the crawl
+        crawler.enqueue(args.first_profile)
+    else:
+        crawler = open_crawler(args.first_profile, journal_filename,
+                               dump_filename,
+                               job_queue.PRIORITIES[args.priority])
+        if args.refresh:
+            log.info("%d profiles to refresh", crawler.refresh())
+        if args.film_stats:
+            stats_dao = dao.FilmStatsDao()
+            crawler.film_stats_ = load_film_stats(crawler, stats_dao)
+        checkpointer = checkpoint.Checkpointer(
+            crawler, interval=args.checkpoint_interval,
+            ratings_path=ratings_filename,
+            ratings_interval=args.ratings_interval,
+            film_stats_dao=stats_dao if args.film_stats else None)
+
+    register_gauges(crawler)
+    metrics_server = None
+    if args.metrics_port is not None:
+        metrics_server = metrics.MetricsServer(port=args.metrics_port)
+        log.info("Metrics at %s", metrics_server.start())
+    snapshots = None
+    if args.metrics_file is not None:
+        snapshots = metrics.SnapshotWriter(args.metrics_file)
+
+    if args.engine == "async":
+        run_async(crawler, workers, 3)
+    else:
+        run_threads(crawler, workers, 3)
+        log.info("HTTP: %s", s)
+    s.close()
+
+    log.info("Moving ongoing jobs back to queued")
+    crawler.cancel_ongoing_jobs()
 
-    print ("Exiting Main Thread")
+    log.info("Saving state to persistence layer")
+    if args.frontier is not None:
+        crawler.close()
+    else:
+        checkpointer.close()
+        log.info("Checkpoints: %s", checkpointer)
+        crawler.compact_journal()
+        crawler.journal_.close()
+    ratings.RatingsMatrix.from_profiles(
+        (p.username, p.movies) for p in crawler.parsed_profiles()
+    ).save(ratings_filename)
+
+    if parse_pool is not None:
+        parse_pool.close()
+
+    if response_cache is not None:
+        log.info("Page cache: %s", response_cache)
+        response_cache.close()
+
+    log.info("Writing buffered films to the DB")
+    movie_facade.db_.close()
+    if args.db_batch is not None:
+        log.info("Film writes: %s", movie_facade.db_.flushStats())
+    if args.film_stats:
+        log.info("%d film stats written to the DB",
+                 stats_dao.updateStats(crawler.film_stats_))
+
+    if movie_facade.lazy_:
+        log.info("Film cache: %s", movie_facade.hash_table_)
+
+    if metrics_server is not None:
+        metrics_server.stop()
+    if snapshots is not None:
+        snapshots.close()
+
+    log.info("Exiting Main Thread")
 
 
 if __name__ == "__main__":
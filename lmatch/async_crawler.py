@@ -0,0 +1,269 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+from lmatch import parse
+from lmatch.profile_crawler import Profile, ProfileCrawler
+
+log = logging.getLogger(__name__)
+
+
+class AsyncCrawler:
+    """
+    asyncio based engine that drives a ProfileCrawler. It is the async
+    counterpart of the LbThread workers in crawl.py: same queued / ongoing /
+    parsed life cycle, same depth limit (jobs past it are left queued), same
+    stop_parsing() handling, same incremental crawl of the profiles queued
+    again by ProfileCrawler.refresh().
+
+    Instead of threads polling the crawler, idle workers sleep on a
+    condition that is notified whenever a profile finishes (which is the
+    only moment new jobs can show up). Given a shared frontier (see
+    lmatch.frontier) instead, where other processes queue jobs too, they
+    also look again every `poll` seconds, and only stop once no process
+    is on a job anymore.
+
+    The engine doesn't know about HTTP. It is given:
+        - fetch: coroutine that takes a relative path and returns the page.
+        - parser: the module with the page parsing functions, lmatch.parse
+          or lmatch.parse_regex.
+        - films: the object used to translate film urls into ids (see
+          MovieFacade in crawl.py). lookup(url) -> id / None must be
+          cheap, it is called on the event loop. The potentially blocking
+          ones are run in the default executor: preload(urls),
+          load(url) -> id / None and store(url, film) -> id.
+    """
+
+    def __init__(self,
+                 profiles: ProfileCrawler,
+                 fetch: Callable[[str], Awaitable[str]],
+                 films,
+                 workers: int = 200,
+                 max_in_flight: int = 1000,
+                 max_depth: int = None,
+                 parser=parse,
+                 poll: float = .5):
+        self.profiles = profiles
+        self.parse_ = parser
+        self.fetch_ = fetch
+        self.films_ = films
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.max_depth = max_depth
+        self.poll = poll
+        self.shared_ = not isinstance(profiles, ProfileCrawler)
+
+        self.busy_ = 0
+        self.wakeup_ = None
+        self.in_flight_ = None
+        self.films_in_flight_: Dict[str, asyncio.Future] = {}
+
+    async def get_page(self, path: str) -> str:
+        async with self.in_flight_:
+            return await self.fetch_(path)
+
+    async def crawl(self, first_page: str, parser) -> Union[None, List]:
+        if self.profiles.keep_parsing is False:
+            return None
+
+        try:
+            page_text = await self.get_page(first_page)
+        except Exception:
+            return None
+
+        result = parser(page_text)
+
+        # if we know how many pages there are, fetch them all at once
+        last_page = self.parse_.last_page(page_text)
+        if last_page is not None:
+            paths = [self.parse_.page_path(first_page, n)
+                     for n in range(2, last_page + 1)]
+            try:
+                # gather() gives back the pages in order
+                pages = await asyncio.gather(
+                    *[self.get_page(path) for path in paths])
+            except Exception:
+                return None
+
+            for page_text in pages:
+                result.extend(parser(page_text))
+
+            return result if self.profiles.keep_parsing else None
+
+        # otherwise, follow the "next" links one at a time
+        page_next = self.parse_.next_page(page_text)
+        while page_next is not None:
+            if self.profiles.keep_parsing is False:
+                return None
+
+            try:
+                page_text = await self.get_page(page_next)
+            except Exception:
+                return None
+
+            result.extend(parser(page_text))
+            page_next = self.parse_.next_page(page_text)
+
+        return result
+
+    async def get_film_id(self, movie_url: str) -> int:
+        """
+        Resolve a film url into its id. Concurrent calls for the same
+        url share a single fetch of the film page.
+        """
+        film_id = self.films_.lookup(movie_url)
+        if film_id is not None:
+            return film_id
+
+        pending = self.films_in_flight_.get(movie_url)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        pending = loop.create_future()
+        self.films_in_flight_[movie_url] = pending
+        try:
+            # both of these may hit the database, keep it off the event loop
+            film_id = await loop.run_in_executor(None, self.films_.load,
+                                                 movie_url)
+            if film_id is None:
+                page = await self.get_page('/film/' + movie_url)
+                film = self.parse_.parse_film(page)
+                film_id = await loop.run_in_executor(
+                    None, self.films_.store, movie_url, film)
+            pending.set_result(film_id)
+            return film_id
+        except BaseException as e:
+            pending.set_exception(e)
+            # nobody else may be waiting, mark the exception as retrieved
+            pending.exception()
+            raise
+        finally:
+            del self.films_in_flight_[movie_url]
+
+    async def film_ids(self, movies: List) -> Dict[int, float]:
+        """ film id -> rating, in the order of the (url, rating) pairs. """
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.films_.preload, [url for (url, _) in movies])
+
+        ids = await asyncio.gather(
+            *[self.get_film_id(url) for (url, _) in movies],
+            return_exceptions=True)
+
+        movie_id_to_rating = {}
+        for ((url, rating), this_id) in zip(movies, ids):
+            if isinstance(this_id, BaseException):
+                log.warning("Failed to get: %s.", url)
+                continue
+            movie_id_to_rating[this_id] = rating
+        return movie_id_to_rating
+
+    async def crawl_recent(self, profile: Profile) -> Union[None, Tuple]:
+        """
+        Films of a parsed profile added or re-rated since it was crawled,
+        as (film id -> rating, id of the newest film), see crawl_recent in
+        crawl.py: its films by date, newest first, up to the first page
+        that has its high-water mark or nothing new.
+        """
+        path = profile.username + "/films/by/date/page/1"
+        delta = {}
+        newest = None
+        while path is not None:
+            if self.profiles.keep_parsing is False:
+                return None
+
+            try:
+                page_text = await self.get_page(path)
+            except Exception:
+                return None
+
+            ratings = await self.film_ids(
+                self.parse_.movies_watched(page_text))
+            if newest is None and ratings:
+                newest = next(iter(ratings))
+
+            caught_up = True
+            for (film_id, rating) in ratings.items():
+                if film_id == profile.newest:
+                    return (delta, newest)
+                if profile.movies.get(film_id) != rating:
+                    delta[film_id] = rating
+                    caught_up = False
+            if caught_up:
+                break
+            path = self.parse_.next_page(page_text)
+
+        return (delta, newest if newest is not None else profile.newest)
+
+    async def crawl_profile(self, source_profile: Profile) -> None:
+        following_page = source_profile.username + "/following/page/1"
+
+        if source_profile.movies is not None:
+            # parsed before, queued again by ProfileCrawler.refresh
+            following, recent = await asyncio.gather(
+                self.crawl(following_page, self.parse_.following),
+                self.crawl_recent(source_profile))
+            if following and recent is not None:
+                self.profiles.on_refreshed(source_profile, following, *recent)
+            else:
+                self.profiles.abandon(source_profile)
+            return
+
+        following, movies = await asyncio.gather(
+            self.crawl(following_page, self.parse_.following),
+            self.crawl(source_profile.username + "/films/page/1",
+                       self.parse_.movies_watched))
+
+        if following and movies:
+            self.profiles.on_parsed(source_profile.username,
+                                    source_profile.depth,
+                                    following, await self.film_ids(movies))
+        else:
+            self.profiles.abandon(source_profile)
+
+    async def next_job(self) -> Union[None, Profile]:
+        """
+        Wait for a job to show up in the crawler. Returns None once there
+        is nothing left to do: either stop_parsing was called, or the queue
+        has no job up to the depth limit and no other worker is busy (so no
+        new jobs can appear).
+        """
+        async with self.wakeup_:
+            while self.profiles.keep_parsing is True:
+                profile = self.profiles.next_job(self.max_depth)
+                if profile is not None:
+                    self.busy_ += 1
+                    return profile
+
+                if self.busy_ == 0 and not (
+                        self.shared_ and self.profiles.counts()[1]):
+                    self.wakeup_.notify_all()
+                    return None
+
+                if not self.shared_:
+                    await self.wakeup_.wait()
+                    continue
+                try:
+                    await asyncio.wait_for(self.wakeup_.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+
+            return None
+
+    async def worker(self) -> None:
+        while True:
+            profile = await self.next_job()
+            if profile is None:
+                return
+
+            try:
+                await self.crawl_profile(profile)
+            finally:
+                async with self.wakeup_:
+                    self.busy_ -= 1
+                    self.wakeup_.notify_all()
+
+    async def run(self) -> None:
+        """ Crawl until the queue is exhausted or stop_parsing is called. """
+        self.wakeup_ = asyncio.Condition()
+        self.in_flight_ = asyncio.Semaphore(self.max_in_flight)
+        await asyncio.gather(*[self.worker() for _ in range(self.workers)])
@@ -0,0 +1,153 @@
+"""
+Background checkpoints of a ProfileCrawler: its journal is compacted in
+a thread of its own, every `interval` seconds and whenever it is due,
+instead of by whichever worker happened to append the record that made
+it due, with the whole crawl waiting on it.
+
+    checkpointer = Checkpointer(crawler, interval=300)
+    ...
+    checkpointer.close()
+
+Only a copy of the state is taken with the crawler locked (see
+ProfileCrawler.checkpoint); how long that takes is reported as the pause.
+
+Given a ratings_path, the ratings matrix of the profiles parsed so far
+is saved there too, for lmatch.query_service to pick up: by the first
+checkpoint once ratings_interval seconds went by since it last was. The
+matrix is built again from all of them every time, O(ratings), and the
+list of them is copied under the lock, O(profiles parsed), which counts
+in the pause: hence a schedule of its own, less frequent than that of
+the checkpoints, which only cost O(profiles queued or parsed since the
+last one) under the lock.
+
+Given a film_stats_dao (see dao.FilmStatsDao), each checkpoint also
+saves the statistics of the films that changed since the last one, if
+the crawler keeps them (see ProfileCrawler.film_stats_). Only their
+histograms are copied under the lock.
+"""
+import time
+import logging
+import threading
+from lmatch import metrics, ratings
+from lmatch.profile_crawler import Checkpoint, ProfileCrawler
+
+log = logging.getLogger(__name__)
+
+
+class Checkpointer:
+    """
+    Thread checkpointing a crawler that has a journal. While it runs it
+    is the crawler's checkpointer_, which on_parsed wakes up when the
+    journal is due for a compaction.
+
+    Each checkpoint is logged and observed in the registry:
+        lmatch_checkpoint_seconds         how long it took
+        lmatch_checkpoint_pause_seconds   how long the crawler was locked
+        lmatch_checkpoint_bytes           size of the last one
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, crawler: ProfileCrawler, interval: float = 300,
+                 registry: metrics.Registry = None, ratings_path: str = None,
+                 ratings_interval: float = 3600, film_stats_dao=None):
+        registry = registry if registry is not None else metrics.REGISTRY
+        self.crawler_ = crawler
+        self.interval = interval
+        self.ratings_path = ratings_path
+        self.ratings_interval = ratings_interval
+        self.ratings_saved_ = time.monotonic()
+        self.film_stats_dao = film_stats_dao
+        self.checkpoints = 0
+        self.last: Checkpoint = None
+        self.seconds_ = registry.histogram(
+            "lmatch_checkpoint_seconds", "Time taken by checkpoints")
+        self.pause_ = registry.histogram(
+            "lmatch_checkpoint_pause_seconds",
+            "Time the crawler was locked for by checkpoints",
+            buckets=metrics.LOCK_BUCKETS)
+        registry.gauge("lmatch_checkpoint_bytes",
+                       "Size of the journal after the last checkpoint",
+                       lambda: self.last.size if self.last else 0)
+        self.woken_ = threading.Event()
+        self.stopped_ = False
+        self.thread_ = threading.Thread(target=self._run, daemon=True)
+        crawler.checkpointer_ = self
+        self.thread_.start()
+
+    def wake(self) -> None:
+        """ Checkpoint now rather than at the end of the interval. """
+        self.woken_.set()
+
+    def _run(self) -> None:
+        while True:
+            self.woken_.wait(self.interval)
+            self.woken_.clear()
+            if self.stopped_:
+                return
+            try:
+                self.checkpoint()
+            except Exception:
+                log.exception("Checkpoint failed")
+
+    def checkpoint(self) -> Checkpoint:
+        """ Take a checkpoint in this thread, see ProfileCrawler. """
+        checkpoint = self.crawler_.checkpoint()
+        if self.film_stats_dao is not None \
+                and self.crawler_.film_stats_ is not None:
+            checkpoint = self._save_film_stats(checkpoint)
+        if self.ratings_path is not None and time.monotonic() \
+                >= self.ratings_saved_ + self.ratings_interval:
+            checkpoint = self._save_ratings(checkpoint)
+        self.seconds_.observe(checkpoint.seconds)
+        self.pause_.observe(checkpoint.pause)
+        self.last = checkpoint
+        self.checkpoints += 1
+        log.info("Checkpoint of %.1f MiB in %.2fs, crawler paused %.1fms",
+                 checkpoint.size / 2**20, checkpoint.seconds,
+                 checkpoint.pause * 1000)
+        return checkpoint
+
+    def _save_ratings(self, checkpoint: Checkpoint) -> Checkpoint:
+        start = time.perf_counter()
+        # copied under the crawler's lock
+        profiles = self.crawler_.parsed_profiles()
+        pause = time.perf_counter() - start
+        ratings.RatingsMatrix.from_profiles(
+            (p.username, p.movies) for p in profiles
+        ).save(self.ratings_path)
+        self.ratings_saved_ = time.monotonic()
+        log.info("Ratings saved to %s in %.2fs", self.ratings_path,
+                 time.perf_counter() - start)
+        return checkpoint._replace(
+            pause=checkpoint.pause + pause,
+            seconds=checkpoint.seconds + time.perf_counter() - start)
+
+    def _save_film_stats(self, checkpoint: Checkpoint) -> Checkpoint:
+        stats = self.crawler_.film_stats_
+        start = time.perf_counter()
+        with self.crawler_.lock_:
+            (dirty, histograms) = stats.take_dirty()
+        pause = time.perf_counter() - start
+        try:
+            self.film_stats_dao.writeStats(dirty, histograms)
+        except BaseException:
+            # written again next time
+            with self.crawler_.lock_:
+                stats.dirty_.update(dirty)
+            raise
+        log.debug("%d film stats written", len(dirty))
+        return checkpoint._replace(
+            pause=checkpoint.pause + pause,
+            seconds=checkpoint.seconds + time.perf_counter() - start)
+
+    def close(self) -> None:
+        """ Stop the thread, after the checkpoint in progress if any. """
+        self.stopped_ = True
+        self.woken_.set()
+        self.thread_.join()
+        self.crawler_.checkpointer_ = None
+
+    def __repr__(self):
+        return "Checkpointer({} checkpoints, last {})".format(
+            self.checkpoints, self.last)
@@ -1,23 +1,229 @@
+import time
+import logging
+import threading
 import pymongo
-from pymongo import MongoClient
+from pymongo import DeleteOne, MongoClient, UpdateOne
+from typing import Dict, List, Union
 from lmatch import film
+from lmatch.film_stats import FilmAggregate, FilmStats, aggregate
+
+log = logging.getLogger(__name__)
 
 
 class MovieDao:
-    def __init__(self):
-        self.client_ = MongoClient()
+    """
+    Access to the movies collection.
+
+    By default every updateMovie is a round trip to the database. If a
+    batch_size is given, updates are buffered instead and written with a
+    single bulk_write once there are batch_size of them, or every
+    flush_interval seconds, whichever comes first. close() must be called
+    to write whatever is still buffered.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, client=None, batch_size: int = None,
+                 flush_interval: float = 1.0):
+        self.client_ = client if client is not None else MongoClient()
         self.db_ = self.client_.letterboxd
         self.collection_movies_ = self.db_.movies
 
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock_ = threading.Lock()
+        self.flush_lock_ = threading.Lock()
+        self.pending_: Dict[str, film.Film] = {}
+
+        # flush stats
+        self.flushes = 0
+        self.flushed = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+
+        self.closed_ = threading.Event()
+        self.flusher_ = None
+        if batch_size is not None:
+            self.flusher_ = threading.Thread(target=self._flushPeriodically,
+                                             daemon=True)
+            self.flusher_.start()
+
+    @staticmethod
+    def _toFilm(m) -> film.Film:
+        return film.Film(m['_id'], m['url'], m['name'], m['avg_rate'])
+
+    @staticmethod
+    def _toUpdate(film: film.Film) -> UpdateOne:
+        return UpdateOne({'_id': film.id},
+                         {'$set': {'_id': film.id,
+                                   'url': film.url,
+                                   'name': film.name,
+                                   'avg_rate': film.avg_rate}},
+                         upsert=True)
+
+    def ensureIndexes(self):
+        """ Index the movies by url, so they can be looked up by it. """
+        self.collection_movies_.create_index('url')
+
     def updateMovie(self, film: film.Film):
-        self.collection_movies_.update_one({'_id': film.id},
-                                           {'$set': {'_id': film.id,
-                                                     'url': film.url,
-                                                     'name': film.name,
-                                                     'avg_rate': film.avg_rate}},
-                                           upsert=True)
+        if self.batch_size is None:
+            self.collection_movies_.update_one({'_id': film.id},
+                                               {'$set': {'_id': film.id,
+                                                         'url': film.url,
+                                                         'name': film.name,
+                                                         'avg_rate': film.avg_rate}},
+                                               upsert=True)
+            return
+
+        with self.lock_:
+            self.pending_[film.url] = film
+            full = len(self.pending_) >= self.batch_size
+
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """ Write all buffered updates. Returns how many were written. """
+        with self.flush_lock_:
+            with self.lock_:
+                films = list(self.pending_.values())
+                self.pending_ = {}
+
+            if not films:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self.collection_movies_.bulk_write(
+                    [self._toUpdate(f) for f in films], ordered=False)
+            except BaseException:
+                # put them back, unless they've been updated meanwhile
+                with self.lock_:
+                    for f in films:
+                        self.pending_.setdefault(f.url, f)
+                raise
+            elapsed = time.perf_counter() - start
+
+            self.flushes += 1
+            self.flushed += len(films)
+            self.flush_time += elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+            return len(films)
+
+    def _flushPeriodically(self):
+        while not self.closed_.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("Failed to write movies: %s", e)
+
+    def close(self):
+        """ Stop the periodic flushes and write what is left. """
+        self.closed_.set()
+        if self.flusher_ is not None:
+            self.flusher_.join()
+        self.flush()
+
+    def flushStats(self) -> str:
+        return "{} movies written in {} batches. " \
+               "Avg batch: {:.1f}. Avg flush: {:.1f}ms. Max flush: {:.1f}ms." \
+               .format(self.flushed, self.flushes,
+                       self.flushed / max(self.flushes, 1),
+                       1000 * self.flush_time / max(self.flushes, 1),
+                       1000 * self.max_flush_time)
+
+    def findMovie(self, url: str) -> Union[None, film.Film]:
+        with self.lock_:
+            if url in self.pending_:
+                return self.pending_[url]
+
+        m = self.collection_movies_.find_one({'url': url})
+        return self._toFilm(m) if m is not None else None
+
+    def findMovies(self, urls: List[str]) -> List[film.Film]:
+        """ Fetch all the movies in the list of urls, in one query. """
+        with self.lock_:
+            pending = [self.pending_[u] for u in urls if u in self.pending_]
+
+        cursor = self.collection_movies_.find({'url': {'$in': list(urls)}})
+        found = {m['_id']: self._toFilm(m) for m in cursor}
+        found.update({f.id: f for f in pending})
+        return list(found.values())
 
     def fetchAllMovies(self, callback):
         for m in self.collection_movies_.find():
-            f = film.Film(m['_id'], m['url'], m['name'], m['avg_rate'])
-            callback(f)
+            callback(self._toFilm(m))
+
+
+class FilmStatsDao:
+    """
+    Access to the film_stats collection, next to the movies one: the
+    statistics of each film over the profiles crawled (see
+    lmatch.film_stats), one document per film, by film id.
+
+    This class is thread-safe, as long as the FilmStats given to
+    updateStats isn't modified while it is being saved. One that is
+    (see checkpoint.Checkpointer) can be saved with writeStats, from a
+    copy of its dirty films taken with FilmStats.take_dirty.
+    """
+
+    def __init__(self, client=None, batch_size: int = 1000):
+        self.client_ = client if client is not None else MongoClient()
+        self.db_ = self.client_.letterboxd
+        self.collection_stats_ = self.db_.film_stats
+        self.batch_size = batch_size
+
+    @staticmethod
+    def _toAggregate(s) -> FilmAggregate:
+        return FilmAggregate(s['watched'], s['rated'], s['mean'],
+                             s['variance'], s['histogram'])
+
+    def updateStats(self, stats: FilmStats) -> int:
+        """
+        Write the statistics of the films that changed since the last
+        time (the dirty ones), in batches. Films no one watched anymore
+        are deleted. Returns how many films were written.
+        """
+        (dirty, histograms) = stats.take_dirty()
+        try:
+            return self.writeStats(dirty, histograms)
+        except BaseException:
+            # written again next time, whatever made it this time
+            stats.dirty_.update(dirty)
+            raise
+
+    def writeStats(self, film_ids: List[int], histograms) -> int:
+        """
+        Write the statistics of films given their histograms (see
+        FilmStats.take_dirty), in batches. Films no one watched are
+        deleted. Returns how many films were written.
+        """
+        for start in range(0, len(film_ids), self.batch_size):
+            updates = []
+            end = start + self.batch_size
+            for (film_id, histogram) in zip(film_ids[start:end],
+                                            histograms[start:end]):
+                a = aggregate(histogram.tolist())
+                if a is None:
+                    updates.append(DeleteOne({'_id': film_id}))
+                    continue
+                updates.append(UpdateOne(
+                    {'_id': film_id},
+                    {'$set': {'watched': a.watched, 'rated': a.rated,
+                              'mean': a.mean, 'variance': a.variance,
+                              'histogram': a.histogram}},
+                    upsert=True))
+            self.collection_stats_.bulk_write(updates, ordered=False)
+        return len(film_ids)
+
+    def findStats(self, film_id: int) -> Union[None, FilmAggregate]:
+        s = self.collection_stats_.find_one({'_id': film_id})
+        return self._toAggregate(s) if s is not None else None
+
+    def fetchAllStats(self) -> FilmStats:
+        """ The statistics saved, as a FilmStats with nothing dirty. """
+        stats = FilmStats()
+        for s in self.collection_stats_.find({}, ['histogram']):
+            stats.reserve(s['_id'] + 1)
+            stats.histograms_[s['_id']] = s['histogram']
+        return stats
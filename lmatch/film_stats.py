@@ -0,0 +1,196 @@
+"""
+Statistics of every film over the profiles crawled, our own take on
+Film.avg_rate: how many watched it, how many rated it, the mean and
+variance of those ratings, and their histogram.
+
+They are all derived from the histogram, the only thing kept: one
+counter per film and rating (0, watched but not rated, to 10). Adding or
+removing the films of a profile is a matter of bumping a counter per
+film, exactly, with no drift, so the statistics can be kept up to date as
+profiles are parsed and parsed again (see ProfileCrawler.film_stats_).
+
+    profiles = crawler.parsed_profiles()
+    stats = FilmStats.from_ratings(p.movies for p in profiles)
+    stats.get(film_id).mean
+"""
+import numpy as np
+from typing import Iterable, List, Mapping, NamedTuple, Set, Tuple, Union
+
+# ratings go from 1 to 10, 0 is for films watched but not rated
+RATINGS = 11
+
+# ratings counted at once by from_ratings
+_BATCH = 1 << 22
+
+
+class FilmAggregate(NamedTuple):
+    """ The statistics of one film. """
+    watched: int
+    # watched and rated
+    rated: int
+    # of the ratings, None if there's none
+    mean: Union[None, float]
+    variance: Union[None, float]
+    # histogram[r]: how many rated it r, 0 for watched but not rated
+    histogram: List[int]
+
+
+def aggregate(histogram: List[int]) -> Union[None, FilmAggregate]:
+    """ The statistics of a film out of its histogram, None if unwatched. """
+    watched = sum(histogram)
+    if watched == 0:
+        return None
+    rated = watched - histogram[0]
+    if rated == 0:
+        return FilmAggregate(watched, 0, None, None, histogram)
+    mean = sum(r * c for (r, c) in enumerate(histogram)) / rated
+    variance = sum(r * r * c for (r, c) in enumerate(histogram)) \
+        / rated - mean * mean
+    return FilmAggregate(watched, rated, mean, max(variance, 0.0), histogram)
+
+
+def _arrays(movies: Mapping):
+    """ (film ids, ratings) of a Ratings or any film id -> rating mapping. """
+    ids = getattr(movies, "ids", None)
+    if ids is not None:
+        return (np.frombuffer(ids, dtype=np.int32),
+                np.frombuffer(movies.rates, dtype=np.int8))
+    return (np.fromiter(movies.keys(), dtype=np.int32, count=len(movies)),
+            np.fromiter(movies.values(), dtype=np.int8, count=len(movies)))
+
+
+class FilmStats:
+    """
+    Histogram of the ratings of every film, as an array of film id x
+    rating counters, grown as bigger film ids come in.
+
+    The films whose statistics changed since the last clean() are in
+    dirty_, for them to be saved (see dao.FilmStatsDao).
+
+    Not thread-safe: a ProfileCrawler updates it under its lock.
+    """
+
+    def __init__(self, histograms: np.ndarray = None):
+        self.histograms_ = histograms if histograms is not None else \
+            np.zeros((0, RATINGS), dtype=np.int32)
+        self.dirty_: Set[int] = set()
+
+    @classmethod
+    def from_ratings(cls, ratings: Iterable[Mapping]) -> "FilmStats":
+        """
+        Statistics of the films of every profile in ratings (the movies
+        of each, as Ratings or film id -> rating mappings), in one pass.
+        The ratings are counted a batch at a time, by np.bincount. Every
+        film is dirty.
+        """
+        stats = cls()
+        batch = []
+        size = 0
+        for movies in ratings:
+            if movies is None:
+                continue
+            batch.append(_arrays(movies))
+            size += len(movies)
+            if size >= _BATCH:
+                stats._count(batch)
+                (batch, size) = ([], 0)
+        stats._count(batch)
+        stats.dirty_ = set(stats.films().tolist())
+        return stats
+
+    def _count(self, batch: List) -> None:
+        if not batch:
+            return
+        ids = np.concatenate([ids for (ids, _) in batch]).astype(np.int64)
+        rates = np.concatenate([rates for (_, rates) in batch])
+        if not len(ids):
+            return
+        self.reserve(int(ids.max()) + 1)
+        counts = np.bincount(ids * RATINGS + rates,
+                             minlength=len(self.histograms_) * RATINGS)
+        self.histograms_ += counts.reshape(-1, RATINGS).astype(np.int32)
+
+    def reserve(self, n: int) -> None:
+        """ Make room for the films with ids below n. """
+        if n <= len(self.histograms_):
+            return
+        grown = np.zeros((max(n, 2 * len(self.histograms_)), RATINGS),
+                         dtype=np.int32)
+        grown[:len(self.histograms_)] = self.histograms_
+        self.histograms_ = grown
+
+    def update(self, previous: Union[None, Mapping],
+               movies: Union[None, Mapping]) -> None:
+        """
+        A profile's films went from previous to movies: None for a profile
+        that wasn't parsed before / isn't anymore.
+        """
+        for (sign, m) in ((-1, previous), (1, movies)):
+            if not m:
+                continue
+            (ids, rates) = _arrays(m)
+            self.reserve(int(ids.max()) + 1)
+            # the ids of a profile are unique, no need for np.add.at
+            self.histograms_[ids, rates] += sign
+            self.dirty_.update(ids.tolist())
+
+    def films(self) -> np.ndarray:
+        """ Ids of the films watched by anyone. """
+        return np.flatnonzero(self.histograms_.any(axis=1))
+
+    def watched(self) -> np.ndarray:
+        """ How many watched each film, by film id. """
+        return self.histograms_.sum(axis=1)
+
+    def rated(self) -> np.ndarray:
+        """ How many rated each film, by film id. """
+        return self.histograms_[:, 1:].sum(axis=1)
+
+    def means(self) -> np.ndarray:
+        """ Mean rating of each film, by film id: NaN if no one rated it. """
+        (rated, total, _) = self._sums()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return total / rated
+
+    def variances(self) -> np.ndarray:
+        """ Variance of the ratings of each film, NaN if no one rated it. """
+        (rated, total, squares) = self._sums()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / rated
+            return np.maximum(squares / rated - mean * mean, 0)
+
+    def _sums(self):
+        values = np.arange(RATINGS, dtype=np.float64)
+        h = self.histograms_
+        return (h[:, 1:].sum(axis=1).astype(np.float64),
+                h @ values, h @ (values * values))
+
+    def get(self, film_id: int) -> Union[None, FilmAggregate]:
+        """ Statistics of a film, None if no one watched it. """
+        if not 0 <= film_id < len(self.histograms_):
+            return None
+        return aggregate(self.histograms_[film_id].tolist())
+
+    def clean(self) -> Set[int]:
+        """ The films dirty until now, which aren't anymore. """
+        (dirty, self.dirty_) = (self.dirty_, set())
+        return dirty
+
+    def take_dirty(self) -> Tuple[List[int], np.ndarray]:
+        """
+        clean(), with a copy of the histograms of those films: (sorted
+        ids, histograms), to be saved while the statistics change.
+        """
+        ids = sorted(self.clean())
+        return (ids, self.histograms_[ids].copy())
+
+    def count(self) -> int:
+        """ Ratings counted, of every film. """
+        return int(self.histograms_.sum())
+
+    def __len__(self) -> int:
+        return len(self.films())
+
+    def __repr__(self):
+        return "FilmStats({} films, {} ratings)".format(
+            len(self), self.count())
@@ -0,0 +1,364 @@
+"""
+Crawl frontiers shared by several crawler processes, possibly on several
+machines. They have the same API as ProfileCrawler (enqueue, next_job,
+on_parsed, abandon, cancel_ongoing_jobs, stop_parsing, keep_parsing), but
+the queued / ongoing / parsed profiles live in a shared store:
+    - SqliteFrontier: a SQLite database in WAL mode, for processes on
+      the same machine.
+    - RedisFrontier: a Redis (or compatible) server, for many machines.
+
+Usernames are deduplicated atomically by the store. A job taken with
+next_job is leased to the process for `lease` seconds; a background
+thread keeps renewing the leases of the jobs the process is working on,
+so they only expire, and go back to the queue, if the process dies.
+Jobs are handed out shallowest first.
+
+A job that failed is abandoned: it stays leased to the process, to be
+queued again when it cancels its jobs, but isn't ongoing anymore, so
+that counts() tells how many jobs are still being worked on, by anyone.
+"""
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Tuple, Union
+from lmatch.profile_crawler import Profile
+from lmatch.ratings import Ratings
+
+
+class _SharedFrontier:
+    """ Bookkeeping common to the shared frontiers: leases and stopping. """
+
+    def __init__(self, lease: float):
+        self.lease = lease
+        self.keep_parsing = True
+        self.lock_ = threading.Lock()
+        self.mine_: Dict[str, int] = {}
+        self.closed_ = threading.Event()
+        self.heartbeat_ = threading.Thread(target=self._heartbeat,
+                                           daemon=True)
+        self.heartbeat_.start()
+
+    def stop_parsing(self) -> None:
+        """ Flag to anyone using the crawler that they should stop. """
+        self.keep_parsing = False
+
+    def _took(self, username: str, depth: int) -> Profile:
+        with self.lock_:
+            self.mine_[username] = depth
+        return Profile(username, depth)
+
+    def _done(self, username: str) -> None:
+        with self.lock_:
+            self.mine_.pop(username, None)
+
+    def _mine(self) -> Dict[str, int]:
+        with self.lock_:
+            return dict(self.mine_)
+
+    def _heartbeat(self) -> None:
+        while not self.closed_.wait(self.lease / 3):
+            mine = self._mine()
+            if mine:
+                self._renew(list(mine), time.time() + self.lease)
+
+    def close(self) -> None:
+        self.closed_.set()
+        self.heartbeat_.join()
+
+    @staticmethod
+    def _record(depth: int, following: List[str], movies,
+                newest: int = None) -> str:
+        return json.dumps([depth, following,
+                           [[k, v] for (k, v) in movies.items()], newest])
+
+    @staticmethod
+    def _profile(username: str, record: str) -> Profile:
+        (depth, following, movies, newest) = (json.loads(record) + [None])[:4]
+        return Profile(username, depth, following,
+                       Ratings((int(k), v) for (k, v) in movies), newest)
+
+
+QUEUED = 0
+ONGOING = 1
+PARSED = 2
+ABANDONED = 3
+
+
+class SqliteFrontier(_SharedFrontier):
+    """
+    Frontier in a SQLite database (in WAL mode, so readers don't block
+    the writer), shared by any number of processes on this machine.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, path: str, lease: float = 300):
+        self.path = path
+        self.local_ = threading.local()
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                username TEXT PRIMARY KEY,
+                depth INTEGER,
+                state INTEGER,
+                lease_until REAL,
+                record TEXT);
+            CREATE INDEX IF NOT EXISTS profiles_state
+                ON profiles (state, depth);
+        """)
+        _SharedFrontier.__init__(self, lease)
+
+    def _db(self) -> sqlite3.Connection:
+        """ sqlite3 connections can't be shared, one per thread. """
+        db = getattr(self.local_, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60,
+                                 isolation_level=None)
+            self.local_.db = db
+        return db
+
+    def enqueue(self, username: str, depth: int = 0) -> None:
+        self._db().execute(
+            "INSERT OR IGNORE INTO profiles VALUES (?, ?, ?, NULL, NULL)",
+            (username, depth, QUEUED))
+
+    def next_job(self, max_depth: int = None) -> Union[None, Profile]:
+        """ The shallowest job, None if there is none up to max_depth. """
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # whoever had these is gone
+            db.execute("UPDATE profiles SET state = ? "
+                       "WHERE state IN (?, ?) AND lease_until < ?",
+                       (QUEUED, ONGOING, ABANDONED, now))
+            row = db.execute("SELECT username, depth FROM profiles "
+                             "WHERE state = ? AND depth <= ? "
+                             "ORDER BY depth LIMIT 1",
+                             (QUEUED, max_depth if max_depth is not None
+                              else float("inf"))).fetchone()
+            if row is not None:
+                db.execute("UPDATE profiles SET state = ?, lease_until = ? "
+                           "WHERE username = ?",
+                           (ONGOING, now + self.lease, row[0]))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        return self._took(*row) if row is not None else None
+
+    def on_parsed(self, username: str, depth: int, following: List[str],
+                  movies: Dict[int, float], newest: int = None) -> None:
+        db = self._db()
+        record = self._record(depth, following, movies, newest)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR IGNORE INTO profiles VALUES (?, ?, ?, NULL, NULL)",
+                [(f, depth + 1, QUEUED) for f in following])
+            db.execute("INSERT INTO profiles VALUES (?, ?, ?, NULL, ?) "
+                       "ON CONFLICT (username) DO UPDATE SET "
+                       "state = excluded.state, record = excluded.record",
+                       (username, depth, PARSED, record))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._done(username)
+
+    def abandon(self, profile: Profile) -> None:
+        """ The job handed out for profile failed, see the module. """
+        self._db().execute(
+            "UPDATE profiles SET state = ? WHERE username = ? AND state = ?",
+            (ABANDONED, profile.username, ONGOING))
+
+    def cancel_ongoing_jobs(self) -> None:
+        """ Put the jobs this process was working on back in the queue. """
+        mine = self._mine()
+        self._db().executemany(
+            "UPDATE profiles SET state = ? "
+            "WHERE username = ? AND state IN (?, ?)",
+            [(QUEUED, u, ONGOING, ABANDONED) for u in mine])
+        for u in mine:
+            self._done(u)
+
+    def _renew(self, usernames: List[str], lease_until: float) -> None:
+        self._db().executemany(
+            "UPDATE profiles SET lease_until = ? "
+            "WHERE username = ? AND state IN (?, ?)",
+            [(lease_until, u, ONGOING, ABANDONED) for u in usernames])
+
+    def counts(self) -> Tuple[int, int, int]:
+        """ (parsed, ongoing, queued), abandoned jobs count as queued. """
+        counts = dict(self._db().execute(
+            "SELECT state, COUNT(*) FROM profiles GROUP BY state"))
+        return (counts.get(PARSED, 0), counts.get(ONGOING, 0),
+                counts.get(QUEUED, 0) + counts.get(ABANDONED, 0))
+
+    def parsed_profiles(self) -> Iterator[Profile]:
+        for (username, record) in self._db().execute(
+                "SELECT username, record FROM profiles WHERE state = ?",
+                (PARSED,)):
+            yield self._profile(username, record)
+
+
+# KEYS: seen, queued. ARGV: depth, usernames...
+_ENQUEUE = """
+local added = 0
+for i = 2, #ARGV do
+    if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[1]) == 1 then
+        redis.call('ZADD', KEYS[2], ARGV[1], ARGV[i])
+        added = added + 1
+    end
+end
+return added
+"""
+
+# KEYS: seen, queued, ongoing, abandoned. ARGV: now, lease until, max depth.
+_NEXT_JOB = """
+for k = 3, 4 do
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[k], '-inf', ARGV[1])
+    for _, u in ipairs(expired) do
+        redis.call('ZREM', KEYS[k], u)
+        redis.call('ZADD', KEYS[2], redis.call('HGET', KEYS[1], u), u)
+    end
+end
+local job = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[3],
+                       'WITHSCORES', 'LIMIT', 0, 1)
+if #job == 0 then
+    return nil
+end
+redis.call('ZREM', KEYS[2], job[1])
+redis.call('ZADD', KEYS[3], ARGV[2], job[1])
+return job
+"""
+
+# KEYS: ongoing, abandoned. ARGV: username.
+_ABANDON = """
+local lease = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if lease then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('ZADD', KEYS[2], lease, ARGV[1])
+end
+"""
+
+# KEYS: seen, queued, ongoing, parsed.
+# ARGV: username, record, depth of the followed, followed...
+_ON_PARSED = """
+for i = 4, #ARGV do
+    if redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[3]) == 1 then
+        redis.call('ZADD', KEYS[2], ARGV[3], ARGV[i])
+    end
+end
+redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[3] - 1)
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[2])
+"""
+
+# KEYS: seen, queued, ongoing, abandoned. ARGV: usernames...
+_CANCEL = """
+for _, u in ipairs(ARGV) do
+    if redis.call('ZREM', KEYS[3], u) + redis.call('ZREM', KEYS[4], u) > 0
+    then
+        redis.call('ZADD', KEYS[2], redis.call('HGET', KEYS[1], u), u)
+    end
+end
+"""
+
+
+class RedisFrontier(_SharedFrontier):
+    """
+    Frontier in a Redis server, shared by crawlers on any number of
+    machines. Each operation is a single Lua script, so it is atomic.
+
+    Keys, under `prefix`:
+        seen:    hash, username -> depth, of every username ever seen
+        queued:  sorted set of usernames, by depth
+        ongoing: sorted set of usernames, by lease expiry time
+        abandoned: same, for the jobs that failed
+        parsed:  hash, username -> [depth, following, movies, newest] as JSON
+
+    Lease expiry uses the clocks of the crawlers, keep them in sync.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, client, prefix: str = "lmatch", lease: float = 300):
+        self.redis_ = client
+        self.keys_ = {k: "{}:{}".format(prefix, k)
+                      for k in ("seen", "queued", "ongoing", "abandoned",
+                                "parsed")}
+        self.enqueue_ = client.register_script(_ENQUEUE)
+        self.next_job_ = client.register_script(_NEXT_JOB)
+        self.abandon_ = client.register_script(_ABANDON)
+        self.on_parsed_ = client.register_script(_ON_PARSED)
+        self.cancel_ = client.register_script(_CANCEL)
+        _SharedFrontier.__init__(self, lease)
+
+    def _keys(self, *names) -> List[str]:
+        return [self.keys_[n] for n in names]
+
+    def enqueue(self, username: str, depth: int = 0) -> None:
+        self.enqueue_(keys=self._keys("seen", "queued"),
+                      args=[depth, username])
+
+    def next_job(self, max_depth: int = None) -> Union[None, Profile]:
+        """ The shallowest job, None if there is none up to max_depth. """
+        now = time.time()
+        job = self.next_job_(
+            keys=self._keys("seen", "queued", "ongoing", "abandoned"),
+            args=[now, now + self.lease,
+                  max_depth if max_depth is not None else "+inf"])
+        if job is None:
+            return None
+        return self._took(job[0].decode(), int(float(job[1])))
+
+    def on_parsed(self, username: str, depth: int, following: List[str],
+                  movies: Dict[int, float], newest: int = None) -> None:
+        self.on_parsed_(
+            keys=self._keys("seen", "queued", "ongoing", "parsed"),
+            args=[username, self._record(depth, following, movies, newest),
+                  depth + 1] + list(following))
+        self._done(username)
+
+    def abandon(self, profile: Profile) -> None:
+        """ The job handed out for profile failed, see the module. """
+        self.abandon_(keys=self._keys("ongoing", "abandoned"),
+                      args=[profile.username])
+
+    def cancel_ongoing_jobs(self) -> None:
+        """ Put the jobs this process was working on back in the queue. """
+        mine = self._mine()
+        if mine:
+            self.cancel_(
+                keys=self._keys("seen", "queued", "ongoing", "abandoned"),
+                args=list(mine))
+        for u in mine:
+            self._done(u)
+
+    def _renew(self, usernames: List[str], lease_until: float) -> None:
+        # only the ones still leased (XX), someone may have reclaimed them
+        pipe = self.redis_.pipeline()
+        for k in ("ongoing", "abandoned"):
+            pipe.zadd(self.keys_[k], {u: lease_until for u in usernames},
+                      xx=True)
+        pipe.execute()
+
+    def counts(self) -> Tuple[int, int, int]:
+        """ (parsed, ongoing, queued), abandoned jobs count as queued. """
+        pipe = self.redis_.pipeline()
+        pipe.hlen(self.keys_["parsed"])
+        pipe.zcard(self.keys_["ongoing"])
+        pipe.zcard(self.keys_["queued"])
+        pipe.zcard(self.keys_["abandoned"])
+        (parsed, ongoing, queued, abandoned) = pipe.execute()
+        return (parsed, ongoing, queued + abandoned)
+
+    def parsed_profiles(self) -> Iterator[Profile]:
+        for (username, record) in self.redis_.hscan_iter(
+                self.keys_["parsed"]):
+            yield self._profile(username.decode(), record)
@@ -0,0 +1,180 @@
+"""
+On-disk cache of the pages fetched by the crawler, for re-crawls.
+
+Pages are stored with the validators the server sent (ETag,
+Last-Modified). Fetching a cached page again sends them back
+(If-None-Match, If-Modified-Since); if the server answers 304 Not
+Modified, the body comes from the cache, and so can anything that was
+parsed out of it the first time.
+"""
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Any, Dict, NamedTuple, Union
+
+
+class CachedPage(NamedTuple):
+    """ A page in the cache. length is the size of its body in bytes. """
+    etag: Union[None, str]
+    last_modified: Union[None, str]
+    text: str
+    length: int
+
+
+class Page(NamedTuple):
+    """ A fetched page. modified is False if it came from the cache. """
+    url: str
+    text: str
+    modified: bool
+
+
+class ResponseCache:
+    """
+    SQLite file with the cached pages, bodies compressed with zlib. Next to
+    each page it can keep results parsed out of it (JSON), under any key.
+
+    Once the compressed bodies take more than max_bytes, the least
+    recently used pages are evicted, down to 90% of it.
+
+    Counts hits (304s), misses and bytes saved (the size of the bodies
+    that weren't downloaded again, in bytes and not characters).
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self.lock_ = threading.Lock()
+        self.db_ = sqlite3.connect(path, check_same_thread=False)
+        self.db_.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB,
+                size INTEGER,
+                parsed TEXT,
+                used REAL);
+            CREATE INDEX IF NOT EXISTS pages_used ON pages (used);
+        """)
+        self.size_ = self.db_.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def lookup(self, url: str) -> Union[None, CachedPage]:
+        with self.lock_:
+            row = self.db_.execute(
+                "SELECT etag, last_modified, body FROM pages WHERE url = ?",
+                (url,)).fetchone()
+        if row is None:
+            return None
+        body = zlib.decompress(row[2])
+        return CachedPage(row[0], row[1], body.decode(), len(body))
+
+    def store(self, url: str, etag: Union[None, str],
+              last_modified: Union[None, str], text: str) -> None:
+        """ Cache a page, forgetting whatever was parsed out of it. """
+        body = zlib.compress(text.encode())
+        with self.lock_, self.db_:
+            old = self.db_.execute("SELECT size FROM pages WHERE url = ?",
+                                   (url,)).fetchone()
+            self.db_.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, NULL, ?)",
+                (url, etag, last_modified, body, len(body), time.time()))
+            self.size_ += len(body) - (old[0] if old else 0)
+            if self.size_ > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """ Drop the least recently used pages. Locked by the caller. """
+        target = self.max_bytes * 0.9
+        rows = self.db_.execute("SELECT url, size FROM pages ORDER BY used")
+        evicted = []
+        for (url, size) in rows:
+            if self.size_ <= target:
+                break
+            evicted.append((url,))
+            self.size_ -= size
+        self.db_.executemany("DELETE FROM pages WHERE url = ?", evicted)
+        self.evictions += len(evicted)
+
+    def hit(self, url: str, page: CachedPage) -> None:
+        with self.lock_, self.db_:
+            self.hits += 1
+            self.bytes_saved += page.length
+            self.db_.execute("UPDATE pages SET used = ? WHERE url = ?",
+                             (time.time(), url))
+
+    def miss(self) -> None:
+        with self.lock_:
+            self.misses += 1
+
+    def parsed(self, url: str, key: str) -> Any:
+        """ What was stored with store_parsed(url, key, ...), or None. """
+        with self.lock_:
+            row = self.db_.execute("SELECT parsed FROM pages WHERE url = ?",
+                                   (url,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0]).get(key)
+
+    def store_parsed(self, url: str, key: str, value: Any) -> None:
+        with self.lock_, self.db_:
+            row = self.db_.execute("SELECT parsed FROM pages WHERE url = ?",
+                                   (url,)).fetchone()
+            if row is None:
+                return
+            parsed = json.loads(row[0]) if row[0] is not None else {}
+            parsed[key] = value
+            self.db_.execute("UPDATE pages SET parsed = ? WHERE url = ?",
+                             (json.dumps(parsed), url))
+
+    def size(self) -> int:
+        """ Bytes taken by the compressed bodies. """
+        with self.lock_:
+            return self.size_
+
+    def close(self) -> None:
+        with self.lock_:
+            self.db_.close()
+
+    def __repr__(self):
+        return "{} hits. {} misses. {:.1f} MiB saved. {:.1f} MiB cached. " \
+               "{} evictions.".format(self.hits, self.misses,
+                                      self.bytes_saved / 2**20,
+                                      self.size_ / 2**20, self.evictions)
+
+
+def conditional_headers(page: Union[None, CachedPage]) -> Dict[str, str]:
+    """ Headers asking the server to send page again only if it changed. """
+    headers = {}
+    if page is not None:
+        if page.etag is not None:
+            headers["If-None-Match"] = page.etag
+        if page.last_modified is not None:
+            headers["If-Modified-Since"] = page.last_modified
+    return headers
+
+
+def get(session, url: str, cache: ResponseCache, **kwargs) -> Page:
+    """
+    GET url with a requests-like session, going through the cache. Pages
+    are only cached if the server sent a validator for them.
+    """
+    cached = cache.lookup(url)
+    response = session.get(url, headers=conditional_headers(cached), **kwargs)
+    if response.status_code == 304 and cached is not None:
+        cache.hit(url, cached)
+        return Page(url, cached.text, False)
+
+    cache.miss()
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if response.status_code == 200 and (etag or last_modified):
+        cache.store(url, etag, last_modified, response.text)
+    return Page(url, response.text, True)
@@ -0,0 +1,208 @@
+"""
+The HTTP client the crawler fetches pages with. One client is shared by
+every worker; its connection pool is sized for them, so that they neither
+queue for a connection nor open and drop connections past the pool size.
+
+Two backends:
+    - "requests": HTTP/1.1 with keep-alive, one connection per request in
+      flight.
+    - "httpx": HTTP/1.1, or HTTP/2 (http2=True), where requests share a
+      few connections.
+
+Both ask for compressed pages (gzip, and brotli if a brotli module is
+installed), and count how many requests reused a connection and how long
+requests waited for one.
+"""
+import time
+import codecs
+import threading
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# encodings urllib3 (and httpx) can decode here, e.g. "gzip,deflate,br"
+ACCEPT_ENCODING = urllib3.util.make_headers(
+    accept_encoding=True)["accept-encoding"]
+
+BACKENDS = ("requests", "httpx")
+
+
+class HttpStats:
+    """
+    Requests made, connections opened for them and time spent waiting
+    for a free connection.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def request(self) -> None:
+        with self.lock_:
+            self.requests += 1
+
+    def connected(self) -> None:
+        with self.lock_:
+            self.connections += 1
+
+    def waited(self, seconds: float) -> None:
+        with self.lock_:
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def reuse_rate(self) -> float:
+        """ Share of the requests that didn't need a new connection. """
+        if self.requests == 0:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests)
+
+    def __repr__(self):
+        return "{} requests. {} connections. {:.1%} reused. {:.1f} ms " \
+               "waiting for a connection on average, {:.1f} ms at most." \
+               .format(self.requests, self.connections, self.reuse_rate(),
+                       1000 * self.wait_time / max(self.requests, 1),
+                       1000 * self.max_wait_time)
+
+
+def _instrumented(pool_class, stats: HttpStats):
+    """ Subclass of a urllib3 pool class that reports to stats. """
+
+    class Connection(pool_class.ConnectionCls):
+        def connect(self):
+            stats.connected()
+            return super().connect()
+
+    class Pool(pool_class):
+        ConnectionCls = Connection
+
+        def _get_conn(self, timeout=None):
+            start = time.perf_counter()
+            try:
+                return super()._get_conn(timeout)
+            finally:
+                stats.waited(time.perf_counter() - start)
+
+    return Pool
+
+
+class _InstrumentedAdapter(HTTPAdapter):
+    def __init__(self, stats: HttpStats, **kwargs):
+        self.stats_ = stats
+        HTTPAdapter.__init__(self, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _instrumented(HTTPConnectionPool, self.stats_),
+            "https": _instrumented(HTTPSConnectionPool, self.stats_),
+        }
+
+
+class _Trace:
+    """
+    httpcore trace callback of one request (httpx backend): notes whether
+    it opened a connection and when it started sending, to tell the time
+    it waited for a connection apart from the time it spent connecting.
+    """
+
+    def __init__(self, stats: HttpStats):
+        self.stats_ = stats
+        self.start_ = time.perf_counter()
+        self.connecting_ = 0.0
+        self.started_ = None
+
+    def __call__(self, event: str, info) -> None:
+        now = time.perf_counter()
+        if event in ("connection.connect_tcp.started",
+                     "connection.start_tls.started"):
+            if event == "connection.connect_tcp.started":
+                self.stats_.connected()
+            self.started_ = now
+        elif event in ("connection.connect_tcp.complete",
+                       "connection.start_tls.complete"):
+            self.connecting_ += now - self.started_
+        elif event.endswith("send_request_headers.started"):
+            self.stats_.waited(max(0.0, now - self.start_ - self.connecting_))
+
+
+class HttpClient:
+    """
+    Client for `workers` concurrent requests. get(url, headers=...) returns
+    a response with status_code, headers and text, as requests does.
+    `errors` are the exceptions it raises when the request itself fails.
+
+    With stream=True, the body is left to be read with iter_text, and the
+    response must be closed once done with.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, workers: int = 10, backend: str = "requests",
+                 http2: bool = False, compress: bool = True,
+                 timeout: float = 30):
+        self.backend = backend
+        self.timeout = timeout
+        self.stats = HttpStats()
+        headers = {"Accept-Encoding": ACCEPT_ENCODING if compress
+                   else "identity"}
+
+        if backend == "requests":
+            if http2:
+                raise ValueError("the requests backend can't do HTTP/2")
+            self.session_ = requests.Session()
+            self.session_.headers.update(headers)
+            # pool_block: past `workers` connections wait for one to be
+            # free instead of opening one that is thrown away after
+            adapter = _InstrumentedAdapter(self.stats, pool_connections=4,
+                                           pool_maxsize=workers,
+                                           pool_block=True)
+            self.session_.mount("http://", adapter)
+            self.session_.mount("https://", adapter)
+            self.errors = (requests.RequestException,)
+        elif backend == "httpx":
+            import httpx
+            limits = httpx.Limits(max_connections=workers,
+                                  max_keepalive_connections=workers)
+            self.session_ = httpx.Client(http2=http2, limits=limits,
+                                         headers=headers, timeout=timeout)
+            self.errors = (httpx.HTTPError,)
+        else:
+            raise ValueError("unknown HTTP backend: {}".format(backend))
+
+    def get(self, url: str, headers=None, stream: bool = False, **kwargs):
+        self.stats.request()
+        if self.backend == "requests":
+            kwargs.setdefault("timeout", self.timeout)
+            return self.session_.get(url, headers=headers, stream=stream,
+                                     **kwargs)
+
+        kwargs["extensions"] = {"trace": _Trace(self.stats)}
+        if not stream:
+            return self.session_.get(url, headers=headers, **kwargs)
+        request = self.session_.build_request("GET", url, headers=headers,
+                                              **kwargs)
+        return self.session_.send(request, stream=True)
+
+    def iter_text(self, response, chunk_size: int = 16384):
+        """ The body of a streamed response, decoded, a chunk at a time. """
+        if self.backend == "httpx":
+            yield from response.iter_text(chunk_size)
+            return
+
+        decoder = codecs.getincrementaldecoder(
+            response.encoding or "utf-8")(errors="replace")
+        for chunk in response.iter_content(chunk_size):
+            yield decoder.decode(chunk)
+        yield decoder.decode(b"", True)
+
+    def close(self) -> None:
+        self.session_.close()
+
+    def __repr__(self):
+        return repr(self.stats)
@@ -0,0 +1,155 @@
+"""
+Queue of profiles waiting to be crawled, handed out in priority order.
+"""
+import heapq
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple, Union
+from lmatch import profile_set
+if TYPE_CHECKING:
+    # profile_crawler imports this module
+    from lmatch.profile_crawler import Profile
+
+
+def by_depth(profile: "Profile", in_degree: int):
+    """ Breadth first: shallowest profiles first. """
+    return profile.depth
+
+
+# lets JobQueue skip counting in-degrees nobody looks at
+by_depth.uses_in_degree = False
+
+
+def by_in_degree(profile: "Profile", in_degree: int):
+    """ Most followed profiles (among the parsed ones) first. """
+    return (-in_degree, profile.depth)
+
+
+PRIORITIES = {"depth": by_depth, "in-degree": by_in_degree}
+
+
+class JobQueue(profile_set.UsernameSet):
+    """
+    Set of queued profiles, handed out in the order of a priority function.
+    The priority function is given a profile and its in-degree (how many
+    times bump() was called for it) and returns a sort key, lowest first.
+    Profiles with the same key come out in the order they went in.
+
+    Profiles are kept in one FIFO bucket per depth and key, with the keys
+    of each depth in a heap, so that pop can leave out the profiles past a
+    depth without looking at them. Membership is a dict lookup, add / bump
+    are O(log k) for k distinct keys (a handful when ordering by depth),
+    pop O(d log k) for d distinct depths. When the priority of a profile
+    changes it is added to its new bucket, the copy left in the old one is
+    skipped when it comes out. bump() is a no-op for priority functions
+    with a false uses_in_degree attribute.
+
+    Behaves like a set of Profile otherwise. Not thread-safe.
+    """
+
+    def __init__(self, priority: Callable = by_depth):
+        self.priority_ = priority
+        self.uses_in_degree = getattr(priority, "uses_in_degree", True)
+        profile_set.UsernameSet.__init__(self)
+        # only for the profiles that were bumped
+        self.in_degree_: Dict[str, int] = {}
+        # (depth, key) -> bucket
+        self.buckets_: Dict[Tuple[int, object], deque] = {}
+        # depth -> heap of the keys of its buckets
+        self.keys_: Dict[int, List] = {}
+        # profiles in the buckets, stale copies included
+        self.bucketed_ = 0
+
+    def _key(self, profile: "Profile"):
+        return self.priority_(profile,
+                              self.in_degree_.get(profile.username, 0))
+
+    def _push(self, profile: "Profile", key) -> None:
+        bucket = self.buckets_.get((profile.depth, key))
+        if bucket is None:
+            bucket = self.buckets_[(profile.depth, key)] = deque()
+            heapq.heappush(self.keys_.setdefault(profile.depth, []), key)
+        bucket.append(profile)
+        self.bucketed_ += 1
+
+    def add(self, profile: "Profile", in_degree: int = 0) -> None:
+        """ Queue a profile, if it isn't already. """
+        if profile.username in self.entries_:
+            return
+        self.entries_[profile.username] = profile
+        if in_degree and self.uses_in_degree:
+            self.in_degree_[profile.username] = in_degree
+        self._push(profile, self._key(profile))
+
+    def discard(self, profile: "Profile") -> None:
+        self.entries_.pop(profile.username, None)
+        self.in_degree_.pop(profile.username, None)
+        self._compact()
+
+    def bump(self, username: str) -> None:
+        """ One more parsed profile follows username, if it is queued. """
+        if not self.uses_in_degree:
+            return
+        profile = self.entries_.get(username)
+        if profile is None:
+            return
+        key = self._key(profile)
+        self.in_degree_[username] = self.in_degree_.get(username, 0) + 1
+        new_key = self._key(profile)
+        if new_key != key:
+            self._push(profile, new_key)
+            self._compact()
+
+    def _live(self, profile: "Profile", key) -> bool:
+        """ Whether this copy of profile, found in bucket key, is current. """
+        return self.entries_.get(profile.username) is profile \
+            and self._key(profile) == key
+
+    def _first(self, max_depth: int = None) -> Union[None, int]:
+        """ Depth of the bucket with the lowest key, up to max_depth. """
+        first = None
+        for (depth, keys) in self.keys_.items():
+            if max_depth is not None and depth > max_depth:
+                continue
+            if first is None or keys[0] < self.keys_[first][0]:
+                first = depth
+        return first
+
+    def pop(self, max_depth: int = None) -> "Profile":
+        """
+        Remove and return the profile with the lowest key, among the ones
+        no deeper than max_depth if given.
+        """
+        while True:
+            depth = self._first(max_depth)
+            if depth is None:
+                raise KeyError("pop from an empty JobQueue")
+            keys = self.keys_[depth]
+            key = keys[0]
+            bucket = self.buckets_[(depth, key)]
+            while bucket:
+                profile = bucket.popleft()
+                self.bucketed_ -= 1
+                if self._live(profile, key):
+                    del self.entries_[profile.username]
+                    self.in_degree_.pop(profile.username, None)
+                    return profile
+            del self.buckets_[(depth, key)]
+            heapq.heappop(keys)
+            if not keys:
+                del self.keys_[depth]
+
+    def _compact(self) -> None:
+        """ Drop the stale copies once they outnumber the live ones. """
+        if self.bucketed_ <= 2 * len(self.entries_) + 64:
+            return
+        buckets = self.buckets_
+        self.buckets_ = {}
+        self.keys_ = {}
+        self.bucketed_ = 0
+        seen = set()
+        for (depth, key) in sorted(buckets):
+            for profile in buckets[(depth, key)]:
+                # a profile can be back in a bucket it was bumped out of
+                if self._live(profile, key) and profile.username not in seen:
+                    seen.add(profile.username)
+                    self._push(profile, key)
@@ -0,0 +1,196 @@
+import os
+import json
+import threading
+from typing import Iterable, Iterator, List
+
+
+class Journal:
+    """
+    Append-only log of the changes made to the crawl state, one JSON
+    record per line, so that nothing but the last record can be lost on a
+    crash and the state can be read back without loading it all at once.
+
+    Records:
+        ["q", username, depth]                            queued
+        ["p", username, depth, following, [[id, rating]]] parsed
+        ["p", username, depth, following, [[id, rating]], newest]
+                                    parsed, with a high-water mark
+
+    Replaying the records in order rebuilds the state (see
+    ProfileCrawler.replay). As profiles are parsed their records pile up
+    next to the "q" ones, so every compact_every records the journal
+    should be compacted: rewritten with just the records that describe the
+    current state. The new file replaces the old one atomically.
+
+    compact() needs the state to stay still while it is written. For a
+    compaction that doesn't, begin_compaction() sends the records that
+    follow to a side file (path + ".next") until end_compaction() writes
+    the state as it was when it began, followed by them. If the process
+    dies in between, the journal is the old file followed by the side
+    file: read() reads both and a new Journal on that path merges them.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, path: str, compact_every: int = 10000,
+                 fsync: bool = False):
+        self.path = path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.lock_ = threading.Lock()
+        self.appended = 0
+        # the side file, while a compaction is in progress
+        self.next_path = path + ".next"
+        self.compacting_ = False
+        self._recover()
+        self.file_ = open(path, "a")
+
+    def _recover(self) -> None:
+        """ Put back the side file of a compaction that didn't finish. """
+        if not os.path.exists(self.next_path):
+            return
+        with open(self.path, "ab+") as f:
+            _drop_partial_record(f)
+            with open(self.next_path, "rb") as side:
+                for line in side:
+                    if line.endswith(b"\n"):
+                        f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(self.next_path)
+
+    def append(self, record: List) -> None:
+        self.extend([record])
+
+    def extend(self, records: List[List]) -> None:
+        """ Append several records, flushed together. """
+        lines = "".join(json.dumps(record, separators=(",", ":")) + "\n"
+                        for record in records)
+        with self.lock_:
+            self.file_.write(lines)
+            self.file_.flush()
+            if self.fsync:
+                os.fsync(self.file_.fileno())
+            self.appended += len(records)
+
+    def due(self) -> bool:
+        """ Whether enough records were appended to be worth compacting. """
+        return self.appended >= self.compact_every and not self.compacting_
+
+    def compact(self, records: Iterable[List]) -> None:
+        """
+        Replace the journal with `records`. The caller must make sure
+        nothing is appended while `records` is being consumed.
+        """
+        tmp_path = self.path + ".tmp"
+        with self.lock_:
+            with open(tmp_path, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.file_.close()
+            os.replace(tmp_path, self.path)
+            _fsync_dir(self.path)
+            self.file_ = open(self.path, "a")
+            self.appended = 0
+
+    def begin_compaction(self) -> None:
+        """
+        Start a compaction: records appended from now on go to the side
+        file. The caller must take the state to compact at the same time,
+        with nothing appended in between.
+        """
+        with self.lock_:
+            if self.compacting_:
+                raise RuntimeError("a compaction is already in progress")
+            self.file_.close()
+            self.file_ = open(self.next_path, "w")
+            self.compacting_ = True
+
+    def end_compaction(self, records: Iterable[List]) -> int:
+        """
+        Replace the journal with `records`, the state when
+        begin_compaction was called, followed by what was appended since.
+        Records can still be appended while `records` is consumed. Returns
+        the size of the new journal, in bytes.
+        """
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                for record in records:
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+                with self.lock_:
+                    self.file_.close()
+                    with open(self.next_path) as side:
+                        appended = side.read()
+                    f.write(appended)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    size = f.tell()
+
+                    os.replace(tmp_path, self.path)
+                    _fsync_dir(self.path)
+                    # replaying the side file a second time changes
+                    # nothing, should the process die before it is gone
+                    os.remove(self.next_path)
+                    self.file_ = open(self.path, "a")
+                    self.appended = appended.count("\n")
+                    self.compacting_ = False
+        except BaseException:
+            # give up on this one, the side file goes back in the journal
+            with self.lock_:
+                if self.compacting_:
+                    self.file_.close()
+                    self._recover()
+                    self.file_ = open(self.path, "a")
+                    self.compacting_ = False
+            raise
+        return size
+
+    def close(self) -> None:
+        with self.lock_:
+            self.file_.close()
+
+
+def _fsync_dir(path: str) -> None:
+    """ Make a rename in the directory of path durable. """
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _drop_partial_record(f) -> None:
+    """ Cut what follows the last complete line of f, open in ab+. """
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return
+    f.seek(0)
+    f.truncate(f.read().rfind(b"\n") + 1)
+
+
+def _read(path: str) -> Iterator[List]:
+    with open(path) as f:
+        for line in f:
+            if not line.endswith("\n"):
+                return
+            yield json.loads(line)
+
+
+def read(path: str) -> Iterator[List]:
+    """
+    Stream the records of a journal, followed by those of the side file
+    of an unfinished compaction if there is one (see Journal). A last line
+    that was only partially written (the process died in the middle of
+    it) is ignored.
+    """
+    yield from _read(path)
+    if os.path.exists(path + ".next"):
+        yield from _read(path + ".next")
@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LruCache:
+    """
+    Size bounded key -> value cache. Once full, adding a new key evicts
+    the least recently used one.
+
+    Keeps count of hits, misses and evictions. lock can be any lock, e.g.
+    a metrics.TimedLock to know how long threads wait on it.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, maxsize: int, lock=None):
+        self.lock_ = lock if lock is not None else threading.Lock()
+        self.data_: OrderedDict = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock_:
+            try:
+                value = self.data_[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.data_.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock_:
+            self.data_[key] = value
+            self.data_.move_to_end(key)
+            while len(self.data_) > self.maxsize:
+                self.data_.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        """ Membership test. Doesn't count as a hit or miss. """
+        return key in self.data_
+
+    def __len__(self) -> int:
+        return len(self.data_)
+
+    def __repr__(self):
+        return "{} cached. {} hits. {} misses. {} evictions.".format(
+            len(self), self.hits, self.misses, self.evictions)
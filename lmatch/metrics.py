@@ -0,0 +1,360 @@
+"""
+Metrics of the crawl: counters, gauges and histograms kept in a
+Registry, readable as Prometheus text (see MetricsServer) or as JSON
+snapshots (see SnapshotWriter).
+
+Metrics are identified by a name and a set of labels, e.g.
+lmatch_parse_seconds{parser="lmatch.parse.following"}. Asking the
+registry for the same name and labels again gives back the same metric.
+REGISTRY is the one the crawler reports to.
+"""
+import json
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# seconds, for requests and parsing
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+                   5, 10, 30)
+# seconds, for waiting on a lock
+LOCK_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, .01, .1, 1)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"") \
+        .replace("\n", "\\n")
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    """ name{label="value",...}, as in the Prometheus text format. """
+    if not labels:
+        return name
+    return "{}{{{}}}".format(name, ",".join(
+        "{}=\"{}\"".format(k, _escape(v)) for (k, v) in labels))
+
+
+class Counter:
+    """ Value that only goes up. This class is thread-safe. """
+
+    kind = "counter"
+
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock_:
+            self.value += amount
+
+    def samples(self, name: str, labels: Tuple) -> List[Tuple[str, float]]:
+        return [(_series(name, labels), self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """
+    Value that goes up and down: either set() or, if given a function,
+    whatever it returns when read. This class is thread-safe.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, fn: Callable[[], float] = None):
+        self.fn_ = fn
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def get(self) -> float:
+        return self.fn_() if self.fn_ is not None else self.value
+
+    def samples(self, name: str, labels: Tuple) -> List[Tuple[str, float]]:
+        return [(_series(name, labels), self.get())]
+
+    def snapshot(self):
+        return self.get()
+
+
+class Histogram:
+    """
+    Distribution of observed values (durations, usually) over fixed
+    buckets, plus their count and sum.
+
+    This class is thread-safe.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.lock_ = threading.Lock()
+        self.buckets = tuple(sorted(buckets))
+        # the last one is +Inf
+        self.counts_ = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock_:
+            self.counts_[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        """ Context manager observing how long its block took. """
+        return _Timer(self)
+
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket the q-quantile falls in (the largest
+        bucket if it is past all of them), 0 if nothing was observed.
+        """
+        with self.lock_:
+            counts = list(self.counts_)
+            total = self.count
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for (bound, n) in zip(self.buckets, counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self, name: str, labels: Tuple) -> List[Tuple[str, float]]:
+        with self.lock_:
+            counts = list(self.counts_)
+            (count, total) = (self.count, self.sum)
+
+        result = []
+        cumulative = 0
+        bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        for (bound, n) in zip(bounds, counts):
+            cumulative += n
+            result.append((_series(name + "_bucket",
+                                   labels + (("le", bound),)), cumulative))
+        result.append((_series(name + "_sum", labels), total))
+        result.append((_series(name + "_count", labels), count))
+        return result
+
+    def snapshot(self):
+        return {"count": self.count, "sum": self.sum, "mean": self.mean(),
+                "p50": self.quantile(.5), "p99": self.quantile(.99)}
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram_ = histogram
+
+    def __enter__(self):
+        self.start_ = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram_.observe(time.perf_counter() - self.start_)
+
+
+class Registry:
+    """
+    Named metrics, each with a help text. Metrics are created on first
+    use. This class is thread-safe.
+    """
+
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        # name -> (kind, help)
+        self.families_: Dict[str, Tuple[str, str]] = {}
+        # (name, labels) -> metric, in the order they were created
+        self.metrics_: Dict[Tuple[str, Tuple], object] = {}
+
+    def _get(self, cls, name: str, help: str, labels: Dict[str, str],
+             *args):
+        key = (name, tuple(sorted((k, str(v)) for (k, v) in labels.items())))
+        metric = self.metrics_.get(key)
+        if type(metric) is cls:
+            return metric
+        with self.lock_:
+            family = self.families_.setdefault(name, (cls.kind, help))
+            if family[0] != cls.kind:
+                raise ValueError("{} is a {}".format(name, family[0]))
+            metric = self.metrics_.get(key)
+            if metric is None:
+                metric = self.metrics_[key] = cls(*args)
+            return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "",
+              fn: Callable[[], float] = None, **labels) -> Gauge:
+        """ A gauge, reading fn if given (replacing any previous one). """
+        gauge = self._get(Gauge, name, help, labels)
+        if fn is not None:
+            gauge.fn_ = fn
+        return gauge
+
+    def histogram(self, name: str, help: str = "",
+                  buckets: Sequence[float] = LATENCY_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def _metrics(self) -> List:
+        with self.lock_:
+            return list(self.metrics_.items())
+
+    def render(self) -> str:
+        """ Every metric, in the Prometheus text exposition format. """
+        lines = []
+        described = set()
+        # grouped by name, in the order they were created otherwise
+        for ((name, labels), metric) in sorted(self._metrics(),
+                                               key=lambda m: m[0][0]):
+            if name not in described:
+                described.add(name)
+                (kind, help) = self.families_[name]
+                if help:
+                    lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} {}".format(name, kind))
+            for (sample, value) in metric.samples(name, labels):
+                lines.append("{} {}".format(sample, value))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """ series -> value (or summary of a histogram), for JSON. """
+        return {_series(name, labels): metric.snapshot()
+                for ((name, labels), metric) in self._metrics()}
+
+
+REGISTRY = Registry()
+
+
+class TimedLock:
+    """
+    threading.Lock that observes how long every acquisition waited for it
+    in lmatch_lock_wait_seconds{lock=name}.
+    """
+
+    def __init__(self, name: str, registry: Registry = None):
+        registry = registry if registry is not None else REGISTRY
+        self.lock_ = threading.Lock()
+        self.wait_ = registry.histogram(
+            "lmatch_lock_wait_seconds", "Time spent waiting for a lock",
+            LOCK_BUCKETS, lock=name)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        # uncontended, the common case, doesn't need the clock
+        if self.lock_.acquire(False):
+            self.wait_.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self.lock_.acquire(True, timeout)
+        self.wait_.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self) -> None:
+        self.lock_.release()
+
+    def locked(self) -> bool:
+        return self.lock_.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class MetricsServer:
+    """
+    Serves a registry on localhost: /metrics in the Prometheus text
+    format, /metrics.json as a snapshot. Port 0 picks a free one.
+    """
+
+    def __init__(self, registry: Registry = None, port: int = 0,
+                 host: str = "127.0.0.1"):
+        registry = registry if registry is not None else REGISTRY
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry.render().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd_ = ThreadingHTTPServer((host, port), Handler)
+        self.httpd_.daemon_threads = True
+        self.thread_ = threading.Thread(target=self.httpd_.serve_forever,
+                                        daemon=True)
+
+    @property
+    def url(self) -> str:
+        (host, port) = self.httpd_.server_address[:2]
+        return "http://{}:{}/metrics".format(host, port)
+
+    def start(self) -> str:
+        self.thread_.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.httpd_.shutdown()
+        self.httpd_.server_close()
+
+
+class SnapshotWriter:
+    """
+    Writes a JSON snapshot of a registry to path every `interval`
+    seconds, in a background thread, and once more on close(). Each one
+    replaces the previous file atomically; "time" is when it was taken.
+    """
+
+    def __init__(self, path: str, registry: Registry = None,
+                 interval: float = 10):
+        self.path = path
+        self.registry_ = registry if registry is not None else REGISTRY
+        self.interval = interval
+        self.stopped_ = threading.Event()
+        self.thread_ = threading.Thread(target=self._run, daemon=True)
+        self.thread_.start()
+
+    def _run(self) -> None:
+        while not self.stopped_.wait(self.interval):
+            self.write()
+
+    def write(self) -> None:
+        snapshot = self.registry_.snapshot()
+        snapshot["time"] = time.time()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, self.path)
+
+    def close(self) -> None:
+        self.stopped_.set()
+        self.thread_.join()
+        self.write()
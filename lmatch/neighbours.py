@@ -0,0 +1,197 @@
+import zlib
+import sqlite3
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple
+from lmatch.ratings import RatingsMatrix
+from lmatch.similarity import SimilarityEngine
+
+# (neighbour username, films in common, score)
+Neighbour = Tuple[str, int, float]
+
+
+class NeighbourIndex:
+    """
+    On-disk (SQLite) index with the top-K most similar profiles of every
+    profile, for one metric. Lookups are a single indexed query.
+
+    This class is not thread-safe.
+    """
+
+    def __init__(self, path: str, k: int = 50, metric: str = "diff"):
+        self.db_ = sqlite3.connect(path)
+        self.db_.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS profiles (
+                username TEXT PRIMARY KEY, fingerprint INTEGER);
+            CREATE TABLE IF NOT EXISTS neighbours (
+                username TEXT, rank INTEGER, neighbour TEXT,
+                common INTEGER, score REAL,
+                PRIMARY KEY (username, rank)) WITHOUT ROWID;
+        """)
+
+        meta = dict(self.db_.execute("SELECT key, value FROM meta"))
+        if not meta:
+            self.db_.executemany("INSERT INTO meta VALUES (?, ?)",
+                                 [("k", str(k)), ("metric", metric)])
+            self.db_.commit()
+            meta = {"k": str(k), "metric": metric}
+        self.k = int(meta["k"])
+        self.metric = meta["metric"]
+
+    def fingerprints(self) -> Dict[str, int]:
+        """
+        Profiles whose neighbours are in the index, with the fingerprint
+        of the ratings they had when their neighbours were computed.
+        """
+        return dict(self.db_.execute(
+            "SELECT username, fingerprint FROM profiles"))
+
+    def lookup(self, username: str) -> List[Neighbour]:
+        return [tuple(row) for row in self.db_.execute(
+            "SELECT neighbour, common, score FROM neighbours "
+            "WHERE username = ? ORDER BY rank", (username,))]
+
+    def store(self, rows: Dict[str, List[Neighbour]],
+              fingerprints: Dict[str, int] = None) -> None:
+        """
+        Replace the neighbours of the profiles in `rows`, and their
+        fingerprints if given.
+        """
+        with self.db_:
+            for (username, neighbours) in rows.items():
+                if fingerprints is not None:
+                    self.db_.execute(
+                        "INSERT OR REPLACE INTO profiles VALUES (?, ?)",
+                        (username, fingerprints[username]))
+                self.db_.execute("DELETE FROM neighbours WHERE username = ?",
+                                 (username,))
+                self.db_.executemany(
+                    "INSERT INTO neighbours VALUES (?, ?, ?, ?, ?)",
+                    [(username, rank) + tuple(n)
+                     for (rank, n) in enumerate(neighbours)])
+
+    def close(self) -> None:
+        self.db_.close()
+
+
+def _sort_key(score: np.ndarray, metric: str) -> np.ndarray:
+    """ Smaller is better, same order as SimilarityEngine.matches. """
+    return np.abs(score) if metric == "diff" else -score
+
+
+def top_k(common: np.ndarray, score: np.ndarray, k: int,
+          metric: str) -> np.ndarray:
+    """
+    Positions of the k best entries with films in common, best first.
+    Ties are broken by position, so this matches the first k of a stable
+    sort of the whole thing, without paying for one.
+    """
+    key = np.where(common > 0, _sort_key(score, metric), np.inf)
+    valid = int(np.count_nonzero(common > 0))
+    if valid <= k:
+        candidates = np.flatnonzero(common > 0)
+    else:
+        kth = np.partition(key, k - 1)[k - 1]
+        lower = np.flatnonzero(key < kth)
+        ties = np.flatnonzero(key == kth)[:k - len(lower)]
+        candidates = np.concatenate([lower, ties])
+        candidates.sort()
+    return candidates[np.argsort(key[candidates], kind="stable")]
+
+
+_engine = None
+
+
+def _init_worker(matrix_path: str) -> None:
+    global _engine
+    _engine = SimilarityEngine(RatingsMatrix.load(matrix_path))
+
+
+def _block(mains: List[int], others: List[int], k: int,
+           metric: str) -> Dict[str, List[Neighbour]]:
+    """ Top-k among `others` (everyone if None) for each one of `mains`. """
+    (common, score) = _engine.block_scores(mains, others, metric)
+    names = _engine.usernames if others is None \
+        else [_engine.usernames[o] for o in others]
+    others = range(len(_engine.usernames)) if others is None else others
+
+    result = {}
+    for (j, main) in enumerate(mains):
+        col_common = common[:, j].copy()
+        # a profile isn't its own neighbour
+        col_common[np.asarray(others) == main] = 0
+        best = top_k(col_common, score[:, j], k, metric)
+        result[_engine.usernames[main]] = [
+            (names[o], int(col_common[o]), float(score[o, j])) for o in best]
+    return result
+
+
+def fingerprint(ratings) -> int:
+    """ Checksum of a profile's ratings, to tell when they change. """
+    return zlib.crc32(bytes(ratings.rates), zlib.crc32(bytes(ratings.ids)))
+
+
+def _merge(old: List[Neighbour], new: List[Neighbour], recomputed: Set[str],
+           k: int, metric: str) -> List[Neighbour]:
+    merged = [n for n in old if n[0] not in recomputed] + new
+    key = _sort_key(np.array([n[2] for n in merged]), metric)
+    return [merged[i] for i in np.argsort(key, kind="stable")[:k]]
+
+
+def _run(matrix_path: str, tasks: Iterable, processes: int):
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(matrix_path,)) as pool:
+        futures = [pool.submit(_block, *task) for task in tasks]
+        for f in futures:
+            yield f.result()
+
+
+def _blocks(rows: List[int], block_size: int):
+    for start in range(0, len(rows), block_size):
+        yield rows[start:start + block_size]
+
+
+def update(matrix_path: str, index: NeighbourIndex,
+           processes: int = None, block_size: int = 256) -> int:
+    """
+    Bring the index up to date with the ratings matrix at matrix_path.
+
+    Only the rows of profiles that are new, or whose ratings changed, since
+    the index was last updated are computed against everyone, in blocks
+    spread over a pool of processes. Their scores against the profiles
+    already indexed are then merged into those profiles' lists. An empty
+    index gets every row computed.
+
+    If a profile's ratings change so that it drops out of someone's list,
+    that list is left one entry short until the index is rebuilt.
+
+    Returns the number of rows computed.
+    """
+    matrix = RatingsMatrix.load(matrix_path)
+    indexed = index.fingerprints()
+    current = {u: fingerprint(r) for (u, r) in matrix.rows()}
+    fresh = [i for (i, u) in enumerate(matrix.usernames)
+             if indexed.get(u) != current[u]]
+    if not fresh:
+        return 0
+
+    # new rows, against everyone
+    tasks = [(block, None, index.k, index.metric)
+             for block in _blocks(fresh, block_size)]
+    for rows in _run(matrix_path, tasks, processes):
+        index.store(rows, current)
+
+    # rows already indexed, against the new ones only
+    recomputed = {matrix.usernames[i] for i in fresh}
+    stale = [i for (i, u) in enumerate(matrix.usernames)
+             if u not in recomputed]
+    tasks = [(block, fresh, index.k, index.metric)
+             for block in _blocks(stale, block_size)]
+    for rows in _run(matrix_path, tasks, processes):
+        index.store({u: _merge(index.lookup(u), new, recomputed,
+                               index.k, index.metric)
+                     for (u, new) in rows.items()})
+
+    return len(fresh)
@@ -14,7 +14,7 @@ def _extract_value(data, key: str, start: int) -> Tuple[int, int, str]:
         If not found (-1, -1, "")
     """
     start = data.find(key, start)
-    if start is -1:
+    if start == -1:
         return (-1, -1, "")
 
     start += len(key)
@@ -36,7 +36,7 @@ def next_page(page: str) -> Union[None, str]:
 
     start = page.rfind("paginate-nextprev")
     start = page.find(key_page_next, start)
-    if start is -1:
+    if start == -1:
         return None
 
     start += len(key_page_next)
@@ -44,6 +44,36 @@ def next_page(page: str) -> Union[None, str]:
     return page[start + 1:end_idx]
 
 
+def page_path(first_page: str, number: int) -> str:
+    """ Given the path to the first page of a listing, e.g.
+        'user/films/page/1', returns the path to page `number`
+        of that same listing.
+    """
+    return first_page.rstrip("/").rsplit("/", 1)[0] + "/" + str(number)
+
+
+def last_page(page: str) -> Union[None, int]:
+    """ Given the contents of a Letterboxd page, returns
+        the number of the last page, as shown in the
+        paginator (the list of page numbers at the bottom).
+
+        Returns None if the page has no paginator. Pages
+        that only have "next" / "previous" links, like the
+        'following' pages, don't have one.
+    """
+    start = page.rfind("paginate-page")
+    if start == -1:
+        return None
+
+    end = page.find("</li>", start)
+    close_tag = page.rfind("</", start, end)
+    start = page.rfind(">", start, close_tag)
+    try:
+        return int(page[start + 1:close_tag])
+    except ValueError:
+        return None
+
+
 def following(page: str) -> List[str]:
     """ Given a Letterboxd 'following' page, parses out the
     list of usernames followed in it.
@@ -94,11 +124,13 @@ def movies_watched(page: str) -> List[Tuple[str, int]]:
             # up to the beginning of the next movie
             # detect where to stop
             stop_at = page.find(tag_movie_container, start + 3)
+            if stop_at == -1:
+                stop_at = len(page)
 
             (start, _, movie_name) = _extract_value(page, tag_name, start)
             (_, start, movie_rate) = _extract_value(page, tag_rate, start)
 
-            if start > stop_at or start is -1:
+            if start > stop_at or start == -1:
                 start = stop_at - 1
                 movie_rate = 0
 
@@ -0,0 +1,196 @@
+"""
+Incremental parsers for the listings (following, films), fed the page a
+chunk at a time as it comes off the network instead of as one string.
+Entries come out as soon as they are complete, and the next / last page
+are picked up in the same pass, so only a few KB of any page are held at
+a time.
+
+Same results as lmatch.parse (and lmatch.parse_regex) on whole pages:
+
+    listing = for_parser(parse.following)
+    for chunk in chunks:
+        entries.extend(listing.feed(chunk))
+    entries.extend(listing.close())
+    (listing.next_page, listing.last_page)
+"""
+import re
+import abc
+from typing import Callable, Dict, List, Tuple, Union
+from lmatch import parse_regex
+
+# every pagination token is shorter than this, so one that starts this
+# far from the end of what was received so far is whole
+_HOLD = 1024
+
+# kind -> (literal it starts with, pattern matched there)
+_PAGINATION = {
+    "nextprev": ("paginate-nextprev", re.compile(r"paginate-nextprev")),
+    "next": ("\"next\" href=\"", re.compile(r'"next" href="([^"]{0,512})"')),
+    # the text of the innermost element of a paginator entry, e.g.
+    # <li class="paginate-page"><a href="...">12</a></li>
+    "page": ("paginate-page", re.compile(
+        r'paginate-page(?!s)[^<>]{0,256}>(?:<[^/>][^>]{0,256}>){0,2}'
+        r'([^<]{0,64})</')),
+}
+
+
+class ListingParser(abc.ABC):
+    """
+    Base of the incremental parsers. A listing is cut into entries, each
+    from one `marker` to the next, that are parsed by entry() as soon as
+    the next marker comes in (the last one when the page is over).
+
+    The pagination tokens are found on the side, the way lmatch.parse
+    does it, with str.find on the literal they start with.
+
+    Holds at most the entry in progress (the last one runs to the end of
+    the page) and the last chunk. Not thread-safe, one per page.
+    """
+
+    marker = None
+
+    def __init__(self):
+        # from the marker of the entry in progress on
+        self.entry_ = ""
+        # not scanned for pagination tokens yet
+        self.buffer_ = ""
+        self.next_page: Union[None, str] = None
+        self.last_page: Union[None, int] = None
+        # after a paginate-nextprev, until a "next" link shows up
+        self.want_next_ = False
+        self.chars = 0
+        self.peak_buffer = 0
+
+    @abc.abstractmethod
+    def entry(self, chunk: str):
+        """ The entry in chunk, None if there's none. """
+
+    def feed(self, text: str) -> List:
+        """ Take the next chunk of the page, return the entries it ended. """
+        self.chars += len(text)
+        self.buffer_ += text
+        self._paginate(len(self.buffer_) - _HOLD)
+        return self._entries(text)
+
+    def close(self) -> List:
+        """ The page is over, return the entries left. """
+        self._paginate(len(self.buffer_))
+        self.buffer_ = ""
+        entries = []
+        if self.entry_.startswith(self.marker):
+            self._append(entries, self.entry_)
+        self.entry_ = ""
+        return entries
+
+    def _append(self, entries: List, chunk: str) -> None:
+        entry = self.entry(chunk)
+        if entry is not None:
+            entries.append(entry)
+
+    def _entries(self, text: str) -> List:
+        pending = self.entry_ + text
+        self.peak_buffer = max(self.peak_buffer,
+                               len(pending) + len(self.buffer_))
+        marker = self.marker
+        start = pending.find(marker)
+        if start == -1:
+            # before the first entry, a marker can be cut in two
+            self.entry_ = pending[-len(marker) + 1:]
+            return []
+
+        entries = []
+        while True:
+            end = pending.find(marker, start + len(marker))
+            if end == -1:
+                break
+            self._append(entries, pending[start:end])
+            start = end
+        self.entry_ = pending[start:]
+        return entries
+
+    def _paginate(self, until: int) -> None:
+        """ Handle the pagination tokens starting before until. """
+        buffer = self.buffer_
+        cursor = 0
+        # kind -> where its literal is next found, from cursor on
+        found: Dict[str, int] = {}
+        while True:
+            pos = -1
+            kinds = ("nextprev", "page", "next") if self.want_next_ \
+                else ("nextprev", "page")
+            for kind in kinds:
+                at = found.get(kind)
+                if at is None or (at != -1 and at < cursor):
+                    at = found[kind] = buffer.find(_PAGINATION[kind][0],
+                                                   cursor)
+                if at != -1 and (pos == -1 or at < pos):
+                    (pos, token) = (at, kind)
+            if pos == -1 or pos >= until:
+                break
+
+            m = _PAGINATION[token][1].match(buffer, pos)
+            if m is None:
+                cursor = pos + 1
+                continue
+            self._token(token, m.group(m.lastindex or 0))
+            cursor = m.end()
+
+        self.buffer_ = buffer[max(cursor, until, 0):]
+
+    def _token(self, kind: str, value: str) -> None:
+        if kind == "nextprev":
+            # what counts is the "next" link after the last one of these
+            self.next_page = None
+            self.want_next_ = True
+        elif kind == "next":
+            self.next_page = value[1:]
+            self.want_next_ = False
+        else:
+            # the last paginator entry is the last page
+            try:
+                self.last_page = int(value)
+            except ValueError:
+                self.last_page = None
+
+
+class FollowingParser(ListingParser):
+    """ parse.following: the first link after each "table-person". """
+
+    marker = "table-person"
+
+    def entry(self, chunk: str) -> Union[None, str]:
+        return parse_regex.following_entry(chunk)
+
+
+class MoviesParser(ListingParser):
+    """
+    parse.movies_watched: the film each "poster-container" links to and
+    its rating, 0 if there's none before the next one.
+    """
+
+    marker = "poster-container"
+
+    def entry(self, chunk: str) -> Union[None, Tuple[str, int]]:
+        return parse_regex.movie_entry(chunk)
+
+
+_PARSERS = {"following": FollowingParser, "movies_watched": MoviesParser}
+
+
+def for_parser(parser: Callable) -> ListingParser:
+    """
+    Incremental parser giving the same results as `parser`, a listing
+    function of lmatch.parse or lmatch.parse_regex. KeyError for others.
+    """
+    return _PARSERS[parser.__name__]()
+
+
+def parse_chunks(parser: Callable, chunks) \
+        -> Tuple[List, Union[None, str], Union[None, int]]:
+    """ pipeline.parse_listing, for a page given as chunks of text. """
+    listing = for_parser(parser)
+    entries = []
+    for chunk in chunks:
+        entries.extend(listing.feed(chunk))
+    entries.extend(listing.close())
+    return (entries, listing.next_page, listing.last_page)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Tuple, Union
+
+
+class StageStats:
+    """
+    Throughput of one stage of the crawl (fetching pages, parsing them):
+    how many pages went through it, how many bytes, and how long they
+    took.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock_ = threading.Lock()
+        self.start_ = time.perf_counter()
+        self.pages = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def record(self, seconds: float, nbytes: int = 0) -> None:
+        with self.lock_:
+            self.pages += 1
+            self.bytes += nbytes
+            self.busy_time += seconds
+
+    def rate(self) -> float:
+        """ Pages per second since the stage started. """
+        return self.pages / max(time.perf_counter() - self.start_, 1e-9)
+
+    def __repr__(self):
+        return "{}: {} pages, {:.1f} pages/s, {:.1f} ms/page".format(
+            self.name, self.pages, self.rate(),
+            1000 * self.busy_time / max(self.pages, 1))
+
+
+def _timed(fn: Callable, *args) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return (result, time.perf_counter() - start)
+
+
+def parse_listing(parser: Callable, page: str) \
+        -> Tuple[List, Union[None, str], Union[None, int]]:
+    """
+    Everything the crawler wants out of a page of a listing: the entries,
+    as parsed by `parser`, the path to the next page and the number of the
+    last page. next_page and last_page come from the module of `parser`.
+    """
+    module = sys.modules[parser.__module__]
+    return (parser(page), module.next_page(page), module.last_page(page))
+
+
+def _context():
+    """ multiprocessing context that doesn't fork the calling process. """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+class ParsePool:
+    """
+    Parsing stage of the crawl, run in a pool of processes so it doesn't
+    compete with the fetching threads for the GIL.
+
+    Pages wait in a bounded queue: once max_queued pages are waiting or
+    being parsed, call() blocks the fetcher until there's room. Only the
+    results travel back, the pages stay in the worker processes.
+
+    The workers are started on the first call, from a fetching thread,
+    while other threads may hold locks (the HTTP pool's, the crawler's,
+    logging's): they come from a fork server (spawned where there's none),
+    never from a fork of the crawler, which would inherit them locked.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, processes: int = None, max_queued: int = None):
+        processes = processes or os.cpu_count()
+        self.pool_ = ProcessPoolExecutor(max_workers=processes,
+                                         mp_context=_context())
+        self.max_queued = max_queued or 4 * processes
+        self.slots_ = threading.BoundedSemaphore(self.max_queued)
+        self.lock_ = threading.Lock()
+        self.queued = 0
+        self.peak_queued = 0
+        self.stats = StageStats("parse")
+
+    def call(self, fn: Callable, *args) -> Any:
+        """ Run fn(*args) in a worker process and wait for the result. """
+        self.slots_.acquire()
+        with self.lock_:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+
+        try:
+            (result, seconds) = self.pool_.submit(_timed, fn, *args).result()
+        finally:
+            with self.lock_:
+                self.queued -= 1
+            self.slots_.release()
+
+        self.stats.record(seconds, len(args[-1]) if args else 0)
+        return result
+
+    def listing(self, parser: Callable, page: str):
+        """ parse_listing, in a worker process. """
+        return self.call(parse_listing, parser, page)
+
+    def close(self) -> None:
+        self.pool_.shutdown()
+
+    def __repr__(self):
+        return "{}. queue: {} now, {} peak, {} max".format(
+            self.stats, self.queued, self.peak_queued, self.max_queued)
@@ -1,24 +1,50 @@
 import json
+import time
+import logging
 import threading
-from typing import Dict, List, Set, Union, Tuple
+from collections.abc import MutableSet
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, \
+    Sequence, Set, Union, Tuple
+from lmatch.ratings import Ratings
+from lmatch import job_queue, metrics, profile_set, usernames
+
+log = logging.getLogger(__name__)
 
 
 class Profile:
     """
     Class that contains all the data relative to a
     Letterboxd profile / account.
+
+    The crawler keeps the movies of parsed profiles as Ratings, a compact
+    read-only mapping of film id -> rating.
+
+    There can be millions of profiles, so they have no __dict__. The
+    username is interned in usernames.TABLE and the following list is
+    stored as a Following, an array of ids in that same table.
+
+    newest is the high-water mark of the films: the id of the most
+    recently added one when the profile was last crawled by date (see
+    ProfileCrawler.refresh), None if it never was.
     """
 
+    __slots__ = ("username", "depth", "following", "movies", "newest")
+
     def __init__(self,
                  username: str,
                  depth: int = 0,
-                 following: List[str] = None,
-                 movies: Dict[str, int] = None):
+                 following: Sequence[str] = None,
+                 movies: Mapping[int, int] = None,
+                 newest: int = None):
 
-        self.username = username
+        self.username = usernames.TABLE.intern(username)
         self.depth = depth
+        if following is not None and not isinstance(following,
+                                                    usernames.Following):
+            following = usernames.Following(following)
         self.following = following
         self.movies = movies
+        self.newest = newest
 
     def isEmpty(self) -> bool:
         """ Check whether or not the profile is empty / not parsed. """
@@ -34,6 +60,68 @@ class Profile:
         return (self.username)
 
 
+class ProfileSet(profile_set.UsernameSet, MutableSet):
+    """
+    Set of profiles that also hands back the one it holds for a username
+    (get). Behaves like a set of Profile otherwise. Not thread-safe.
+    """
+
+    def __init__(self, profiles: Iterable[Profile] = ()):
+        profile_set.UsernameSet.__init__(self)
+        for p in profiles:
+            self.add(p)
+
+    def add(self, profile: Profile) -> None:
+        self.entries_.setdefault(profile.username, profile)
+
+    def discard(self, profile: Profile) -> None:
+        self.entries_.pop(profile.username, None)
+
+
+def _repr_profile(p: Profile) -> Tuple:
+    if p.isEmpty():
+        return (p.username, p.depth)
+    movies = [[k, v] for (k, v) in p.movies.items()]
+    if p.newest is None:
+        return (p.username, p.depth, list(p.following), movies)
+    return (p.username, p.depth, list(p.following), movies, p.newest)
+
+
+def from_record(record: List) -> Profile:
+    """ Build a profile out of a "q" / "p" journal record. """
+    if record[0] == "q":
+        return Profile(record[1], record[2])
+    movies = Ratings((int(k), v) for (k, v) in record[4])
+    newest = record[5] if len(record) > 5 else None
+    return Profile(record[1], record[2], record[3], movies, newest)
+
+
+def _state_records(parsed: Iterable[Profile],
+                   pending: Iterable[Profile]) -> Iterator[List]:
+    """ Journal records of parsed profiles and of queued / ongoing ones. """
+    for p in parsed:
+        yield ["p"] + list(_repr_profile(p))
+    # ongoing jobs that never finish are picked up again on replay
+    for p in pending:
+        yield ["q", p.username, p.depth]
+
+
+class Checkpoint(NamedTuple):
+    """ How a ProfileCrawler.checkpoint went. """
+    # seconds the crawler was locked for, to take the snapshot
+    pause: float
+    # seconds it took, writing the journal included
+    seconds: float
+    # size of the new journal, in bytes
+    size: int
+
+
+# states of the usernames known to a ProfileCrawler
+QUEUED = 1
+ONGOING = 2
+PARSED = 3
+
+
 class ProfileCrawler:
     """
     Class that wraps the logic behind crawling Letterboxd. Maintains
@@ -42,15 +130,78 @@ class ProfileCrawler:
         - ongoing profiles (actively being parsed)
         - queued profiles (waiting for a free thread)
 
+    Next to them, an index of username -> state (QUEUED / ONGOING /
+    PARSED, see usernames.UsernameStates) answers "was this user seen
+    before" with one lookup.
+    Replacing one of the sets as a whole rebuilds the index.
+
+    If a journal is given, every profile queued or parsed is recorded in
+    it (see lmatch.journal). Once it is due, on_parsed compacts it
+    there and then, unless a checkpointer_ (see lmatch.checkpoint) is set
+    to do it in the background with checkpoint().
+
+    If film_stats_ is set (see lmatch.film_stats), it is kept up to date
+    with the films of every profile parsed.
+
+    Queued profiles are handed out in the order given by priority (see
+    lmatch.job_queue), shallowest first by default.
+
+    The time spent waiting for its lock is observed in
+    lmatch_lock_wait_seconds{lock="profile_crawler"} (see lmatch.metrics).
+
     This class is thread-safe.
     """
 
-    def __init__(self):
-        self.lock_ = threading.Lock()
-        self.parsed_: Set[Profile] = set()
-        self.queued_: Set[Profile] = set()
-        self.ongoing_: Set[Profile] = set()
+    def __init__(self, journal=None, priority=job_queue.by_depth):
+        self.lock_ = metrics.TimedLock("profile_crawler")
+        self.priority_ = priority
+        self.index_ = usernames.UsernameStates()
+        self._parsed = ProfileSet()
+        self._queued = job_queue.JobQueue(priority)
+        self._ongoing: Set[Profile] = set()
         self.keep_parsing = True
+        self.journal_ = journal
+        self.checkpointer_ = None
+        self.film_stats_ = None
+        # one compaction of the journal at a time
+        self.checkpoint_lock_ = threading.Lock()
+
+    @property
+    def parsed_(self) -> ProfileSet:
+        return self._parsed
+
+    @parsed_.setter
+    def parsed_(self, profiles: Iterable[Profile]) -> None:
+        self._parsed = ProfileSet(profiles)
+        self._reindex()
+
+    @property
+    def ongoing_(self) -> Set[Profile]:
+        return self._ongoing
+
+    @ongoing_.setter
+    def ongoing_(self, profiles: Set[Profile]) -> None:
+        self._ongoing = profiles
+        self._reindex()
+
+    @property
+    def queued_(self) -> job_queue.JobQueue:
+        return self._queued
+
+    @queued_.setter
+    def queued_(self, profiles: Iterable[Profile]) -> None:
+        self._queued = job_queue.JobQueue(self.priority_)
+        for p in profiles:
+            self._queued.add(p)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self.index_ = usernames.UsernameStates()
+        for (profiles, state) in ((self._queued, QUEUED),
+                                  (self._ongoing, ONGOING),
+                                  (self._parsed, PARSED)):
+            for p in profiles:
+                self.index_[p.username] = state
 
     def stop_parsing(self) -> None:
         """ Flag to anyone using the crawler that they should stop. """
@@ -65,22 +216,32 @@ class ProfileCrawler:
         all profiles are either fully parsed or waiting to be picked up.
         """
         with self.lock_:
-            while len(self.ongoing_):
-                self.queued_.add(self.ongoing_.pop())
+            while len(self._ongoing):
+                p = self._ongoing.pop()
+                self._queued.add(p)
+                self.index_[p.username] = QUEUED
+
+    def _enqueue(self, username: str, depth: int) -> bool:
+        """ enqueue, without the lock or the journal. True if queued. """
+        if username in self.index_:
+            return False
+        p = Profile(username, depth)
+        self.index_[p.username] = QUEUED
+        self._queued.add(p)
+        return True
 
     def enqueue(self, username: str, depth: int = 0) -> None:
         """
         Adds a user name to the list of profiles to be queued and processed
-        later. If this profile has been parsed in the past, the method
+        later. If this profile has been seen in the past, the method
         will just ignore it silently.
         """
         with self.lock_:
-            if Profile(username) not in self.ongoing_ \
-                    and Profile(username) not in self.parsed_:
-                self.queued_.add(Profile(username, depth))
+            if self._enqueue(username, depth) and self.journal_ is not None:
+                self.journal_.append(["q", username, depth])
 
     def on_parsed(self, username: str, depth: int, following: List[str],
-                  movies: Dict[int, float]) -> None:
+                  movies: Dict[int, float], newest: int = None) -> None:
         """
         This method creates a profile with the details passed as parameter.
         The profile is put on the list of parsed profiles and its
@@ -88,55 +249,182 @@ class ProfileCrawler:
 
         Any other users that are seen in the details of this profiles
         - following, follower, etc) - if never seen before, are adding to the
-        queue to be processed in the future.
+        queue to be processed in the future. They are all handled under
+        a single acquisition of the lock.
+        """
+        self._on_parsed(Profile(username, depth, following, Ratings(movies),
+                                newest))
+
+    def _on_parsed(self, p: Profile) -> None:
+        """ on_parsed, of a built profile. """
+        username = p.username
+        depth = p.depth
+        with self.lock_:
+            # straight on the ids of the following list, without looking
+            # the usernames up again
+            name = p.following.table.name
+            state_of = self.index_.get_id
+            bump = self._queued.uses_in_degree
+            queued = []
+            for i in p.following.ids:
+                state = state_of(i)
+                if state == 0:
+                    self.index_.set_id(i, QUEUED)
+                    self._queued.add(Profile(name(i), depth + 1), 1)
+                    queued.append(name(i))
+                elif bump and state == QUEUED:
+                    self._queued.bump(name(i))
+
+            self._queued.discard(p)
+            self._ongoing.discard(p)
+            if self.film_stats_ is not None:
+                # the films it had, if it was parsed before
+                previous = self._parsed.get(p)
+                self.film_stats_.update(
+                    previous.movies if previous is not None else None,
+                    p.movies)
+            self._parsed.discard(p)
+            self._parsed.add(p)
+            self.index_[username] = PARSED
+            if self.journal_ is not None:
+                records = [["q", f, depth + 1] for f in queued]
+                records.append(["p"] + list(_repr_profile(p)))
+                self.journal_.extend(records)
+                if self.journal_.due():
+                    if self.checkpointer_ is None:
+                        self.journal_.compact(self._records())
+                    else:
+                        self.checkpointer_.wake()
+        log.debug("parsed %s at depth %d, %d new profiles queued",
+                  username, depth, len(queued))
+
+    def on_refreshed(self, profile: Profile, following: List[str],
+                     delta: Dict[int, float], newest: int = None) -> None:
+        """
+        Like on_parsed, for a parsed profile that was handed out again by
+        next_job after refresh(): the films in delta (added or re-rated
+        since it was crawled) are merged into the ones it already had.
+        """
+        movies = dict(profile.movies.items())
+        movies.update(delta)
+        self._on_parsed(Profile(profile.username, profile.depth, following,
+                                Ratings(movies), newest))
+
+    def abandon(self, profile: Profile) -> None:
         """
-        for f in following:
-            self.enqueue(f, depth + 1)
+        The job handed out for profile failed. A profile parsed before,
+        queued again by refresh(), goes back to being parsed as it was.
+        Any other is left ongoing, to be queued again by
+        cancel_ongoing_jobs.
+        """
+        with self.lock_:
+            if profile in self._parsed:
+                self._ongoing.discard(profile)
+                self.index_[profile.username] = PARSED
 
-        p = Profile(username, depth, following, movies)
+    def refresh(self) -> int:
+        """
+        Queue every parsed profile again, to be crawled for the films
+        added since (see crawl.crawl_recent). They stay parsed in the
+        meantime. Returns how many were queued.
+        """
         with self.lock_:
-            print(p.username, p.depth)
-            self.parsed_.add(p)
-            self.ongoing_.discard(p)
+            before = len(self._queued)
+            for p in self._parsed:
+                self._queued.add(p)
+            return len(self._queued) - before
 
-    def next_job(self) -> Union[None, str]:
+    def next_job(self, max_depth: int = None) -> Union[None, Profile]:
         """
-        Get a "random" job out of the queue of profiles. If there are
-        no profiles waiting, returns None.
+        Get the job with the highest priority out of the queue of profiles,
+        among the ones no deeper than max_depth if given: the others stay
+        queued. If there are no profiles waiting, returns None.
 
         Warning: this profile is immediately removed from
         queued and moved to ongoing, despite of whether or not
         the client does something with it.
         """
         with self.lock_:
-            if len(self.queued_) == 0:
+            try:
+                popped_profile = self._queued.pop(max_depth)
+            except KeyError:
                 return None
-
-            popped_profile = self.queued_.pop()
-            self.ongoing_.add(popped_profile)
+            self._ongoing.add(popped_profile)
+            self.index_[popped_profile.username] = ONGOING
             return popped_profile
 
+    def counts(self) -> Tuple[int, int, int]:
+        """ (parsed, ongoing, queued) """
+        with self.lock_:
+            return (len(self._parsed), len(self._ongoing), len(self._queued))
+
+    def parsed_profiles(self) -> Iterator[Profile]:
+        """ The profiles parsed so far. """
+        with self.lock_:
+            return iter(list(self._parsed))
+
     def dump(self) -> Dict:
         """ Dump the whole internal stte as a dictionary. """
         def repr_set(s):
-            def repr_p(p):
-                if p.isEmpty():
-                    return (p.username, p.depth)
-                movies = [[k, v] for (k, v) in p.movies.items()]
-                return (p.username, p.depth, p.following, movies)
-
-            return [repr_p(p) for p in s]
+            return [_repr_profile(p) for p in s]
 
-        return {"parsed": repr_set(self.parsed_),
-                "queued": repr_set(self.queued_)}
+        return {"parsed": repr_set(self._parsed),
+                "queued": repr_set(self._queued)}
 
     def loads(self, data: str) -> None:
         """ Load state from a string. """
         d = json.loads(data)
-        self.queued_ = set()
+        self._queued = job_queue.JobQueue(self.priority_)
         for p in d["queued"]:
-            self.queued_.add(Profile(p[0], p[1]))
+            self._queued.add(Profile(p[0], p[1]))
 
         for p in d["parsed"]:
-            movies = {int(k): v for (k, v) in p[3]}
-            self.parsed_.add(Profile(p[0], p[1], p[2], movies))
+            movies = Ratings((int(k), v) for (k, v) in p[3])
+            self._parsed.add(Profile(p[0], p[1], p[2], movies))
+        self._reindex()
+
+    def _records(self) -> Iterator[List]:
+        """ Journal records describing the current state. Not locked. """
+        return _state_records(self._parsed, self._queued | self._ongoing)
+
+    def compact_journal(self) -> None:
+        """ Rewrite the journal with the current state only. """
+        with self.checkpoint_lock_, self.lock_:
+            self.journal_.compact(self._records())
+
+    def checkpoint(self) -> Checkpoint:
+        """
+        compact_journal, without holding up the crawl while the journal is
+        written. Profiles are never modified, only replaced, so a snapshot
+        of the state is a copy of the sets that hold them: that is all
+        that is done under the lock. They are written to the journal
+        after, while the crawl goes on (see Journal.begin_compaction).
+        """
+        with self.checkpoint_lock_:
+            start = time.perf_counter()
+            with self.lock_:
+                parsed = list(self._parsed)
+                pending = list(self._queued) + list(self._ongoing)
+                self.journal_.begin_compaction()
+            pause = time.perf_counter() - start
+
+            size = self.journal_.end_compaction(
+                _state_records(parsed, pending))
+            return Checkpoint(pause, time.perf_counter() - start, size)
+
+    def replay(self, records: Iterable[List]) -> None:
+        """
+        Apply journal records, in order, on top of the current state. Meant
+        to be used to recover a crawl before it (re)starts.
+        """
+        for record in records:
+            p = from_record(record)
+            if record[0] == "q":
+                if p not in self._parsed:
+                    self._queued.add(p)
+                    self.index_[p.username] = QUEUED
+            else:
+                self._queued.discard(p)
+                self._parsed.discard(p)
+                self._parsed.add(p)
+                self.index_[p.username] = PARSED
@@ -0,0 +1,36 @@
+from collections.abc import Set
+from typing import TYPE_CHECKING, Dict, Iterator, Union
+if TYPE_CHECKING:
+    from lmatch.profile_crawler import Profile
+
+
+class UsernameSet(Set):
+    """
+    Base of the sets of profiles held in a username -> profile dict,
+    entries_. Profiles are equal when their usernames are, so a plain
+    set can't hand back the one it holds for a username without a scan:
+    this one can (get).
+
+    Subclasses add and remove the entries. Not thread-safe.
+    """
+
+    def __init__(self):
+        self.entries_: Dict[str, "Profile"] = {}
+
+    @classmethod
+    def _from_iterable(cls, it):
+        # results of the set operators (|, &, ...) are plain sets
+        return set(it)
+
+    def __contains__(self, profile) -> bool:
+        return profile.username in self.entries_
+
+    def __iter__(self) -> Iterator["Profile"]:
+        return iter(self.entries_.values())
+
+    def __len__(self) -> int:
+        return len(self.entries_)
+
+    def get(self, profile: "Profile") -> Union[None, "Profile"]:
+        """ The profile held with the username of profile, if any. """
+        return self.entries_.get(profile.username)
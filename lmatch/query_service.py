@@ -0,0 +1,295 @@
+"""
+Long-running match service: the ratings matrix of a crawl
+(crawl.ratings, see lmatch.ratings) is memory-mapped once, with a
+SimilarityEngine built on top of it, and queries are answered over HTTP,
+on localhost or on a Unix socket, until the service is stopped. When the
+file is replaced, by the crawler every --ratings-interval (see
+lmatch.checkpoint) or at exit, the new one is loaded in the background
+and swapped in between two queries.
+
+    GET /match?user=U[&metric=diff][&limit=100]
+        {"matches": [[username, films in common, score], ...]}, best
+        first, the way stats.py lists them
+    GET /top?user=U[&k=10][&metric=diff]
+        {"matches": ...}, the k best only (see neighbours.top_k)
+    GET /common?user=U&other=V
+        {"films": [[film id, rating of U, rating of V], ...]}
+    GET /status
+        what is loaded, and how many times it was reloaded
+
+Every answer has the "generation" of the matrix it comes from. Unknown
+users are 404s, bad parameters 400s.
+
+    python3 serve.py --port 8080
+    curl 'localhost:8080/top?user=someone&k=20&metric=pearson'
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import http.client
+import socketserver
+import numpy as np
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Tuple
+from lmatch import neighbours, similarity
+from lmatch.ratings import RatingsMatrix
+
+log = logging.getLogger(__name__)
+
+
+class _State(NamedTuple):
+    """ One loaded matrix, never modified: queries hold on to it. """
+    matrix: RatingsMatrix
+    engine: similarity.SimilarityEngine
+    generation: int
+    # (inode, mtime, size) of the file it was loaded from
+    stamp: Tuple[int, int, int]
+    loaded: float
+
+
+def _stamp(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class QueryService:
+    """
+    Answers queries on the ratings matrix saved at path. The file is
+    checked every `poll` seconds, in a background thread, and loaded
+    again when it changed. It must be replaced, not rewritten in place,
+    since it is memory-mapped (RatingsMatrix.save does).
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, path: str, poll: float = 1.0):
+        self.path = path
+        self.poll = poll
+        self.reloads = 0
+        self.reload_lock_ = threading.Lock()
+        self.state_ = self._load(0)
+        self.stopped_ = threading.Event()
+        self.watcher_ = threading.Thread(target=self._watch, daemon=True)
+        self.watcher_.start()
+
+    def _load(self, generation: int) -> _State:
+        start = time.perf_counter()
+        stamp = _stamp(self.path)
+        matrix = RatingsMatrix.load(self.path)
+        state = _State(matrix, similarity.SimilarityEngine(matrix),
+                       generation, stamp, time.time())
+        log.info("Loaded %d profiles from %s in %.2fs (generation %d)",
+                 len(matrix), self.path, time.perf_counter() - start,
+                 generation)
+        return state
+
+    def reload(self) -> bool:
+        """ Load the file again if it changed. Returns whether it did. """
+        with self.reload_lock_:
+            if _stamp(self.path) == self.state_.stamp:
+                return False
+            # queries keep going on the current one in the meantime
+            self.state_ = self._load(self.state_.generation + 1)
+            self.reloads += 1
+            return True
+
+    def _watch(self) -> None:
+        while not self.stopped_.wait(self.poll):
+            try:
+                self.reload()
+            except Exception:
+                log.exception("Failed to reload %s", self.path)
+
+    def _best(self, username: str, k: int, metric: str) -> Tuple[int, List]:
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        state = self.state_
+        engine = state.engine
+        (common, score) = engine.scores(username, metric)
+        common[engine.index_[username]] = 0
+        best = neighbours.top_k(common, score, k, metric)
+        return (state.generation,
+                [(engine.usernames[i], int(common[i]), float(score[i]))
+                 for i in best])
+
+    def matches(self, username: str, metric: str = "diff",
+                limit: int = 100) -> Tuple[int, List]:
+        """
+        (generation, the first limit of SimilarityEngine.matches), the
+        same but without sorting them all.
+        """
+        return self._best(username, limit, metric)
+
+    def top(self, username: str, k: int = 10,
+            metric: str = "diff") -> Tuple[int, List]:
+        """ (generation, the k best matches), see neighbours.top_k. """
+        return self._best(username, k, metric)
+
+    def common(self, username: str, other: str) -> Tuple[int, List]:
+        """ (generation, [(film id, rating, other's rating)]), by film id. """
+        state = self.state_
+        (a, b) = (state.matrix.get(username), state.matrix.get(other))
+        if a is None or b is None:
+            raise KeyError(username if a is None else other)
+        (films, i, j) = np.intersect1d(
+            np.frombuffer(a.ids, dtype=np.int32),
+            np.frombuffer(b.ids, dtype=np.int32),
+            assume_unique=True, return_indices=True)
+        rates_a = np.frombuffer(a.rates, dtype=np.int8)[i]
+        rates_b = np.frombuffer(b.rates, dtype=np.int8)[j]
+        return (state.generation,
+                list(zip(films.tolist(), rates_a.tolist(),
+                         rates_b.tolist())))
+
+    def status(self) -> Dict:
+        state = self.state_
+        return {"path": self.path, "profiles": len(state.matrix),
+                "ratings": len(state.matrix.ids),
+                "generation": state.generation, "loaded": state.loaded,
+                "reloads": self.reloads}
+
+    def close(self) -> None:
+        self.stopped_.set()
+        self.watcher_.join()
+
+    def __repr__(self):
+        return "QueryService({}, generation {}, {} profiles)".format(
+            self.path, self.state_.generation, len(self.state_.matrix))
+
+
+# path -> parameters it needs
+_PARAMETERS = {"/match": ("user",), "/top": ("user",),
+               "/common": ("user", "other")}
+
+
+def _handler(service: QueryService, tcp: bool = True):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, every answer has a Content-Length
+        protocol_version = "HTTP/1.1"
+        # headers and body are written apart, don't let Nagle hold the
+        # body back until the client's delayed ack
+        disable_nagle_algorithm = tcp
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {k: v[-1] for (k, v) in parse_qs(url.query).items()}
+            try:
+                body = self._answer(url.path, query)
+            except KeyError as e:
+                self.send_error(404, "unknown user {}".format(e))
+                return
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            if body is None:
+                self.send_error(404)
+                return
+
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        @staticmethod
+        def _answer(path: str, query: Dict[str, str]):
+            if path == "/status":
+                return service.status()
+            if path not in _PARAMETERS:
+                return None
+            for name in _PARAMETERS[path]:
+                if name not in query:
+                    raise ValueError("missing {}".format(name))
+
+            if path == "/common":
+                (generation, films) = service.common(query["user"],
+                                                     query["other"])
+                return {"generation": generation, "films": films}
+            metric = query.get("metric", "diff")
+            if metric not in similarity.METRICS:
+                raise ValueError("unknown metric {}".format(metric))
+            if path == "/match":
+                (generation, matches) = service.matches(
+                    query["user"], metric, int(query.get("limit", 100)))
+            else:
+                (generation, matches) = service.top(
+                    query["user"], int(query.get("k", 10)), metric)
+            return {"generation": generation, "metric": metric,
+                    "matches": matches}
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn,
+                      socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class QueryServer:
+    """
+    Serves a QueryService over HTTP, on localhost (port 0 picks a free
+    one) or on a Unix socket at socket_path.
+    """
+
+    def __init__(self, service: QueryService, port: int = 0,
+                 host: str = "127.0.0.1", socket_path: str = None):
+        self.socket_path = socket_path
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.httpd_ = _UnixHTTPServer(socket_path,
+                                          _handler(service, tcp=False))
+        else:
+            self.httpd_ = ThreadingHTTPServer((host, port), _handler(service))
+            self.httpd_.daemon_threads = True
+        self.thread_ = threading.Thread(target=self.httpd_.serve_forever,
+                                        daemon=True)
+
+    @property
+    def url(self) -> str:
+        if self.socket_path is not None:
+            return "unix:" + self.socket_path
+        (host, port) = self.httpd_.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self) -> str:
+        self.thread_.start()
+        return self.url
+
+    def serve_forever(self) -> None:
+        self.httpd_.serve_forever()
+
+    def stop(self) -> None:
+        self.httpd_.shutdown()
+        self.httpd_.server_close()
+        if self.socket_path is not None and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ http.client connection to a QueryServer on a Unix socket. """
+
+    def __init__(self, socket_path: str, timeout: float = 30):
+        http.client.HTTPConnection.__init__(self, "localhost",
+                                            timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def connect(url: str, timeout: float = 30) -> http.client.HTTPConnection:
+    """ Keep-alive connection to the QueryServer at url (see its url). """
+    if url.startswith("unix:"):
+        return UnixHTTPConnection(url[len("unix:"):], timeout)
+    return http.client.HTTPConnection(urlsplit(url).netloc, timeout=timeout)
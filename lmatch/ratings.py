@@ -0,0 +1,161 @@
+import os
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Tuple, Union
+
+
+class Ratings(Mapping):
+    """
+    Read-only film id -> rating mapping of a profile, stored as two
+    parallel arrays: the film ids, sorted, and the ratings (in [0, 10]).
+    That takes 5 bytes per rating, where a dict of ints takes 100+.
+
+    Lookups are binary searches. The arrays can also be views over a
+    bigger buffer, e.g. a row of a memory-mapped RatingsMatrix.
+    """
+
+    __slots__ = ("ids", "rates")
+
+    def __init__(self, movies: Union[Mapping, Iterable] = ()):
+        pairs = sorted(dict(movies).items())
+        self.ids = array('i', [k for (k, _) in pairs])
+        self.rates = array('b', [v for (_, v) in pairs])
+
+    @classmethod
+    def from_buffers(cls, ids, rates) -> "Ratings":
+        """ Wrap already sorted arrays (or memoryviews), without copying. """
+        r = cls.__new__(cls)
+        r.ids = ids
+        r.rates = rates
+        return r
+
+    def __getitem__(self, film_id: int) -> int:
+        i = bisect_left(self.ids, film_id)
+        if i == len(self.ids) or self.ids[i] != film_id:
+            raise KeyError(film_id)
+        return self.rates[i]
+
+    def __contains__(self, film_id) -> bool:
+        i = bisect_left(self.ids, film_id)
+        return i != len(self.ids) and self.ids[i] == film_id
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.ids, self.rates)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class RatingsMatrix:
+    """
+    Ratings of many profiles in one compressed sparse row (CSR) matrix:
+    row i holds the ratings of usernames[i], in
+        ids[offsets[i]:offsets[i + 1]] / rates[offsets[i]:offsets[i + 1]]
+
+    It can be saved as raw buffers and loaded back with mmap, in which
+    case rows are views over the file and nothing is copied.
+
+    File layout (native byte order):
+        b"LMR1", profiles (q), ratings (q)
+        offsets: (profiles + 1) x int64
+        ids:     ratings x int32
+        rates:   ratings x int8
+        usernames, utf-8, separated by newlines
+    """
+
+    MAGIC = b"LMR1"
+    # native byte order like the arrays, with standard sizes
+    HEADER = struct.Struct("=4sqq")
+
+    def __init__(self, usernames: List[str], offsets, ids, rates):
+        self.usernames = usernames
+        self.offsets = offsets
+        self.ids = ids
+        self.rates = rates
+        self.index_ = {u: i for (i, u) in enumerate(usernames)}
+        self.mmap_ = None
+
+    @classmethod
+    def from_profiles(cls, profiles: Iterable) -> "RatingsMatrix":
+        """ Build the matrix out of (username, ratings mapping) pairs. """
+        usernames = []
+        offsets = array('q', [0])
+        ids = array('i')
+        rates = array('b')
+        for (username, movies) in profiles:
+            if not isinstance(movies, Ratings):
+                movies = Ratings(movies)
+            usernames.append(username)
+            ids.extend(movies.ids)
+            rates.extend(movies.rates)
+            offsets.append(len(ids))
+
+        return cls(usernames, offsets, ids, rates)
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def row(self, i: int) -> Ratings:
+        (start, end) = (self.offsets[i], self.offsets[i + 1])
+        return Ratings.from_buffers(self.ids[start:end],
+                                    self.rates[start:end])
+
+    def get(self, username: str) -> Union[None, Ratings]:
+        i = self.index_.get(username)
+        return self.row(i) if i is not None else None
+
+    def rows(self) -> Iterator[Tuple[str, Ratings]]:
+        for (i, username) in enumerate(self.usernames):
+            yield (username, self.row(i))
+
+    def save(self, path: str) -> None:
+        """
+        Write the matrix to path. The file is replaced, not rewritten, so
+        that whoever has the previous one mapped keeps it whole.
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(self.usernames),
+                                     len(self.ids)))
+            f.write(memoryview(self.offsets).cast('B'))
+            f.write(memoryview(self.ids).cast('B'))
+            f.write(memoryview(self.rates).cast('B'))
+            f.write("\n".join(self.usernames).encode())
+            # on disk before it takes the place of the previous one
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "RatingsMatrix":
+        """ Memory-map a matrix written by save(). """
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, n_profiles, n_ratings) = cls.HEADER.unpack_from(buf)
+        if magic != cls.MAGIC:
+            raise ValueError("{} is not a ratings matrix".format(path))
+
+        view = memoryview(buf)
+        start = cls.HEADER.size
+        end = start + 8 * (n_profiles + 1)
+        offsets = view[start:end].cast('q')
+        (start, end) = (end, end + 4 * n_ratings)
+        ids = view[start:end].cast('i')
+        (start, end) = (end, end + n_ratings)
+        rates = view[start:end].cast('b')
+        names = bytes(view[end:]).decode()
+        usernames = names.split("\n") if n_profiles else []
+
+        m = cls(usernames, offsets, ids, rates)
+        m.mmap_ = buf
+        return m
@@ -0,0 +1,124 @@
+import numpy as np
+import scipy.sparse
+from typing import List, Tuple
+from lmatch.ratings import RatingsMatrix
+
+METRICS = ("diff", "cosine", "pearson")
+
+
+class SimilarityEngine:
+    """
+    Compares the ratings of one profile against every other profile at
+    once, with sparse matrix products over the profile x film ratings
+    matrix. The matrix is built once, from a RatingsMatrix, sharing its
+    buffers where possible.
+
+    A rating of 0 means the film was watched but not rated. Metrics:
+        - diff: number of films in common and mean rating difference,
+          the way stats.py has always done it: films the other profile
+          didn't rate are skipped, films the main profile didn't rate
+          count with a rating of 0.
+        - cosine: cosine of the two rating vectors.
+        - pearson: Pearson correlation over the films both rated.
+    """
+
+    def __init__(self, matrix: RatingsMatrix):
+        self.usernames = matrix.usernames
+        self.index_ = {u: i for (i, u) in enumerate(self.usernames)}
+
+        indptr = np.frombuffer(matrix.offsets, dtype=np.int64)
+        indices = np.frombuffer(matrix.ids, dtype=np.int32)
+        data = np.frombuffer(matrix.rates, dtype=np.int8).astype(np.float64)
+        n_films = int(indices.max()) + 1 if len(indices) else 1
+
+        # ratings, with "watched" (explicit 0s) kept as stored entries
+        self.R = scipy.sparse.csr_matrix((data, indices, indptr),
+                                         shape=(len(self.usernames), n_films))
+        # 1 where a film was rated / watched (rated or not)
+        self.B = (self.R != 0).astype(np.float64)
+        self.W = self.R.copy()
+        self.W.data[:] = 1
+        self.R2 = self.R.multiply(self.R).tocsr()
+        self.norms_ = np.sqrt(np.asarray(self.R2.sum(axis=1)).ravel())
+
+    @staticmethod
+    def _product(a, b) -> np.ndarray:
+        """ a @ b.T, as a dense array. """
+        # a handful of rows: sparse x dense is a lot faster
+        if b.shape[0] <= 8:
+            return np.asarray(a @ b.T.toarray())
+        return np.asarray((a @ b.T).todense())
+
+    @staticmethod
+    def _rows(m, rows):
+        """ m[rows], m itself rather than a copy of it for None. """
+        return m if rows is None else m[rows]
+
+    def _diff(self, mains, others):
+        (Bo, Ro) = (self._rows(self.B, others), self._rows(self.R, others))
+        common = self._product(Bo, self.W[mains])
+        deltas = self._product(Ro, self.W[mains]) \
+            - self._product(Bo, self.R[mains])
+        mean = np.divide(deltas, common, out=np.zeros_like(deltas),
+                         where=deltas != 0)
+        return (common, mean)
+
+    def _cosine(self, mains, others):
+        common = self._product(self._rows(self.B, others), self.B[mains])
+        dot = self._product(self._rows(self.R, others), self.R[mains])
+        norms = np.outer(self._rows(self.norms_, others),
+                         self.norms_[mains])
+        return (common, np.divide(dot, norms, out=np.zeros_like(dot),
+                                  where=norms != 0))
+
+    def _pearson(self, mains, others):
+        (Bo, Bm) = (self._rows(self.B, others), self.B[mains])
+        (Ro, Rm) = (self._rows(self.R, others), self.R[mains])
+        n = self._product(Bo, Bm)
+        sx = self._product(Ro, Bm)
+        sy = self._product(Bo, Rm)
+        sxx = self._product(self._rows(self.R2, others), Bm)
+        syy = self._product(Bo, self.R2[mains])
+        sxy = self._product(Ro, Rm)
+
+        num = n * sxy - sx * sy
+        den = np.sqrt(np.clip(n * sxx - sx * sx, 0, None)
+                      * np.clip(n * syy - sy * sy, 0, None))
+        return (n, np.divide(num, den, out=np.zeros_like(num),
+                             where=den != 0))
+
+    def block_scores(self, mains, others=None, metric: str = "diff"):
+        """
+        Scores of a block of profiles against another one (everyone by
+        default), given as row numbers. Returns two arrays shaped
+        (others, mains): the number of films in common and the score.
+        """
+        if metric not in METRICS:
+            raise ValueError("unknown metric {}".format(metric))
+        return getattr(self, "_" + metric)(mains, others)
+
+    def scores(self, username: str, metric: str = "diff"):
+        """
+        Returns two arrays, aligned with self.usernames: the number of
+        films in common with `username` and the score for `metric`.
+        """
+        i = self.index_[username]
+        (common, score) = self.block_scores([i], metric=metric)
+        return (common[:, 0], score[:, 0])
+
+    def matches(self, username: str,
+                metric: str = "diff") -> List[Tuple[str, int, float]]:
+        """
+        (username, films in common, score) of every other profile with
+        films in common, best matches first: smallest absolute mean
+        difference for "diff", highest score otherwise.
+        """
+        (common, score) = self.scores(username, metric)
+        keep = common > 0
+        keep[self.index_[username]] = False
+        rows = np.flatnonzero(keep)
+
+        key = np.abs(score[rows]) if metric == "diff" else -score[rows]
+        rows = rows[np.argsort(key, kind="stable")]
+        return [(self.usernames[r], int(common[r]), float(score[r]))
+                for r in rows]
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into a single one.
+
+    The first thread to ask for a key runs the function, any other thread
+    asking for that same key while it is running waits and gets the same
+    result (or exception). Calls for different keys run in parallel.
+
+    Nothing is cached once a call finishes; that is up to the caller.
+    lock can be any lock, as for lru.LruCache.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, lock=None):
+        self.lock_ = lock if lock is not None else threading.Lock()
+        self.calls_: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self.lock_:
+            call = self.calls_.get(key)
+            leader = call is None
+            if leader:
+                self.calls += 1
+                call = Future()
+                self.calls_[key] = call
+            else:
+                self.shared += 1
+
+        # someone else is already on it, wait for their result
+        if not leader:
+            return call.result()
+
+        try:
+            call.set_result(fn())
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self.lock_:
+                del self.calls_[key]
+
+        return call.result()
@@ -0,0 +1,213 @@
+"""
+Client-side throttling of the requests made to the website: a rate
+limiter shared by every worker, which slows down when the server pushes
+back (429 / 503, Retry-After), and retries with exponential backoff.
+"""
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Callable, Union
+
+# statuses worth trying again, after a while
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# statuses that mean we are going too fast
+THROTTLE_STATUSES = frozenset([429, 503])
+
+
+class TooManyRetries(Exception):
+    """ A request kept failing, after all the retries. """
+
+
+class RateLimiter:
+    """
+    Token bucket: allows `rate` requests per second on average, in bursts
+    of up to `burst`. Callers reserve a token and wait for as long as
+    reserve() says, so the bucket itself never blocks.
+
+    The rate adapts, additive increase / multiplicative decrease: when
+    the server throttles us it is halved (down to min_rate, and at most
+    once a second, as the requests in flight get throttled together) and
+    nobody gets a token before the Retry-After the server asked for. Every
+    successful request then adds a bit of rate back, `increase` requests
+    per second per second, up to max_rate.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, rate: float = 10, burst: int = None,
+                 min_rate: float = 0.5, max_rate: float = None,
+                 increase: float = 0.5, clock: Callable = time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase = increase
+        self.clock_ = clock
+        self.lock_ = threading.Lock()
+        self.tokens_ = float(self.burst)
+        self.updated_ = clock()
+        self.paused_until_ = 0.0
+        self.decreased_ = None
+
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens_ = min(self.burst,
+                           self.tokens_ + (now - self.updated_) * self.rate)
+        self.updated_ = now
+
+    def reserve(self) -> float:
+        """ Take a token. Returns how many seconds to wait before using it. """
+        with self.lock_:
+            now = self.clock_()
+            self._refill(now)
+            self.tokens_ -= 1
+            wait = max(-self.tokens_ / self.rate if self.tokens_ < 0 else 0,
+                       self.paused_until_ - now)
+            self.requests += 1
+            self.waited += wait
+            return wait
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_throttled(self, retry_after: float = None) -> None:
+        """ The server answered 429 / 503. """
+        with self.lock_:
+            now = self.clock_()
+            self._refill(now)
+            self.throttled += 1
+            if self.decreased_ is None or now - self.decreased_ >= 1:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.decreased_ = now
+            if retry_after is not None:
+                self.paused_until_ = max(self.paused_until_,
+                                         now + retry_after)
+
+    def on_success(self) -> None:
+        with self.lock_:
+            if self.rate < self.max_rate:
+                self._refill(self.clock_())
+                self.rate = min(self.max_rate,
+                                self.rate + self.increase / self.rate)
+
+    def __repr__(self):
+        return "{:.1f} requests/s. {} requests. {} throttled. " \
+               "{:.1f}s waited.".format(self.rate, self.requests,
+                                        self.throttled, self.waited)
+
+
+def retry_after(headers) -> Union[None, float]:
+    """ Seconds asked for by a Retry-After header, None if there isn't one. """
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """ Exponential backoff with full jitter. """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ThrottledSession:
+    """
+    Wraps a requests-like session so that its GETs go through a
+    RateLimiter, and are retried (up to `retries` times, with exponential
+    backoff) on the exceptions in `errors` (requests' are OSErrors) and on
+    the statuses in RETRY_STATUSES. Other responses, errors included, are
+    returned as they are.
+
+    This class is thread-safe if the session is.
+    """
+
+    def __init__(self, session, limiter: RateLimiter, retries: int = 5,
+                 backoff: float = 0.5, max_backoff: float = 60,
+                 errors=(OSError,)):
+        self.session_ = session
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.errors_ = errors
+        self.lock_ = threading.Lock()
+        self.retried = 0
+
+    def _delay(self, attempt: int, response) -> float:
+        """
+        How long to wait before trying again, after a failed attempt.
+        Raises if there are no retries left.
+        """
+        if attempt >= self.retries:
+            raise TooManyRetries(
+                "gave up after {} attempts".format(attempt + 1))
+        with self.lock_:
+            self.retried += 1
+
+        delay = backoff(attempt, self.backoff, self.max_backoff)
+        if response is not None \
+                and response.status_code in THROTTLE_STATUSES:
+            wait = retry_after(response.headers)
+            self.limiter.on_throttled(wait)
+            delay = max(delay, wait or 0)
+        return delay
+
+    def get(self, url: str, **kwargs):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = self.session_.get(url, **kwargs)
+            except self.errors_:
+                if attempt >= self.retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.limiter.on_success()
+                    return response
+                # gives the connection back if the body was streamed
+                response.close()
+
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    async def get_async(self, url: str, **kwargs):
+        """ get(), for a session with an async get (httpx.AsyncClient). """
+        attempt = 0
+        while True:
+            await self.limiter.acquire_async()
+            try:
+                response = await self.session_.get(url, **kwargs)
+            except self.errors_:
+                if attempt >= self.retries:
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.limiter.on_success()
+                    return response
+
+            await asyncio.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    def __repr__(self):
+        return "{} {} retried.".format(self.limiter, self.retried)
@@ -0,0 +1,154 @@
+"""
+Usernames seen by the crawler, each stored once and given an integer id.
+
+The same usernames show up over and over: as queued profiles, and in the
+following list of every profile that follows them. Profiles keep the
+string from the table, and their following lists as arrays of ids.
+"""
+import threading
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List
+
+
+class UsernameTable:
+    """
+    Two-way username <-> id mapping. Ids are handed out in order, from 0,
+    and never reused.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        self.ids_: Dict[str, int] = {}
+        self.names_: List[str] = []
+
+    def id(self, username: str) -> int:
+        """ Id of username, giving it one if it is new. """
+        i = self.ids_.get(username)
+        if i is not None:
+            return i
+        with self.lock_:
+            i = self.ids_.get(username)
+            if i is None:
+                i = len(self.names_)
+                self.names_.append(username)
+                self.ids_[username] = i
+            return i
+
+    def intern(self, username: str) -> str:
+        """ The table's own copy of username. """
+        return self.names_[self.id(username)]
+
+    def name(self, i: int) -> str:
+        return self.names_[i]
+
+    def __contains__(self, username) -> bool:
+        return username in self.ids_
+
+    def __len__(self) -> int:
+        return len(self.names_)
+
+
+# table shared by every profile of the process
+TABLE = UsernameTable()
+
+
+class Following(Sequence):
+    """
+    Read-only list of the usernames a profile follows, stored as an array
+    of ids of a UsernameTable: 4 bytes per user, where a list of strings
+    takes 8 for the pointer plus the string itself.
+
+    Compares equal to any sequence with the same usernames.
+    """
+
+    __slots__ = ("ids", "table")
+
+    def __init__(self, usernames: Iterable[str] = (),
+                 table: UsernameTable = None):
+        self.table = table = table if table is not None else TABLE
+        self.ids = array('i', [table.id(u) for u in usernames])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.table.name(j) for j in self.ids[i]]
+        return self.table.name(self.ids[i])
+
+    def __iter__(self) -> Iterator[str]:
+        names = self.table.names_
+        return (names[i] for i in self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, username) -> bool:
+        i = self.table.ids_.get(username)
+        return i is not None and i in self.ids
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for (a, b) in zip(self, other))
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (Following, (list(self),))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class UsernameStates:
+    """
+    username -> state mapping for small non-zero int states, stored in a
+    bytearray indexed by the ids of a UsernameTable: one byte per user.
+    Users that were never given a state are not in it.
+
+    Not thread-safe.
+    """
+
+    def __init__(self, table: UsernameTable = None):
+        self.table = table if table is not None else TABLE
+        self.states_ = bytearray()
+        self.known_ = 0
+
+    def reserve(self, n: int) -> None:
+        """ Make room for the states of ids below n. """
+        if n > len(self.states_):
+            self.states_.extend(bytes(max(n - len(self.states_),
+                                          len(self.states_))))
+
+    def get_id(self, i: int) -> int:
+        """ State of the user with id i, 0 if it has none. """
+        return self.states_[i] if i < len(self.states_) else 0
+
+    def set_id(self, i: int, state: int) -> None:
+        self.reserve(i + 1)
+        if self.states_[i] == 0:
+            self.known_ += 1
+        self.states_[i] = state
+
+    def get(self, username: str, default=None):
+        i = self.table.ids_.get(username)
+        if i is None or i >= len(self.states_) or self.states_[i] == 0:
+            return default
+        return self.states_[i]
+
+    def __getitem__(self, username: str) -> int:
+        state = self.get(username)
+        if state is None:
+            raise KeyError(username)
+        return state
+
+    def __setitem__(self, username: str, state: int) -> None:
+        self.set_id(self.table.id(username), state)
+
+    def __contains__(self, username) -> bool:
+        return self.get(username) is not None
+
+    def __len__(self) -> int:
+        return self.known_
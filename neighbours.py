@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import argparse
+from lmatch import neighbours, similarity
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="precompute the most similar profiles of every "
+                    "profile crawled, or query them.")
+    parser.add_argument(
+        "--query",
+        metavar="LETTERBOXD_PROFILE",
+        help="print the neighbours of this profile instead of updating",
+    )
+    parser.add_argument(
+        "-k",
+        type=int,
+        default=50,
+        help="neighbours kept per profile, for a new index (default: 50)",
+    )
+    parser.add_argument(
+        "--metric",
+        choices=similarity.METRICS,
+        default="diff",
+        help="how to compare profiles, for a new index (default: diff)",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="worker processes (default: one per cpu)",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="throw away the index and compute everything again",
+    )
+    args = parser.parse_args(argv)
+
+    ratings_filename = 'crawl.ratings'
+    index_filename = 'crawl.neighbours'
+
+    if args.rebuild and os.path.exists(index_filename):
+        os.remove(index_filename)
+
+    index = neighbours.NeighbourIndex(index_filename, args.k, args.metric)
+
+    if args.query is not None:
+        for (username, common, score) in index.lookup(args.query):
+            print("{:20} {:5} movies in common. {}: {}".format(
+                username, common, index.metric, score))
+        return
+
+    start = time.time()
+    computed = neighbours.update(ratings_filename, index, args.processes)
+    print("{} profiles updated in {:.1f}s.".format(computed,
+                                                   time.time() - start))
+    index.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
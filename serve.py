@@ -0,0 +1,63 @@
+import sys
+import logging
+import argparse
+from lmatch import query_service
+
+log = logging.getLogger("serve")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="answer match queries on the profiles crawled, over "
+                    "HTTP, until interrupted. The ratings are loaded once "
+                    "and again whenever the crawler saves new ones.")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="port to listen to on localhost (default: 8080)",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        metavar="PATH",
+        help="listen on a Unix socket at PATH instead",
+    )
+    parser.add_argument(
+        "--ratings",
+        default="crawl.ratings",
+        metavar="PATH",
+        help="ratings matrix to serve (default: crawl.ratings)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=1.0,
+        metavar="SECONDS",
+        help="how often to check for new ratings (default: 1)",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=args.log_level,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    service = query_service.QueryService(args.ratings, poll=args.poll)
+    server = query_service.QueryServer(service, port=args.port,
+                                       socket_path=args.socket)
+    log.info("Serving %s at %s", service, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        service.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,9 +1,33 @@
+import os
 import sys
 import json
 import argparse
 import statistics
 from requests import session
-from lmatch import profile_crawler, parse
+from lmatch import profile_crawler, parse, journal, ratings, similarity
+
+METRIC_NAMES = {"diff": "Avg rating diff",
+                "cosine": "Cosine",
+                "pearson": "Pearson"}
+
+
+def parsed_profiles(journal_filename, dump_filename):
+    """
+    Iterate over the parsed profiles. Streams them out of the crawl
+    journal if there is one, otherwise loads the dump of older versions.
+    A profile parsed more than once shows up more than once.
+    """
+    if os.path.exists(journal_filename):
+        for record in journal.read(journal_filename):
+            if record[0] == "p":
+                yield profile_crawler.from_record(record)
+        return
+
+    crawler = profile_crawler.ProfileCrawler()
+    with open(dump_filename, 'r') as infile:
+        crawler.loads(infile.read())
+        infile.close()
+    yield from crawler.parsed_
 
 
 def main(argv=None):
@@ -13,52 +37,39 @@ def main(argv=None):
         metavar="LETTERBOXD_PROFILE",
         help="username for which we want to generate stats.",
     )
+    parser.add_argument(
+        "--metric",
+        choices=similarity.METRICS,
+        default="diff",
+        help="how to compare profiles (default: mean rating difference)",
+    )
     args = parser.parse_args(argv)
     first_profile = args.first_profile
 
-    crawler = profile_crawler.ProfileCrawler()
-
+    journal_filename = 'crawl.journal'
     dump_filename = 'dump.lmatch'
-    with open(dump_filename, 'r') as infile:
-        crawler.loads(infile.read())
-        infile.close()
 
+    # the last time a profile was parsed is the one that counts
+    profiles = {}
     main_profile = None
-    for p in crawler.parsed_:
+    for p in parsed_profiles(journal_filename, dump_filename):
+        profiles[p.username] = p.movies
         if p.username == first_profile:
             main_profile = p
-            break
 
     if main_profile is None:
         print("User not found.")
         sys.exit(1)
 
-    matches = []
-    for p in crawler.parsed_:
-        if p.username == main_profile.username:
-            continue
-
-        deltas = []
-
-        for this_name, this_rating in p.movies.items():
-            if this_rating is 0 or this_name not in main_profile.movies:
-                continue
-
-            (main_name, main_rating) = (this_name, main_profile.movies[this_name])
-            deltas.extend([this_rating - main_rating])
-
-        matches.extend([[p.username,
-                         len(deltas),
-                         (sum(deltas) * 1.0 / len(deltas)) if sum(deltas) else
-                         0]])
-
-        matches = sorted(matches, key=lambda m: abs(m[2]))
+    engine = similarity.SimilarityEngine(
+        ratings.RatingsMatrix.from_profiles(profiles.items()))
+    del profiles
 
-    for match in matches:
-        if match[1]:
-            print("[{}] {:20} {:5} movies in common. Avg rating diff: {}"
-                    .format('x' if match[0] in main_profile.following else ' ',
-                        match[0], match[1], match[2]))
+    for match in engine.matches(main_profile.username, args.metric):
+        print("[{}] {:20} {:5} movies in common. {}: {}"
+              .format('x' if match[0] in main_profile.following else ' ',
+                      match[0], match[1], METRIC_NAMES[args.metric],
+                      match[2] or 0))
 
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -0,0 +1,159 @@
+import asyncio
+import unittest
+from lmatch import async_crawler, parse, profile_crawler
+from benchmarks.stub_server import StubSite
+Profile = profile_crawler.Profile
+ProfileCrawler = profile_crawler.ProfileCrawler
+
+
+class FakeFilms:
+    def __init__(self):
+        self.ids = {}
+
+    def lookup(self, url):
+        return self.ids.get(url)
+
+    def load(self, url):
+        return None
+
+    def preload(self, urls):
+        pass
+
+    def store(self, url, film):
+        self.ids[url] = len(self.ids) + 1
+        return self.ids[url]
+
+
+class TestAsyncCrawler(unittest.TestCase):
+    def setUp(self):
+        self.site = StubSite(40)
+        self.fetched = []
+        self.films = FakeFilms()
+
+    async def fetch(self, path):
+        self.fetched.append(path)
+        await asyncio.sleep(0)
+        page = self.site.render(path)
+        if page is None:
+            raise IOError(path)
+        return page
+
+    def engine(self, crawler, max_depth):
+        return async_crawler.AsyncCrawler(crawler, self.fetch, self.films,
+                                          workers=20, max_depth=max_depth)
+
+    def test_crawl_depth_0(self):
+        c = ProfileCrawler()
+        c.enqueue("u0")
+        asyncio.run(self.engine(c, 0).run())
+
+        self.assertEqual({Profile("u0")}, c.parsed_)
+        # like LbThread, workers leave the jobs over the depth limit queued
+        self.assertEqual(26, len(c.queued_))
+        self.assertEqual(0, len(c.ongoing_))
+
+        p = c.parsed_.pop()
+        self.assertEqual(26, len(p.following))
+        self.assertEqual(len(self.films.ids), len(p.movies))
+
+    def test_crawl_whole_population(self):
+        c = ProfileCrawler()
+        c.enqueue("u0")
+        asyncio.run(self.engine(c, 10).run())
+
+        self.assertEqual(40, len(c.parsed_))
+        self.assertEqual(0, len(c.queued_))
+        self.assertEqual(0, len(c.ongoing_))
+
+    def test_pages_are_reassembled_in_order(self):
+        c = ProfileCrawler()
+        engine = self.engine(c, 0)
+
+        async def crawl():
+            engine.in_flight_ = asyncio.Semaphore(3)
+            return await engine.crawl("u0/films/page/1",
+                                      parse.movies_watched)
+
+        expected = []
+        for n in range(1, 8):
+            expected.extend(parse.movies_watched(
+                self.site.render("u0/films/page/{}".format(n))))
+
+        self.assertEqual(expected, asyncio.run(crawl()))
+        self.assertEqual(7, len(self.fetched))
+
+    def test_pages_without_count_are_walked(self):
+        c = ProfileCrawler()
+        engine = self.engine(c, 0)
+
+        async def crawl():
+            engine.in_flight_ = asyncio.Semaphore(3)
+            return await engine.crawl("u0/following/page/1", parse.following)
+
+        self.assertEqual(26, len(asyncio.run(crawl())))
+        self.assertEqual(["u0/following/page/1", "u0/following/page/2/"],
+                         self.fetched)
+
+    def test_films_are_fetched_once(self):
+        c = ProfileCrawler()
+        c.enqueue("u0")
+        c.enqueue("u1")
+        c.enqueue("u2")
+        asyncio.run(self.engine(c, 0).run())
+
+        film_pages = [p for p in self.fetched if p.startswith("/film/")]
+        self.assertEqual(len(set(film_pages)), len(film_pages))
+        self.assertEqual(len(self.films.ids), len(film_pages))
+
+    def test_stop_parsing(self):
+        c = ProfileCrawler()
+        c.enqueue("u0")
+        c.stop_parsing()
+        asyncio.run(self.engine(c, 3).run())
+
+        self.assertEqual(0, len(c.parsed_))
+        self.assertEqual({Profile("u0")}, c.queued_)
+
+    def test_failed_pages_leave_job_ongoing(self):
+        c = ProfileCrawler()
+        c.enqueue("not-a-user")
+        asyncio.run(self.engine(c, 3).run())
+
+        self.assertEqual(0, len(c.parsed_))
+        self.assertEqual({Profile("not-a-user")}, c.ongoing_)
+
+    def test_refresh(self):
+        c = ProfileCrawler()
+        c.enqueue("u0")
+        asyncio.run(self.engine(c, 0).run())
+        movies = dict(next(iter(c.parsed_)).movies.items())
+        del self.fetched[:]
+
+        self.assertEqual(1, c.refresh())
+        asyncio.run(self.engine(c, 0).run())
+        # only the first page by date, which has nothing new
+        self.assertEqual(["u0/films/by/date/page/1"],
+                         [p for p in self.fetched if "/films/" in p])
+        (p,) = c.parsed_
+        self.assertEqual(movies, dict(p.movies.items()))
+        self.assertEqual(26, len(p.following))
+        first = parse.movies_watched(
+            self.site.render("u0/films/by/date/page/1"))[0][0]
+        self.assertEqual(self.films.ids[first], p.newest)
+        self.assertEqual(0, len(c.ongoing_))
+
+    def test_failed_refresh(self):
+        c = ProfileCrawler()
+        c.on_parsed("not-a-user", 0, [], {1: 5}, 1)
+        c.refresh()
+        asyncio.run(self.engine(c, 3).run())
+
+        # back to parsed as it was
+        (p,) = c.parsed_
+        self.assertEqual({1: 5}, dict(p.movies.items()))
+        self.assertEqual(1, p.newest)
+        self.assertEqual(0, len(c.ongoing_))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from lmatch import checkpoint, journal, metrics, profile_crawler, ratings
+try:
+    from lmatch import film_stats
+except ImportError:
+    film_stats = None
+ProfileCrawler = profile_crawler.ProfileCrawler
+
+
+class StatsDao:
+    """ dao.FilmStatsDao keeping what is written, failing if told to. """
+
+    def __init__(self):
+        self.written = {}
+        self.fail = False
+
+    def writeStats(self, film_ids, histograms):
+        if self.fail:
+            raise IOError("down")
+        for (film_id, histogram) in zip(film_ids, histograms):
+            self.written[film_id] = film_stats.aggregate(histogram.tolist())
+        return len(film_ids)
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "crawl.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def crawl(self, crawler, first, last):
+        for i in range(first, last):
+            username = "p{}".format(i)
+            crawler.enqueue(username)
+            crawler.next_job()
+            crawler.on_parsed(username, 0, ["p{}".format(i + 1)],
+                              {i: i % 11})
+
+    def test_crawl_goes_on(self):
+        c = ProfileCrawler(journal.Journal(self.path))
+        self.crawl(c, 0, 100)
+        c.enqueue("z")
+        c.next_job()
+
+        # the crawler is free while the snapshot is written
+        done = []
+        original = journal.Journal.end_compaction
+
+        def end_compaction(j, records):
+            thread = threading.Thread(
+                target=lambda: done.append(self.crawl(c, 100, 200)))
+            thread.start()
+            thread.join(5)
+            return original(j, records)
+
+        journal.Journal.end_compaction = end_compaction
+        try:
+            result = c.checkpoint()
+        finally:
+            journal.Journal.end_compaction = original
+        self.assertEqual([None], done)
+        self.assertEqual(os.path.getsize(self.path), result.size)
+        self.assertTrue(0 <= result.pause <= result.seconds)
+
+        self.crawl(c, 200, 210)
+        c.journal_.close()
+        records = list(journal.read(self.path))
+        r = ProfileCrawler()
+        r.replay(records)
+        self.assertEqual(c.parsed_, r.parsed_)
+        self.assertEqual(c.queued_ | c.ongoing_, r.queued_)
+        movies = {p.username: p.movies for p in r.parsed_profiles()}
+        for p in c.parsed_profiles():
+            self.assertEqual(p.movies, movies[p.username])
+
+    def test_checkpointer(self):
+        registry = metrics.Registry()
+        c = ProfileCrawler(journal.Journal(self.path, compact_every=50))
+        checkpointer = checkpoint.Checkpointer(c, interval=60,
+                                               registry=registry)
+        self.assertIs(checkpointer, c.checkpointer_)
+        self.crawl(c, 0, 60)
+        # woken up by on_parsed, long before the interval is over
+        for _ in range(500):
+            if checkpointer.checkpoints:
+                break
+            threading.Event().wait(.01)
+        checkpointer.close()
+        self.assertIsNone(c.checkpointer_)
+
+        self.assertTrue(checkpointer.checkpoints >= 1)
+        self.assertEqual(checkpointer.checkpoints, registry.histogram(
+            "lmatch_checkpoint_seconds").count)
+        self.assertEqual(checkpointer.last.size,
+                         registry.snapshot()["lmatch_checkpoint_bytes"])
+        c.journal_.close()
+        r = ProfileCrawler()
+        r.replay(journal.read(self.path))
+        self.assertEqual(c.parsed_, r.parsed_)
+
+    def test_ratings(self):
+        c = ProfileCrawler(journal.Journal(self.path))
+        path = os.path.join(self.dir, "crawl.ratings")
+        checkpointer = checkpoint.Checkpointer(
+            c, interval=3600, registry=metrics.Registry(), ratings_path=path,
+            ratings_interval=0)
+        self.crawl(c, 0, 10)
+        checkpointer.checkpoint()
+
+        matrix = ratings.RatingsMatrix.load(path)
+        self.assertEqual(10, len(matrix))
+        self.assertEqual({3: 3}, matrix.get("p3"))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+        # on a schedule of its own
+        checkpointer.ratings_interval = 3600
+        self.crawl(c, 10, 20)
+        checkpointer.checkpoint()
+        checkpointer.close()
+        c.journal_.close()
+        self.assertEqual(10, len(ratings.RatingsMatrix.load(path)))
+
+    def test_ratings_copy_is_a_pause(self):
+        c = ProfileCrawler(journal.Journal(self.path))
+        checkpointer = checkpoint.Checkpointer(
+            c, interval=3600, registry=metrics.Registry(),
+            ratings_path=os.path.join(self.dir, "crawl.ratings"),
+            ratings_interval=0)
+        copy = c.parsed_profiles
+
+        def slow_copy():
+            time.sleep(.1)
+            return copy()
+
+        c.parsed_profiles = slow_copy
+        self.crawl(c, 0, 10)
+        self.assertTrue(checkpointer.checkpoint().pause >= .1)
+        checkpointer.close()
+        c.journal_.close()
+
+    @unittest.skipIf(film_stats is None, "needs numpy")
+    def test_film_stats(self):
+        c = ProfileCrawler(journal.Journal(self.path))
+        c.film_stats_ = film_stats.FilmStats()
+        stats_dao = StatsDao()
+        checkpointer = checkpoint.Checkpointer(
+            c, interval=3600, registry=metrics.Registry(),
+            film_stats_dao=stats_dao)
+        self.crawl(c, 0, 5)
+        checkpointer.checkpoint()
+        self.assertEqual([0, 1, 2, 3, 4], sorted(stats_dao.written))
+        self.assertEqual(3, stats_dao.written[3].mean)
+
+        # only what changed since, and again what failed to be written
+        stats_dao.written.clear()
+        self.crawl(c, 5, 7)
+        stats_dao.fail = True
+        self.assertRaises(IOError, checkpointer.checkpoint)
+        self.crawl(c, 7, 8)
+        stats_dao.fail = False
+        checkpointer.checkpoint()
+        self.assertEqual([5, 6, 7], sorted(stats_dao.written))
+        checkpointer.close()
+        c.journal_.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
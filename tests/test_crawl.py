@@ -0,0 +1,365 @@
+import io
+import os
+import re
+import time
+import shutil
+import tempfile
+import unittest
+import logging
+import contextlib
+from lmatch import film, frontier, http_cache, http_client, lru, parse, \
+    profile_crawler
+from benchmarks.stub_server import FILMS_PAGES, StubServer
+try:
+    import crawl
+    from benchmarks.crawl_bench import NullDao
+except ImportError:
+    crawl = None
+    NullDao = object
+from tests.test_http_cache import ChangingSite
+Profile = profile_crawler.Profile
+
+
+class FilmIds(dict):
+    """ Film ids, handed out in the order the films are first looked up. """
+
+    def get(self, url, default=None):
+        return self.setdefault(url, len(self) + 1)
+
+
+class FailingClient:
+    """ Client whose requests fail for the urls ending with one of failing. """
+
+    def __init__(self, client):
+        self.client_ = client
+        self.failing = set()
+
+    def get(self, url, **kwargs):
+        if any(url.endswith(path) for path in self.failing):
+            raise IOError(url)
+        return self.client_.get(url, **kwargs)
+
+
+class FilmDao(NullDao):
+    """ A DB holding the film "a". """
+
+    def findMovie(self, url):
+        return film.Film(1, url, url, None) if url == "a" else None
+
+
+class RacingCache(lru.LruCache):
+    """ LruCache where another film is stored just before each get. """
+
+    def get(self, key, default=None):
+        self.put("other", 0)
+        return lru.LruCache.get(self, key, default)
+
+
+@unittest.skipIf(crawl is None, "needs the requirements of crawl.py")
+class TestMovieFacade(unittest.TestCase):
+    def test_evicted_before_get(self):
+        facade = crawl.MovieFacade(FilmDao(), cache_size=1)
+        facade.hash_table_ = RacingCache(1)
+        facade.cache("a", 1)
+        # in the cache until the get evicts it, then back from the DB
+        self.assertEqual(1, facade.fetchId("a"))
+
+
+@unittest.skipIf(crawl is None, "needs the requirements of crawl.py")
+class CrawlTestCase(unittest.TestCase):
+    """ crawl.py against a StubServer, its globals put back after. """
+
+    GLOBALS = ("BASE_URL", "movie_facade", "s", "client", "response_cache",
+               "stream_pages")
+
+    def setUp(self):
+        self.saved = {name: getattr(crawl, name) for name in self.GLOBALS}
+        self.site = self.make_site()
+        self.server = StubServer(self.site)
+        crawl.BASE_URL = self.server.start()
+        crawl.movie_facade = crawl.MovieFacade(NullDao())
+        crawl.movie_facade.hash_table_ = FilmIds()
+        crawl.s = http_client.HttpClient(4)
+        crawl.client = FailingClient(crawl.s)
+
+    def make_site(self):
+        return ChangingSite()
+
+    def tearDown(self):
+        crawl.s.close()
+        self.server.stop()
+        for (name, value) in self.saved.items():
+            setattr(crawl, name, value)
+
+    def films(self, path):
+        """ film id -> rating of the page at path, as the crawl sees it. """
+        return crawl.film_ids(parse.movies_watched(self.site.render(path)))
+
+
+class TestCrawlRecent(CrawlTestCase):
+    def test_stops_at_newest(self):
+        page = self.films("u1/films/by/date/page/1")
+        (first, second) = list(page)[:2]
+        profile = Profile("u1", 0, [], {}, second)
+
+        (delta, newest) = crawl.crawl_recent(profile_crawler.ProfileCrawler(),
+                                             profile)
+        self.assertEqual({first: page[first]}, delta)
+        self.assertEqual(first, newest)
+        self.assertEqual(1, self.server.requests)
+
+    def test_stops_at_unchanged_page(self):
+        page = self.films("u1/films/by/date/page/1")
+        movies = dict(page)
+        movies.update(self.films("u1/films/page/2"))
+        # re-rated since, page 2 has nothing new
+        rerated = list(page)[5]
+        movies[rerated] = (page[rerated] + 1) % 11
+
+        (delta, newest) = crawl.crawl_recent(profile_crawler.ProfileCrawler(),
+                                             Profile("u1", 0, [], movies))
+        self.assertEqual({rerated: page[rerated]}, delta)
+        self.assertEqual(next(iter(page)), newest)
+        self.assertEqual(2, self.server.requests)
+
+    def test_nothing_new_keeps_newest(self):
+        self.site.edits["u1/films/by/date/page/1"] = "<html></html>"
+        (delta, newest) = crawl.crawl_recent(
+            profile_crawler.ProfileCrawler(),
+            Profile("u1", 0, [], {1: 5}, 42))
+        self.assertEqual({}, delta)
+        self.assertEqual(42, newest)
+
+    def test_failed_refresh(self):
+        c = profile_crawler.ProfileCrawler()
+        c.on_parsed("u1", 0, ["u2"], {1: 5}, 1)
+        c.next_job()
+        c.refresh()
+        job = c.next_job()
+        crawl.client.failing.add("u1/films/by/date/page/1")
+
+        crawl.crawl_profile(c, job)
+        # back to parsed as it was, not left ongoing to be queued again
+        (p,) = [p for p in c.parsed_ if p.username == "u1"]
+        self.assertEqual({1: 5}, dict(p.movies))
+        self.assertEqual(0, len(c.ongoing_ - {Profile("u2")}))
+        self.assertEqual(profile_crawler.PARSED, c.index_["u1"])
+        c.cancel_ongoing_jobs()
+        self.assertEqual({Profile("u2")}, c.queued_)
+
+
+class PagedSite(ChangingSite):
+    """ Films pages that all differ, the first ones served last. """
+
+    def render(self, path):
+        text = ChangingSite.render(self, path)
+        m = re.fullmatch(r"u\d+/films/page/(\d+)", path.strip("/"))
+        if m is None or text is None:
+            return text
+        n = int(m.group(1))
+        time.sleep(.01 * (FILMS_PAGES - n))
+        return text.replace("data-target-link=\"/film/",
+                            "data-target-link=\"/film/p{}-".format(n))
+
+
+class TestCrawl(CrawlTestCase):
+    def make_site(self):
+        return PagedSite()
+
+    def test_pages_in_order(self):
+        expected = []
+        for n in range(1, FILMS_PAGES + 1):
+            expected.extend(parse.movies_watched(
+                self.site.render("u1/films/page/{}".format(n))))
+
+        movies = crawl.crawl(profile_crawler.ProfileCrawler(), "u1",
+                             "u1/films/page/1", parse.movies_watched)
+        self.assertEqual(expected, movies)
+
+    def test_next_links(self):
+        following = crawl.crawl(profile_crawler.ProfileCrawler(), "u1",
+                                "u1/following/page/1", parse.following)
+        self.assertEqual(26, len(following))
+
+    def test_failed_page(self):
+        crawl.client.failing.add("u1/films/page/4")
+        self.assertIsNone(crawl.crawl(profile_crawler.ProfileCrawler(), "u1",
+                                      "u1/films/page/1",
+                                      parse.movies_watched))
+
+
+class TestFetchListing(CrawlTestCase):
+    def setUp(self):
+        CrawlTestCase.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        crawl.response_cache = http_cache.ResponseCache(
+            os.path.join(self.dir, "pages.cache"))
+
+    def tearDown(self):
+        crawl.response_cache.close()
+        shutil.rmtree(self.dir)
+        CrawlTestCase.tearDown(self)
+
+    def test_not_modified(self):
+        path = "u1/films/page/1"
+        listing = crawl.fetch_listing(parse.movies_watched, path)
+        self.assertEqual(parse.movies_watched(self.site.render(path)),
+                         listing[0])
+        self.assertEqual(("u1/films/page/2/", 7), listing[1:])
+
+        # what is cached is given back as it is, without parsing the page
+        key = "lmatch.parse.movies_watched"
+        crawl.response_cache.store_parsed(crawl.BASE_URL + path, key,
+                                          [[["cached", 5]], None, 1])
+        self.assertEqual(([["cached", 5]], None, 1),
+                         crawl.fetch_listing(parse.movies_watched, path))
+        self.assertEqual(1, self.server.not_modified)
+
+        # a page that changed is parsed again
+        self.site.edits[path] = "<html></html>"
+        self.assertEqual(([], None, None),
+                         crawl.fetch_listing(parse.movies_watched, path))
+        self.assertEqual(1, self.server.not_modified)
+
+
+class TestStreamListing(CrawlTestCase):
+    def test_same_as_whole_page(self):
+        crawl.stream_pages = True
+        for (path, parser) in (("u1/films/page/1", parse.movies_watched),
+                               ("u1/films/page/7", parse.movies_watched),
+                               ("u1/following/page/1", parse.following)):
+            page = self.site.render(path)
+            self.assertEqual(
+                (parser(page), parse.next_page(page), parse.last_page(page)),
+                crawl.fetch_listing(parser, path))
+
+    def test_films(self):
+        crawl.stream_pages = True
+        movies = crawl.crawl(profile_crawler.ProfileCrawler(), "u1",
+                             "u1/films/page/1", parse.movies_watched)
+        crawl.stream_pages = False
+        self.assertEqual(crawl.crawl(profile_crawler.ProfileCrawler(), "u1",
+                                     "u1/films/page/1", parse.movies_watched),
+                         movies)
+
+
+@unittest.skipIf(crawl is None, "needs the requirements of crawl.py")
+class TestWorkers(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        path = os.path.join(self.dir, "frontier.db")
+        # two crawlers sharing a frontier
+        self.f = frontier.SqliteFrontier(path)
+        self.g = frontier.SqliteFrontier(path)
+
+    def tearDown(self):
+        self.f.close()
+        self.g.close()
+        shutil.rmtree(self.dir)
+
+    def test_local(self):
+        c = profile_crawler.ProfileCrawler()
+        workers = crawl.Workers()
+        c.enqueue("a")
+        job = workers.next_job(c)
+        # a busy worker can still queue more
+        self.assertIsNone(workers.next_job(c))
+        c.on_parsed(job.username, 0, [], {})
+        workers.done()
+        self.assertIs(False, workers.next_job(c))
+
+    def test_busy_elsewhere(self):
+        self.f.enqueue("a")
+        job = self.f.next_job()
+        workers = crawl.Workers()
+        # the other crawler has the only job, and may queue more
+        self.assertIsNone(workers.next_job(self.g))
+        self.f.on_parsed(job.username, 0, ["b"], {})
+        self.assertEqual("b", workers.next_job(self.g).username)
+        workers.done()
+        self.g.on_parsed("b", 1, [], {})
+        self.assertIs(False, workers.next_job(self.g))
+
+    def test_abandoned_elsewhere(self):
+        self.f.enqueue("a")
+        self.f.abandon(self.f.next_job())
+        self.assertIs(False, crawl.Workers().next_job(self.g))
+
+    def test_max_depth(self):
+        self.f.enqueue("a", 4)
+        self.assertIs(False, crawl.Workers().next_job(self.f, 3))
+        # not taken: neither leased nor renewed by the heartbeat
+        self.assertEqual({}, self.f.mine_)
+        self.assertEqual((0, 0, 1), self.f.counts())
+
+    def test_priority_with_frontier(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, crawl.main, [
+                "--frontier", "sqlite:" + os.path.join(self.dir, "f.db"),
+                "--priority", "in-degree", "u0"])
+
+    def test_threads_only_options(self):
+        for options in (["--http-cache", os.path.join(self.dir, "p.cache")],
+                        ["--parse-processes", "2"], ["--stream"]):
+            with contextlib.redirect_stderr(io.StringIO()) as err:
+                self.assertRaises(SystemExit, crawl.main,
+                                  ["--engine", "async"] + options + ["u0"])
+            self.assertIn("--engine async", err.getvalue())
+
+
+@unittest.skipIf(crawl is None, "needs the requirements of crawl.py")
+class TestSetupLogging(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        for name in ("httpx", "httpcore"):
+            self.addCleanup(logging.getLogger(name).setLevel, logging.NOTSET)
+
+    def test_requests_not_logged_at_info(self):
+        crawl.setup_logging("INFO")
+        logging.getLogger().setLevel(logging.INFO)
+        self.assertFalse(logging.getLogger("httpx").isEnabledFor(logging.INFO))
+        self.assertTrue(logging.getLogger("crawl").isEnabledFor(logging.INFO))
+
+    def test_requests_logged_at_debug(self):
+        crawl.setup_logging("DEBUG")
+        logging.getLogger().setLevel(logging.DEBUG)
+        self.assertTrue(logging.getLogger("httpx").isEnabledFor(logging.INFO))
+        self.assertTrue(
+            logging.getLogger("httpcore").isEnabledFor(logging.DEBUG))
+
+
+class SavedStats:
+    """ dao.FilmStatsDao with stats already saved. """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def fetchAllStats(self):
+        return self.stats
+
+
+@unittest.skipIf(crawl is None, "needs the requirements of crawl.py")
+class TestLoadFilmStats(unittest.TestCase):
+    def setUp(self):
+        self.crawler = profile_crawler.ProfileCrawler()
+        self.crawler.on_parsed("a", 0, [], {1: 4, 2: 0})
+        self.crawler.on_parsed("b", 0, [], {1: 8})
+
+    def test_saved(self):
+        saved = crawl.film_stats.FilmStats.from_ratings(
+            p.movies for p in self.crawler.parsed_profiles())
+        saved.clean()
+        self.assertIs(saved, crawl.load_film_stats(self.crawler,
+                                                   SavedStats(saved)))
+
+    def test_out_of_date(self):
+        # saved before b was parsed
+        saved = crawl.film_stats.FilmStats.from_ratings([{1: 4, 2: 0}])
+        stats = crawl.load_film_stats(self.crawler, SavedStats(saved))
+        self.assertEqual(2, stats.get(1).rated)
+        self.assertEqual({1, 2}, stats.dirty_)
+
+
+if __name__ == '__main__':
+    unittest.main()
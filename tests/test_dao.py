@@ -0,0 +1,135 @@
+import unittest
+from lmatch import film
+try:
+    import mongomock
+    from lmatch import dao
+    from lmatch.film_stats import FilmStats
+except ImportError:
+    mongomock = None
+Film = film.Film
+
+
+@unittest.skipIf(mongomock is None, "needs pymongo and mongomock")
+class TestMovieDao(unittest.TestCase):
+    def setUp(self):
+        self.dao = dao.MovieDao(mongomock.MongoClient())
+        self.dao.ensureIndexes()
+        self.dao.updateMovie(Film(1, "film-a", "Film A", 6.5))
+        self.dao.updateMovie(Film(2, "film-b", "Film B", None))
+        self.dao.updateMovie(Film(3, "film-c", "Film C", 8.0))
+
+    def test_update(self):
+        self.dao.updateMovie(Film(1, "film-a", "Film A!", 7.0))
+        f = self.dao.findMovie("film-a")
+        self.assertEqual(1, f.id)
+        self.assertEqual("Film A!", f.name)
+        self.assertEqual(7.0, f.avg_rate)
+
+    def test_find_movie(self):
+        f = self.dao.findMovie("film-b")
+        self.assertEqual(2, f.id)
+        self.assertEqual("film-b", f.url)
+        self.assertEqual("Film B", f.name)
+        self.assertEqual(None, f.avg_rate)
+        self.assertEqual(None, self.dao.findMovie("film-z"))
+
+    def test_find_movies(self):
+        films = self.dao.findMovies(["film-a", "film-c", "film-z"])
+        self.assertEqual({1, 3}, {f.id for f in films})
+        self.assertEqual([], self.dao.findMovies([]))
+
+    def test_fetch_all(self):
+        films = []
+        self.dao.fetchAllMovies(films.append)
+        self.assertEqual({1, 2, 3}, {f.id for f in films})
+
+
+@unittest.skipIf(mongomock is None, "needs pymongo and mongomock")
+class TestBufferedMovieDao(unittest.TestCase):
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        # long interval, so that only batch_size triggers flushes
+        self.dao = dao.MovieDao(self.client, batch_size=3,
+                                flush_interval=3600)
+
+    def tearDown(self):
+        self.dao.close()
+
+    def count(self):
+        return self.client.letterboxd.movies.count_documents({})
+
+    def test_flush_on_batch_size(self):
+        self.dao.updateMovie(Film(1, "film-a", "Film A", 6.5))
+        self.dao.updateMovie(Film(2, "film-b", "Film B", None))
+        self.assertEqual(0, self.count())
+
+        self.dao.updateMovie(Film(3, "film-c", "Film C", 8.0))
+        self.assertEqual(3, self.count())
+        self.assertEqual(1, self.dao.flushes)
+        self.assertEqual(3, self.dao.flushed)
+
+    def test_buffered_movies_can_be_found(self):
+        self.dao.updateMovie(Film(1, "film-a", "Film A", 6.5))
+        self.dao.updateMovie(Film(2, "film-b", "Film B", None))
+
+        self.assertEqual(1, self.dao.findMovie("film-a").id)
+        self.assertEqual({1, 2}, {f.id for f in
+                                  self.dao.findMovies(["film-a", "film-b"])})
+
+    def test_close_flushes(self):
+        self.dao.updateMovie(Film(1, "film-a", "Film A", 6.5))
+        self.dao.updateMovie(Film(1, "film-a", "Film A!", 7.0))
+        self.dao.close()
+
+        self.assertEqual(1, self.count())
+        self.assertEqual("Film A!", dao.MovieDao(self.client)
+                         .findMovie("film-a").name)
+        self.assertEqual(0, self.dao.flush())
+
+    def test_flush_on_interval(self):
+        d = dao.MovieDao(self.client, batch_size=100, flush_interval=.01)
+        d.updateMovie(Film(1, "film-a", "Film A", 6.5))
+        d.closed_.wait(.2)
+        self.assertEqual(1, self.count())
+        d.close()
+
+    def test_flush_stats(self):
+        self.dao.updateMovie(Film(1, "film-a", "Film A", 6.5))
+        self.dao.flush()
+        self.assertTrue(self.dao.flushStats()
+                        .startswith("1 movies written in 1 batches."))
+
+
+
+@unittest.skipIf(mongomock is None, "needs pymongo and mongomock")
+class TestFilmStatsDao(unittest.TestCase):
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        self.dao = dao.FilmStatsDao(self.client, batch_size=2)
+        self.stats = FilmStats.from_ratings([{1: 4, 2: 0, 3: 8},
+                                             {1: 6, 5: 10}])
+
+    def test_update(self):
+        self.assertEqual(4, self.dao.updateStats(self.stats))
+        self.assertEqual(4, self.client.letterboxd.film_stats
+                         .count_documents({}))
+        self.assertEqual(self.stats.get(1), self.dao.findStats(1))
+        self.assertIsNone(self.dao.findStats(4))
+
+        # only what changed is written again
+        self.assertEqual(0, self.dao.updateStats(self.stats))
+        self.stats.update({1: 6, 5: 10}, {1: 10})
+        self.assertEqual(2, self.dao.updateStats(self.stats))
+        self.assertEqual(7.0, self.dao.findStats(1).mean)
+        self.assertIsNone(self.dao.findStats(5))
+
+    def test_fetch_all(self):
+        self.dao.updateStats(self.stats)
+        stats = self.dao.fetchAllStats()
+        for film_id in range(7):
+            self.assertEqual(self.stats.get(film_id), stats.get(film_id))
+        self.assertEqual(set(), stats.dirty_)
+
+
+if __name__ == '__main__':
+    unittest.main()
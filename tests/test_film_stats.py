@@ -0,0 +1,138 @@
+import random
+import unittest
+from lmatch import profile_crawler
+from lmatch.ratings import Ratings
+try:
+    import numpy as np
+    from lmatch import film_stats
+    FilmStats = film_stats.FilmStats
+except ImportError:
+    film_stats = None
+
+
+@unittest.skipIf(film_stats is None, "needs numpy")
+class TestFilmStats(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.profiles = [{rnd.randrange(300): rnd.randrange(11)
+                          for _ in range(rnd.randrange(50))}
+                         for _ in range(200)]
+
+    def check(self, stats, profiles):
+        for film_id in range(300):
+            ratings = [m[film_id] for m in profiles if film_id in m]
+            a = stats.get(film_id)
+            if not ratings:
+                self.assertIsNone(a)
+                continue
+            rated = [r for r in ratings if r]
+            self.assertEqual(len(ratings), a.watched)
+            self.assertEqual(len(rated), a.rated)
+            self.assertEqual(sum(a.histogram), a.watched)
+            if rated:
+                self.assertAlmostEqual(np.mean(rated), a.mean)
+                self.assertAlmostEqual(np.var(rated), a.variance)
+                self.assertAlmostEqual(a.mean, stats.means()[film_id])
+                self.assertAlmostEqual(a.variance,
+                                       stats.variances()[film_id])
+            else:
+                self.assertIsNone(a.mean)
+                self.assertTrue(np.isnan(stats.means()[film_id]))
+
+    def test_from_ratings(self):
+        stats = FilmStats.from_ratings(
+            [Ratings(m) for m in self.profiles[:100]] + self.profiles[100:]
+            + [None])
+        self.check(stats, self.profiles)
+        self.assertEqual(set(stats.films().tolist()), stats.dirty_)
+        self.assertEqual(len(stats.dirty_), len(stats))
+
+    def test_batches(self):
+        batch = film_stats._BATCH
+        film_stats._BATCH = 100
+        try:
+            stats = FilmStats.from_ratings(self.profiles)
+        finally:
+            film_stats._BATCH = batch
+        self.check(stats, self.profiles)
+
+    def test_update(self):
+        stats = FilmStats()
+        profiles = [Ratings(m) for m in self.profiles[:150]]
+        for m in profiles:
+            stats.update(None, m)
+        # some parsed again, some with other films
+        for i in range(0, 150, 3):
+            new = Ratings(self.profiles[i + 50])
+            stats.update(profiles[i], new)
+            profiles[i] = new
+        self.check(stats, [dict(m.items()) for m in profiles])
+
+        expected = FilmStats.from_ratings(profiles)
+        np.testing.assert_array_equal(
+            expected.histograms_,
+            stats.histograms_[:len(expected.histograms_)])
+
+        self.assertEqual(set(stats.films().tolist()), stats.clean())
+        self.assertEqual(set(), stats.dirty_)
+        stats.update(None, {5: 3})
+        self.assertEqual({5}, stats.dirty_)
+
+    def test_take_dirty(self):
+        stats = FilmStats.from_ratings([{1: 4, 3: 7}, {3: 7, 5: 2}])
+        stats.clean()
+        stats.update(None, {3: 7, 1: 0})
+        (ids, histograms) = stats.take_dirty()
+        self.assertEqual([1, 3], ids)
+        self.assertEqual([[1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0],
+                          [0, 0, 0, 0, 0, 0, 0, 3, 0, 0, 0]],
+                         histograms.tolist())
+        self.assertEqual(set(), stats.dirty_)
+        # a copy, as it was
+        stats.update({3: 7, 1: 0}, None)
+        self.assertEqual(3, histograms[1][7])
+        self.assertEqual({1, 3}, stats.dirty_)
+        self.assertEqual(4, stats.count())
+
+    def test_empty(self):
+        stats = FilmStats.from_ratings([])
+        self.assertEqual(0, len(stats))
+        self.assertIsNone(stats.get(3))
+        stats.update(None, Ratings())
+
+
+@unittest.skipIf(film_stats is None, "needs numpy")
+class TestCrawler(unittest.TestCase):
+    def test_kept_up_to_date(self):
+        crawler = profile_crawler.ProfileCrawler()
+        crawler.on_parsed("fs_a", 0, [], {1: 4, 2: 0})
+        crawler.film_stats_ = FilmStats.from_ratings(
+            p.movies for p in crawler.parsed_profiles())
+
+        crawler.on_parsed("fs_b", 0, ["fs_a"], {1: 8, 3: 6})
+        # parsed again from scratch
+        crawler.on_parsed("fs_a", 0, [], {1: 2})
+        # refreshed
+        crawler.refresh()
+        b = crawler.next_job()
+        while b.username != "fs_b":
+            b = crawler.next_job()
+        crawler.on_refreshed(b, ["fs_a"], {3: 10, 4: 0})
+
+        stats = crawler.film_stats_
+        self.assertEqual(film_stats.FilmAggregate(2, 2, 5.0, 9.0,
+                                                  [0, 0, 1, 0, 0, 0, 0, 0,
+                                                   1, 0, 0]),
+                         stats.get(1))
+        self.assertIsNone(stats.get(2))
+        self.assertEqual(10, stats.get(3).mean)
+        self.assertEqual(1, stats.get(4).watched)
+        expected = FilmStats.from_ratings(
+            p.movies for p in crawler.parsed_profiles())
+        np.testing.assert_array_equal(
+            expected.histograms_,
+            stats.histograms_[:len(expected.histograms_)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from lmatch import frontier
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class FrontierTests:
+    """ Tests shared by every backend. open() gives a frontier on the
+    same store each time it is called, as another crawler would. """
+
+    def setUp(self):
+        self.frontiers = []
+
+    def tearDown(self):
+        for f in self.frontiers:
+            f.close()
+
+    def open(self, lease=60):
+        f = self.make(lease)
+        self.frontiers.append(f)
+        return f
+
+    def test_empty(self):
+        f = self.open()
+        self.assertIsNone(f.next_job())
+        self.assertEqual((0, 0, 0), f.counts())
+
+    def test_dedup(self):
+        f = self.open()
+        f.enqueue("a")
+        f.enqueue("a", 3)
+        self.open().enqueue("a")
+        self.assertEqual((0, 0, 1), f.counts())
+
+        job = f.next_job()
+        self.assertEqual("a", job.username)
+        self.assertEqual(0, job.depth)
+        self.assertIsNone(f.next_job())
+
+        f.enqueue("a")
+        self.assertEqual((0, 1, 0), f.counts())
+
+    def test_shallowest_first(self):
+        f = self.open()
+        f.enqueue("c", 2)
+        f.enqueue("a", 0)
+        f.enqueue("b", 1)
+        self.assertEqual(["a", "b", "c"],
+                         [f.next_job().username for _ in range(3)])
+
+    def test_max_depth(self):
+        f = self.open()
+        f.enqueue("b", 2)
+        f.enqueue("a", 1)
+        self.assertEqual("a", f.next_job(1).username)
+        self.assertIsNone(f.next_job(1))
+        self.assertEqual((0, 1, 1), f.counts())
+        self.assertEqual("b", f.next_job(2).username)
+
+    def test_abandon(self):
+        f = self.open()
+        g = self.open()
+        f.enqueue("a")
+        job = f.next_job()
+        f.abandon(job)
+        # not ongoing anymore, but not handed out again either
+        self.assertEqual((0, 0, 1), f.counts())
+        self.assertIsNone(g.next_job())
+
+        f.cancel_ongoing_jobs()
+        self.assertEqual((0, 0, 1), f.counts())
+        self.assertEqual("a", g.next_job().username)
+
+    def test_abandoned_lease_expires(self):
+        f = self.open(lease=0.2)
+        g = self.open()
+        f.enqueue("a")
+        f.abandon(f.next_job())
+        f.close()
+        self.frontiers.remove(f)
+        time.sleep(0.3)
+        self.assertEqual("a", g.next_job().username)
+
+    def test_on_parsed(self):
+        f = self.open()
+        f.enqueue("a")
+        job = f.next_job()
+        f.on_parsed(job.username, job.depth, ["b", "c", "a"], {3: 7, 1: 10})
+        self.assertEqual((1, 0, 2), f.counts())
+
+        (p,) = list(self.open().parsed_profiles())
+        self.assertEqual("a", p.username)
+        self.assertEqual(0, p.depth)
+        self.assertEqual(["b", "c", "a"], p.following)
+        self.assertEqual({1: 10, 3: 7}, dict(p.movies))
+
+        jobs = {f.next_job().username: 1, f.next_job().username: 1}
+        self.assertEqual({"b", "c"}, set(jobs))
+        self.assertIsNone(f.next_job())
+
+    def test_shared_queue(self):
+        f = self.open()
+        g = self.open()
+        f.enqueue("a")
+        f.enqueue("b")
+        self.assertEqual({"a", "b"},
+                         {f.next_job().username, g.next_job().username})
+        self.assertIsNone(f.next_job())
+        self.assertIsNone(g.next_job())
+
+    def test_cancel(self):
+        f = self.open()
+        g = self.open()
+        f.enqueue("a")
+        f.enqueue("b")
+        f.next_job()
+        g.next_job()
+        self.assertEqual((0, 2, 0), f.counts())
+
+        # only gives back its own jobs
+        f.cancel_ongoing_jobs()
+        self.assertEqual((0, 1, 1), f.counts())
+        self.assertIsNotNone(g.next_job())
+
+    def test_lease_expires(self):
+        f = self.open(lease=0.2)
+        g = self.open()
+        f.enqueue("a")
+        self.assertEqual("a", f.next_job().username)
+        self.assertIsNone(g.next_job())
+
+        # f died, its heartbeat won't renew the lease
+        f.close()
+        self.frontiers.remove(f)
+        time.sleep(0.3)
+        job = g.next_job()
+        self.assertEqual("a", job.username)
+        self.assertEqual(0, job.depth)
+
+    def test_heartbeat(self):
+        f = self.open(lease=0.3)
+        g = self.open(lease=0.3)
+        f.enqueue("a")
+        f.next_job()
+        time.sleep(0.6)
+        self.assertIsNone(g.next_job())
+
+    def test_concurrent(self):
+        f = self.open()
+        f.enqueue("u0")
+        taken = []
+        lock = threading.Lock()
+
+        def work():
+            g = self.open()
+            idle = 0
+            while idle < 20:
+                job = g.next_job()
+                if job is None:
+                    idle += 1
+                    time.sleep(0.005)
+                    continue
+                idle = 0
+                with lock:
+                    taken.append(job.username)
+                n = int(job.username[1:])
+                following = ["u{}".format((n * 3 + i) % 200) for i in range(3)]
+                g.on_parsed(job.username, job.depth, following, {n: 1})
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # each profile handed out exactly once
+        self.assertEqual(len(taken), len(set(taken)))
+        (parsed, ongoing, queued) = f.counts()
+        self.assertEqual((len(taken), 0, 0), (parsed, ongoing, queued))
+
+
+class TestSqliteFrontier(FrontierTests, unittest.TestCase):
+    def setUp(self):
+        FrontierTests.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "frontier.db")
+
+    def tearDown(self):
+        FrontierTests.tearDown(self)
+        shutil.rmtree(self.dir)
+
+    def make(self, lease):
+        return frontier.SqliteFrontier(self.path, lease=lease)
+
+
+@unittest.skipIf(fakeredis is None, "needs fakeredis")
+class TestRedisFrontier(FrontierTests, unittest.TestCase):
+    def setUp(self):
+        FrontierTests.setUp(self)
+        self.server = fakeredis.FakeServer()
+
+    def make(self, lease):
+        return frontier.RedisFrontier(
+            fakeredis.FakeRedis(server=self.server), lease=lease)
@@ -0,0 +1,100 @@
+import unittest
+from lmatch import profile_crawler
+try:
+    import numpy as np
+    from lmatch import graph
+except ImportError:
+    graph = None
+Profile = profile_crawler.Profile
+
+
+@unittest.skipIf(graph is None, "needs numpy and scipy")
+class TestFollowGraph(unittest.TestCase):
+    def setUp(self):
+        # two components: a -> b -> c -> a, a -> d, and e -> f
+        self.g = graph.FollowGraph.from_profiles([
+            Profile("g_a", 0, ["g_b", "g_d"], {}),
+            Profile("g_b", 1, ["g_c"], {}),
+            Profile("g_c", 1, ["g_z"], {}),
+            Profile("g_e", 0, ["g_f"], {}),
+            # parsed again, the last time counts
+            Profile("g_c", 1, ["g_a"], {}),
+            # queued, not parsed
+            Profile("g_x", 2),
+        ])
+
+    def names(self, nodes):
+        return sorted(self.g.usernames[i] for i in nodes)
+
+    def test_build(self):
+        self.assertEqual(6, len(self.g))
+        self.assertEqual(5, self.g.edges)
+        self.assertEqual(["g_b", "g_d"], self.names(self.g.following("g_a")))
+        self.assertEqual(["g_c"], self.names(self.g.followers("g_a")))
+        self.assertEqual([], self.names(self.g.following("g_d")))
+        with self.assertRaises(KeyError):
+            self.g.id("g_x")
+
+    def test_from_edges(self):
+        # the same edge twice counts once
+        g = graph.FollowGraph.from_edges([2, 0, 0, 2], [1, 2, 1, 1])
+        self.assertEqual(3, len(g))
+        self.assertEqual([0, 2, 2, 3], g.indptr.tolist())
+        self.assertEqual([1, 2, 1], g.indices.tolist())
+        self.assertEqual([0, 2, 1], g.in_degree().tolist())
+        self.assertEqual([2, 0, 1], g.out_degree().tolist())
+
+    def test_most_followed(self):
+        g = graph.FollowGraph.from_profiles([
+            Profile("g_a", 0, ["g_b", "g_c"], {}),
+            Profile("g_b", 0, ["g_c"], {}),
+        ])
+        self.assertEqual([("g_c", 2), ("g_b", 1)], g.most_followed(2))
+
+    def test_pagerank(self):
+        rank = self.g.pagerank()
+        self.assertAlmostEqual(1, rank.sum())
+
+        # against the dense Google matrix
+        n = len(self.g)
+        A = self.g.matrix().toarray()
+        out = A.sum(axis=1)
+        P = np.where(out[:, None] > 0, A / np.maximum(out, 1)[:, None],
+                     1.0 / n)
+        G = .85 * P + .15 / n
+        expected = np.full(n, 1.0 / n)
+        for _ in range(200):
+            expected = expected @ G
+        np.testing.assert_allclose(expected, rank, atol=1e-7)
+        self.assertEqual(self.g.id("g_a"), self.g.top(rank, 1)[0])
+
+    def test_components(self):
+        (count, labels) = self.g.components()
+        self.assertEqual(2, count)
+        ids = [self.g.id(u) for u in ("g_a", "g_b", "g_c", "g_d")]
+        self.assertEqual(1, len(set(labels[ids])))
+        self.assertNotEqual(labels[self.g.id("g_a")],
+                            labels[self.g.id("g_e")])
+
+    def test_neighbourhood(self):
+        g = self.g
+        self.assertEqual(["g_b", "g_d"], self.names(g.neighbourhood("g_a")))
+        self.assertEqual(["g_b", "g_c", "g_d"],
+                         self.names(g.neighbourhood("g_a", 2)))
+        self.assertEqual(["g_a", "g_b"],
+                         self.names(g.neighbourhood("g_c", 2, "in")))
+        self.assertEqual(["g_a", "g_b", "g_c"],
+                         self.names(g.neighbourhood("g_d", 2, "both")))
+        self.assertEqual([], self.names(g.neighbourhood("g_d")))
+        with self.assertRaises(ValueError):
+            g.neighbourhood("g_a", 1, "sideways")
+
+    def test_empty(self):
+        g = graph.FollowGraph.from_profiles([])
+        self.assertEqual(0, len(g))
+        self.assertEqual(0, len(g.pagerank()))
+        self.assertEqual([], g.most_followed())
+
+
+if __name__ == '__main__':
+    unittest.main()
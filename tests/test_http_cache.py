@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+from requests import session
+from lmatch import http_cache
+from benchmarks.stub_server import StubServer, StubSite
+
+
+class ChangingSite(StubSite):
+    """ Site whose pages can be edited. """
+
+    def __init__(self):
+        StubSite.__init__(self)
+        self.edits = {}
+
+    def render(self, path):
+        path = path.strip("/")
+        if path in self.edits:
+            return self.edits[path]
+        return StubSite.render(self, path)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = http_cache.ResponseCache(
+            os.path.join(self.dir, "pages.cache"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_store(self):
+        self.assertIsNone(self.cache.lookup("a"))
+        self.cache.store("a", "\"1\"", None, "page a")
+        self.assertEqual(("\"1\"", None, "page a", 6), self.cache.lookup("a"))
+
+        self.cache.store("a", None, "yesterday", "new page a")
+        self.assertEqual((None, "yesterday", "new page a", 10),
+                         self.cache.lookup("a"))
+
+    def test_parsed(self):
+        self.assertIsNone(self.cache.parsed("a", "following"))
+        self.cache.store_parsed("a", "following", ["x"])
+        self.assertIsNone(self.cache.parsed("a", "following"))
+
+        self.cache.store("a", "\"1\"", None, "page a")
+        self.cache.store_parsed("a", "following", ["x"])
+        self.cache.store_parsed("a", "films", [["f", 5]])
+        self.assertEqual(["x"], self.cache.parsed("a", "following"))
+        self.assertEqual([["f", 5]], self.cache.parsed("a", "films"))
+
+        # a new version of the page needs parsing again
+        self.cache.store("a", "\"2\"", None, "page a v2")
+        self.assertIsNone(self.cache.parsed("a", "following"))
+
+    def test_eviction(self):
+        cache = http_cache.ResponseCache(
+            os.path.join(self.dir, "small.cache"), max_bytes=2000)
+        pages = [os.urandom(400).hex() for _ in range(6)]
+        for (i, text) in enumerate(pages):
+            cache.store(str(i), "\"e\"", None, text)
+            if i == 2:
+                cache.hit("0", cache.lookup("0"))
+
+        self.assertTrue(cache.size() <= 2000)
+        self.assertTrue(cache.evictions > 0)
+        # the least recently used go first
+        self.assertIsNone(cache.lookup("1"))
+        self.assertIsNotNone(cache.lookup("5"))
+        cache.close()
+
+        # the size is remembered
+        cache = http_cache.ResponseCache(
+            os.path.join(self.dir, "small.cache"), max_bytes=2000)
+        self.assertTrue(0 < cache.size() <= 2000)
+        cache.close()
+
+
+class TestGet(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = http_cache.ResponseCache(
+            os.path.join(self.dir, "pages.cache"))
+        self.site = ChangingSite()
+        self.server = StubServer(self.site)
+        self.base_url = self.server.start()
+        self.session = session()
+
+    def tearDown(self):
+        self.server.stop()
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def get(self, path):
+        return http_cache.get(self.session, self.base_url + path, self.cache)
+
+    def test_not_modified(self):
+        first = self.get("u0/films/page/1")
+        self.assertTrue(first.modified)
+        self.assertEqual(self.site.render("u0/films/page/1"), first.text)
+
+        again = self.get("u0/films/page/1")
+        self.assertFalse(again.modified)
+        self.assertEqual(first.text, again.text)
+
+        self.assertEqual(1, self.server.not_modified)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+        self.assertEqual(len(first.text.encode()), self.cache.bytes_saved)
+
+    def test_bytes_saved(self):
+        self.site.edits["u0/following/page/1"] = "Amélie, 千と千尋の神隠し"
+        first = self.get("u0/following/page/1")
+        self.get("u0/following/page/1")
+        self.assertEqual(len(first.text.encode()), self.cache.bytes_saved)
+        self.assertTrue(self.cache.bytes_saved > len(first.text))
+
+    def test_modified(self):
+        self.get("u0/following/page/1")
+        self.site.edits["u0/following/page/1"] = "changed"
+
+        page = self.get("u0/following/page/1")
+        self.assertTrue(page.modified)
+        self.assertEqual("changed", page.text)
+        self.assertEqual("changed",
+                         self.cache.lookup(self.base_url +
+                                           "u0/following/page/1").text)
+        self.assertEqual(0, self.server.not_modified)
+
+    def test_errors_are_not_cached(self):
+        page = self.get("nobody/films/page/1")
+        self.assertTrue(page.modified)
+        self.assertIsNone(self.cache.lookup(self.base_url +
+                                            "nobody/films/page/1"))
@@ -0,0 +1,125 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from lmatch import http_client
+from benchmarks.stub_server import StubServer
+HttpClient = http_client.HttpClient
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class TestHttpStats(unittest.TestCase):
+    def test_reuse_rate(self):
+        stats = http_client.HttpStats()
+        self.assertEqual(0.0, stats.reuse_rate())
+        for _ in range(4):
+            stats.request()
+        stats.connected()
+        self.assertEqual(0.75, stats.reuse_rate())
+
+    def test_waited(self):
+        stats = http_client.HttpStats()
+        stats.waited(0.25)
+        stats.waited(0.5)
+        self.assertEqual(0.75, stats.wait_time)
+        self.assertEqual(0.5, stats.max_wait_time)
+
+
+class ClientTests:
+    """ Run against a StubServer, for both backends (see below). """
+    PATHS = ["u{}/following/page/1".format(i) for i in range(60)]
+
+    def client(self, workers, **kwargs):
+        raise NotImplementedError
+
+    def fetch_all(self, client, server, threads):
+        with ThreadPoolExecutor(threads) as pool:
+            return list(pool.map(
+                lambda path: client.get(server.base_url + path),
+                self.PATHS))
+
+    def test_connections_are_reused(self):
+        client = self.client(4)
+        with StubServer(latency=0.005) as server:
+            responses = self.fetch_all(client, server, 4)
+        client.close()
+        self.assertEqual([200] * len(self.PATHS),
+                         [r.status_code for r in responses])
+        self.assertEqual(len(self.PATHS), client.stats.requests)
+        self.assertTrue(0 < client.stats.connections <= 4)
+        self.assertTrue(client.stats.reuse_rate() > 0.9)
+
+    def test_waits_for_a_connection(self):
+        client = self.client(2)
+        with StubServer(latency=0.005) as server:
+            self.fetch_all(client, server, 8)
+        client.close()
+        self.assertTrue(client.stats.connections <= 2)
+        self.assertTrue(client.stats.max_wait_time > 0.005)
+
+    def test_compressed(self):
+        client = self.client(2)
+        with StubServer(compress=True) as server:
+            responses = self.fetch_all(client, server, 2)
+        client.close()
+        self.assertEqual(len(self.PATHS), server.compressed)
+        self.assertTrue(all("follow" in r.text for r in responses))
+
+    def test_stream(self):
+        client = self.client(2)
+        with StubServer(compress=True) as server:
+            url = server.base_url + "u1/films/page/1"
+            text = client.get(url).text
+            response = client.get(url, stream=True)
+            try:
+                chunks = list(client.iter_text(response, 4096))
+            finally:
+                response.close()
+        client.close()
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(text, "".join(chunks))
+
+    def test_not_compressed(self):
+        client = self.client(2, compress=False)
+        with StubServer(compress=True) as server:
+            self.fetch_all(client, server, 2)
+        client.close()
+        self.assertEqual(0, server.compressed)
+
+
+class TestRequestsBackend(ClientTests, unittest.TestCase):
+    def client(self, workers, **kwargs):
+        return HttpClient(workers, backend="requests", **kwargs)
+
+    def test_no_http2(self):
+        with self.assertRaises(ValueError):
+            HttpClient(backend="requests", http2=True)
+
+
+@unittest.skipIf(httpx is None, "needs httpx")
+class TestHttpxBackend(ClientTests, unittest.TestCase):
+    def client(self, workers, **kwargs):
+        return HttpClient(workers, backend="httpx", **kwargs)
+
+
+@unittest.skipIf(h2 is None, "needs h2")
+class TestHttp2(unittest.TestCase):
+    def test_falls_back_to_http1(self):
+        # plain-text servers are only spoken HTTP/2 to over TLS
+        client = HttpClient(2, backend="httpx", http2=True)
+        with StubServer() as server:
+            response = client.get(server.base_url + "u1/following/page/1")
+        client.close()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, client.stats.connections)
+
+
+class TestUnknownBackend(unittest.TestCase):
+    def test_raises(self):
+        with self.assertRaises(ValueError):
+            HttpClient(backend="urllib")
@@ -0,0 +1,109 @@
+import unittest
+from lmatch import job_queue
+from lmatch.profile_crawler import Profile, ProfileCrawler
+JobQueue = job_queue.JobQueue
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_empty(self):
+        q = JobQueue()
+        self.assertEqual(0, len(q))
+        self.assertFalse(Profile("a") in q)
+        self.assertRaises(KeyError, q.pop)
+
+    def test_by_depth(self):
+        q = JobQueue()
+        q.add(Profile("c", 2))
+        q.add(Profile("a1", 0))
+        q.add(Profile("b", 1))
+        q.add(Profile("a2", 0))
+        self.assertEqual(["a1", "a2", "b", "c"],
+                         [q.pop().username for _ in range(4)])
+
+    def test_set(self):
+        q = JobQueue()
+        q.add(Profile("a", 1))
+        q.add(Profile("a", 0))
+        q.add(Profile("b"))
+        self.assertEqual(2, len(q))
+        self.assertTrue(Profile("a") in q)
+        self.assertEqual({Profile("a"), Profile("b")}, q)
+        self.assertEqual({Profile("a"), Profile("b"), Profile("c")},
+                         q | {Profile("c")})
+        # the first one added stays
+        self.assertEqual([1], [p.depth for p in q if p.username == "a"])
+
+        q.discard(Profile("a"))
+        q.discard(Profile("b"))
+        q.discard(Profile("z"))
+        self.assertEqual(0, len(q))
+        self.assertRaises(KeyError, q.pop)
+
+    def test_by_in_degree(self):
+        q = JobQueue(job_queue.by_in_degree)
+        for name in ("a", "b", "c", "d"):
+            q.add(Profile(name, 1))
+        q.bump("c")
+        q.bump("c")
+        q.bump("b")
+        q.bump("z")
+        self.assertEqual(["c", "b", "a", "d"],
+                         [q.pop().username for _ in range(4)])
+
+    def test_max_depth(self):
+        q = JobQueue(job_queue.by_in_degree)
+        q.add(Profile("deep", 4))
+        q.add(Profile("a", 1))
+        q.add(Profile("b", 3))
+        q.bump("deep")
+        q.bump("b")
+        # the deep one is the most followed, but past the limit
+        self.assertEqual(["b", "a"], [q.pop(3).username for _ in range(2)])
+        self.assertRaises(KeyError, q.pop, 3)
+        self.assertEqual(1, len(q))
+        self.assertEqual("deep", q.pop().username)
+
+    def test_stale_entries_are_dropped(self):
+        q = JobQueue(job_queue.by_in_degree)
+        q.add(Profile("a"))
+        q.add(Profile("b"))
+        for _ in range(1000):
+            q.bump("a")
+        self.assertTrue(q.bucketed_ < 100)
+        self.assertEqual(["a", "b"], [q.pop().username for _ in range(2)])
+
+    def test_bumped_back_to_same_key(self):
+        def parity(profile, in_degree):
+            return in_degree % 2
+        q = JobQueue(parity)
+        q.add(Profile("a"))
+        q.add(Profile("b"))
+        q.bump("a")
+        q.bump("a")
+        self.assertEqual(["a", "b"], [q.pop().username for _ in range(2)])
+        self.assertRaises(KeyError, q.pop)
+
+
+class TestCrawlerPriority(unittest.TestCase):
+    def test_breadth_first(self):
+        c = ProfileCrawler()
+        c.enqueue("root")
+        c.on_parsed(c.next_job().username, 0, ["x", "y"], {})
+        c.on_parsed(c.next_job().username, 1, ["x2"], {})
+        # x2 is deeper than y
+        self.assertEqual(["y", "x2"], [c.next_job().username for _ in range(2)])
+
+    def test_most_followed_first(self):
+        c = ProfileCrawler(priority=job_queue.by_in_degree)
+        c.on_parsed("a", 0, ["x", "y"], {})
+        c.on_parsed("b", 0, ["y", "z"], {})
+        self.assertEqual("y", c.next_job().username)
+
+    def test_max_depth(self):
+        c = ProfileCrawler()
+        c.on_parsed("a", 0, ["x"], {})
+        c.on_parsed("x", 1, ["y"], {})
+        self.assertIsNone(c.next_job(1))
+        # left queued, not handed out
+        self.assertEqual((2, 0, 1), c.counts())
+        self.assertEqual("y", c.next_job(2).username)
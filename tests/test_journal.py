@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import unittest
+from lmatch import journal, profile_crawler
+Profile = profile_crawler.Profile
+ProfileCrawler = profile_crawler.ProfileCrawler
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "crawl.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_append_read(self):
+        j = journal.Journal(self.path)
+        j.append(["q", "a", 0])
+        j.append(["p", "a", 0, ["b"], [[1, 5]]])
+        j.close()
+
+        self.assertEqual([["q", "a", 0], ["p", "a", 0, ["b"], [[1, 5]]]],
+                         list(journal.read(self.path)))
+
+        # appending to an existing journal keeps what was there
+        j = journal.Journal(self.path)
+        j.append(["q", "b", 1])
+        j.close()
+        self.assertEqual(3, len(list(journal.read(self.path))))
+
+    def test_partial_record_is_ignored(self):
+        j = journal.Journal(self.path)
+        j.append(["q", "a", 0])
+        j.close()
+        with open(self.path, "a") as f:
+            f.write('["p", "a", 0, ["b"')
+
+        self.assertEqual([["q", "a", 0]], list(journal.read(self.path)))
+
+    def test_compact(self):
+        j = journal.Journal(self.path, compact_every=2)
+        j.append(["q", "a", 0])
+        self.assertFalse(j.due())
+        j.append(["q", "b", 0])
+        self.assertTrue(j.due())
+
+        j.compact([["q", "c", 1]])
+        self.assertFalse(j.due())
+        j.append(["q", "d", 1])
+        j.close()
+
+        self.assertEqual([["q", "c", 1], ["q", "d", 1]],
+                         list(journal.read(self.path)))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_background_compaction(self):
+        j = journal.Journal(self.path, compact_every=2)
+        j.append(["q", "a", 0])
+        j.append(["q", "b", 0])
+        j.begin_compaction()
+        self.assertFalse(j.due())
+        with self.assertRaises(RuntimeError):
+            j.begin_compaction()
+
+        def records():
+            yield ["q", "c", 1]
+            # appended while the compaction is written
+            j.append(["q", "d", 1])
+            # until it ends, the journal is the old file and the side one
+            self.assertEqual(3, len(list(journal.read(self.path))))
+            yield ["q", "e", 1]
+
+        size = j.end_compaction(records())
+        j.append(["q", "f", 1])
+        j.close()
+        self.assertEqual([["q", "c", 1], ["q", "e", 1], ["q", "d", 1],
+                          ["q", "f", 1]], list(journal.read(self.path)))
+        self.assertEqual(size + len('["q","f",1]\n'),
+                         os.path.getsize(self.path))
+        self.assertFalse(os.path.exists(self.path + ".next"))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_failed_compaction(self):
+        j = journal.Journal(self.path)
+        j.append(["q", "a", 0])
+        j.begin_compaction()
+        j.append(["q", "b", 0])
+
+        def records():
+            yield ["q", "c", 1]
+            raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            j.end_compaction(records())
+        # left as it was, and compactions can be started again
+        j.append(["q", "d", 0])
+        self.assertEqual([["q", "a", 0], ["q", "b", 0], ["q", "d", 0]],
+                         list(journal.read(self.path)))
+        j.begin_compaction()
+        j.end_compaction([["q", "e", 0]])
+        j.close()
+        self.assertEqual([["q", "e", 0]], list(journal.read(self.path)))
+
+    def test_recover_side_file(self):
+        j = journal.Journal(self.path)
+        j.append(["q", "a", 0])
+        j.begin_compaction()
+        j.append(["q", "b", 0])
+        # the process dies in the middle of a record
+        j.file_.write('["q", "c"')
+        j.file_.flush()
+        # which closes its files
+        j.file_.close()
+        with open(self.path, "a") as f:
+            f.write('["q", "z"')
+
+        j = journal.Journal(self.path)
+        self.assertFalse(os.path.exists(self.path + ".next"))
+        j.append(["q", "d", 0])
+        j.close()
+        self.assertEqual([["q", "a", 0], ["q", "b", 0], ["q", "d", 0]],
+                         list(journal.read(self.path)))
+
+    def test_crawler_replay(self):
+        c = ProfileCrawler(journal.Journal(self.path))
+        c.enqueue("p1")
+        c.enqueue("p2")
+        c.enqueue("p2")
+        c.next_job()
+        c.next_job()
+        c.on_parsed("p1", 0, ["p2", "p3"], {10: 4, 11: 0})
+        c.journal_.close()
+
+        # p2 was being parsed, it gets queued again
+        r = ProfileCrawler()
+        r.replay(journal.read(self.path))
+        self.assertEqual({Profile("p1")}, r.parsed_)
+        self.assertEqual({Profile("p2"), Profile("p3")}, r.queued_)
+        p = r.parsed_.pop()
+        self.assertEqual(["p2", "p3"], p.following)
+        self.assertEqual({10: 4, 11: 0}, p.movies)
+
+    def test_crawler_compacts(self):
+        c = ProfileCrawler(journal.Journal(self.path, compact_every=3))
+        for i in range(5):
+            c.enqueue("p{}".format(i))
+        c.next_job()
+        c.on_parsed("p9", 1, ["p0"], {1: 2})
+        c.compact_journal()
+        c.journal_.close()
+
+        records = list(journal.read(self.path))
+        self.assertEqual(6, len(records))
+        self.assertEqual(["p", "p9", 1, ["p0"], [[1, 2]]], records[0])
+
+        r = ProfileCrawler()
+        r.replay(records)
+        self.assertEqual(c.parsed_, r.parsed_)
+        self.assertEqual(c.queued_ | c.ongoing_, r.queued_)
+
+
+if __name__ == '__main__':
+    unittest.main()
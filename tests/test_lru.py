@@ -0,0 +1,50 @@
+import unittest
+from lmatch import lru
+LruCache = lru.LruCache
+
+
+class TestLruCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LruCache(3)
+
+    def test_get_put(self):
+        self.assertEqual(None, self.cache.get("a"))
+        self.assertEqual(-1, self.cache.get("a", -1))
+        self.cache.put("a", 1)
+        self.assertEqual(1, self.cache.get("a"))
+        self.cache.put("a", 2)
+        self.assertEqual(2, self.cache.get("a"))
+        self.assertEqual(1, len(self.cache))
+
+        self.assertEqual(2, self.cache.hits)
+        self.assertEqual(2, self.cache.misses)
+        self.assertEqual(0, self.cache.evictions)
+
+    def test_eviction(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.put("c", 3)
+        # "a" becomes the most recently used one
+        self.cache.get("a")
+        self.cache.put("d", 4)
+
+        self.assertEqual(3, len(self.cache))
+        self.assertTrue("b" not in self.cache)
+        self.assertTrue("a" in self.cache)
+        self.assertTrue("c" in self.cache)
+        self.assertTrue("d" in self.cache)
+        self.assertEqual(1, self.cache.evictions)
+
+        self.cache.put("e", 5)
+        self.assertTrue("c" not in self.cache)
+        self.assertEqual(2, self.cache.evictions)
+
+    def test_repr(self):
+        self.cache.put("a", 1)
+        self.cache.get("a")
+        self.assertEqual("1 cached. 1 hits. 0 misses. 0 evictions.",
+                         repr(self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+import tempfile
+import threading
+import unittest
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from lmatch import metrics, profile_crawler
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_same_metric(self):
+        a = self.registry.counter("pages_total", "Pages", kind="film")
+        b = self.registry.counter("pages_total", kind="film")
+        c = self.registry.counter("pages_total", kind="profile")
+        self.assertIs(a, b)
+        self.assertIsNot(a, c)
+
+    def test_kind_mismatch(self):
+        self.registry.counter("pages_total")
+        with self.assertRaises(ValueError):
+            self.registry.histogram("pages_total")
+
+    def test_counter_and_gauge(self):
+        self.registry.counter("pages_total", "Pages fetched").inc(3)
+        queued = [5]
+        self.registry.gauge("queued", "Queued", lambda: queued[0])
+        queued[0] = 7
+        text = self.registry.render()
+        self.assertIn("# HELP pages_total Pages fetched\n", text)
+        self.assertIn("# TYPE pages_total counter\npages_total 3\n", text)
+        self.assertIn("# TYPE queued gauge\nqueued 7\n", text)
+        self.assertEqual({"pages_total": 3, "queued": 7},
+                         self.registry.snapshot())
+
+    def test_histogram(self):
+        h = self.registry.histogram("fetch_seconds", buckets=(.1, 1),
+                                    parser="a\"b")
+        for value in (.05, .5, .5, 2):
+            h.observe(value)
+        text = self.registry.render()
+        self.assertIn("fetch_seconds_bucket{parser=\"a\\\"b\",le=\"0.1\"} 1",
+                      text)
+        self.assertIn("fetch_seconds_bucket{parser=\"a\\\"b\",le=\"1.0\"} 3",
+                      text)
+        self.assertIn("fetch_seconds_bucket{parser=\"a\\\"b\",le=\"+Inf\"} 4",
+                      text)
+        self.assertIn("fetch_seconds_sum{parser=\"a\\\"b\"} 3.05", text)
+        self.assertIn("fetch_seconds_count{parser=\"a\\\"b\"} 4", text)
+        self.assertEqual(1, h.quantile(.5))
+        self.assertEqual(.1, h.quantile(.25))
+        self.assertEqual(1, h.quantile(.99))
+
+    def test_timer(self):
+        h = self.registry.histogram("seconds")
+        with h.time():
+            time.sleep(.01)
+        self.assertEqual(1, h.count)
+        self.assertTrue(h.sum >= .01)
+
+
+class TestTimedLock(unittest.TestCase):
+    def test_wait_is_observed(self):
+        registry = metrics.Registry()
+        lock = metrics.TimedLock("test", registry)
+        wait = registry.histogram("lmatch_lock_wait_seconds", lock="test")
+
+        with lock:
+            pass
+        self.assertEqual(1, wait.count)
+        self.assertEqual(0, wait.sum)
+
+        lock.acquire()
+        thread = threading.Thread(target=lambda: lock.acquire() and
+                                  lock.release())
+        thread.start()
+        time.sleep(.05)
+        lock.release()
+        thread.join()
+        self.assertEqual(3, wait.count)
+        self.assertTrue(wait.sum >= .04)
+
+    def test_profile_crawler(self):
+        wait = metrics.REGISTRY.histogram("lmatch_lock_wait_seconds",
+                                          lock="profile_crawler")
+        before = wait.count
+        crawler = profile_crawler.ProfileCrawler()
+        crawler.enqueue("a")
+        crawler.on_parsed("a", 0, ["b"], {})
+        self.assertEqual(before + 2, wait.count)
+
+
+class TestExposition(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.registry.counter("pages_total").inc()
+
+    def test_server(self):
+        server = metrics.MetricsServer(self.registry)
+        url = server.start()
+        try:
+            with urlopen(url) as response:
+                self.assertIn(b"pages_total 1\n", response.read())
+            with urlopen(url + ".json") as response:
+                self.assertEqual({"pages_total": 1}, json.load(response))
+            with self.assertRaises(HTTPError):
+                urlopen(url + "/nope")
+        finally:
+            server.stop()
+
+    def test_snapshots(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            writer = metrics.SnapshotWriter(path, self.registry,
+                                            interval=.01)
+            time.sleep(.05)
+            self.assertTrue(os.path.exists(path))
+            self.registry.counter("pages_total").inc()
+            writer.close()
+            with open(path) as f:
+                snapshot = json.load(f)
+        self.assertEqual(2, snapshot["pages_total"])
+        self.assertIn("time", snapshot)
@@ -0,0 +1,107 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from lmatch import ratings
+try:
+    import numpy as np
+    from lmatch import neighbours, similarity
+except ImportError:
+    neighbours = None
+
+
+def random_profiles(n, seed=3):
+    rnd = random.Random(seed)
+    profiles = []
+    for i in range(n):
+        films = rnd.sample(range(1, 60), rnd.randint(1, 25))
+        profiles.append(("u{}".format(i),
+                         {f: rnd.randint(0, 10) for f in films}))
+    return profiles
+
+
+@unittest.skipIf(neighbours is None, "needs numpy and scipy")
+class TestNeighbours(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.matrix_path = os.path.join(self.dir, "crawl.ratings")
+        self.index_path = os.path.join(self.dir, "crawl.neighbours")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def save(self, profiles):
+        ratings.RatingsMatrix.from_profiles(profiles).save(self.matrix_path)
+
+    def test_top_k(self):
+        common = np.array([1, 0, 3, 2, 5, 1])
+        score = np.array([.5, 0, -.5, .1, .5, .3])
+        self.assertEqual([3, 5, 0, 2],
+                         list(neighbours.top_k(common, score, 4, "diff")))
+        self.assertEqual([0, 2],
+                         list(neighbours.top_k(common, score, 5, "diff")[2:4]))
+        self.assertEqual([0, 4],
+                         list(neighbours.top_k(common, score, 2, "cosine")))
+
+    def test_build_matches_engine(self):
+        profiles = random_profiles(40)
+        self.save(profiles)
+        engine = similarity.SimilarityEngine(
+            ratings.RatingsMatrix.from_profiles(profiles))
+
+        for metric in similarity.METRICS:
+            path = os.path.join(self.dir, metric)
+            index = neighbours.NeighbourIndex(path, k=5, metric=metric)
+            self.assertEqual(40, neighbours.update(
+                self.matrix_path, index, processes=2, block_size=7))
+
+            for (username, _) in profiles:
+                expected = engine.matches(username, metric)[:5]
+                self.assertEqual(expected, index.lookup(username))
+            index.close()
+
+    def test_incremental_update(self):
+        profiles = random_profiles(50)
+        self.save(profiles[:30])
+        index = neighbours.NeighbourIndex(self.index_path, k=6,
+                                          metric="cosine")
+        self.assertEqual(30, neighbours.update(self.matrix_path, index,
+                                               processes=2))
+        # nothing changed, nothing to compute
+        self.assertEqual(0, neighbours.update(self.matrix_path, index))
+
+        # 20 new profiles, and one with different ratings
+        profiles[3] = ("u3", {1: 10, 2: 9, 3: 1})
+        self.save(profiles)
+        self.assertEqual(21, neighbours.update(self.matrix_path, index,
+                                               processes=2))
+
+        full_path = os.path.join(self.dir, "full")
+        full = neighbours.NeighbourIndex(full_path, k=6, metric="cosine")
+        neighbours.update(self.matrix_path, full, processes=2)
+        for (username, _) in profiles:
+            expected = full.lookup(username)
+            got = index.lookup(username)
+            self.assertEqual([round(n[2], 9) for n in expected],
+                             [round(n[2], 9) for n in got])
+        index.close()
+        full.close()
+
+    def test_index_remembers_settings(self):
+        index = neighbours.NeighbourIndex(self.index_path, k=3,
+                                          metric="pearson")
+        index.store({"a": [("b", 2, .5)]}, {"a": 1})
+        index.close()
+
+        index = neighbours.NeighbourIndex(self.index_path)
+        self.assertEqual(3, index.k)
+        self.assertEqual("pearson", index.metric)
+        self.assertEqual({"a": 1}, index.fingerprints())
+        self.assertEqual([("b", 2, .5)], index.lookup("a"))
+        self.assertEqual([], index.lookup("b"))
+        index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -36,11 +36,33 @@ class Parse(unittest.TestCase):
         self.assertEqual(None,
                          parse.next_page(self.page_following_2))
 
+    def test_page_path(self):
+        self.assertEqual("jlcordeiro/films/page/5",
+                         parse.page_path("jlcordeiro/films/page/1", 5))
+        self.assertEqual("jlcordeiro/following/page/12",
+                         parse.page_path("jlcordeiro/following/page/1/", 12))
+
+    def test_get_last_page(self):
+        # following pages only have next / previous links
+        self.assertEqual(None, parse.last_page(self.page_following_1))
+        self.assertEqual(None, parse.last_page(self.page_following_2))
+
+        page = self.html_open("tests/data/jlcordeiro_watched_1.html")
+        self.assertEqual(7, parse.last_page(page))
+        page = self.html_open("tests/data/jlcordeiro_watched_3.html")
+        self.assertEqual(7, parse.last_page(page))
+        page = self.html_open("tests/data/jlcordeiro_watched_7.html")
+        self.assertEqual(7, parse.last_page(page))
+        page = self.html_open("tests/data/tommyatlon_watched_1.html")
+        self.assertEqual(10, parse.last_page(page))
+
     def test_parse_movies(self):
         page = self.html_open("tests/data/jlcordeiro_watched_1.html")
         movies = parse.movies_watched(page)
         next_page = parse.next_page(page)
         self.assertEqual("jlcordeiro/films/page/2/", next_page)
+        # the last movie of the page keeps its rating
+        self.assertEqual(("the-martian", 7), movies[-1])
 
         page = self.html_open("tests/data/jlcordeiro_watched_3.html")
         movies = parse.movies_watched(page)
@@ -0,0 +1,51 @@
+import glob
+import unittest
+from lmatch import parse, parse_regex
+
+
+class ParseRegex(unittest.TestCase):
+    """ The regex backend must agree with parse on every page we have. """
+
+    def setUp(self):
+        self.pages = {}
+        for path in sorted(glob.glob("tests/data/*.html")):
+            with open(path) as f:
+                self.pages[path] = f.read()
+
+    def check_same(self, function, pages):
+        for path in pages:
+            self.assertEqual(getattr(parse, function)(self.pages[path]),
+                             getattr(parse_regex, function)(self.pages[path]),
+                             "{} differs on {}".format(function, path))
+
+    def test_next_page(self):
+        self.check_same("next_page", self.pages)
+        self.assertEqual(None, parse_regex.next_page(""))
+
+    def test_last_page(self):
+        self.check_same("last_page", self.pages)
+
+    def test_following(self):
+        self.check_same("following", self.pages)
+        self.assertEqual(25, len(parse_regex.following(
+            self.pages["tests/data/jlcordeiro_following_1.html"])))
+
+    def test_movies_watched(self):
+        self.check_same("movies_watched", self.pages)
+        movies = parse_regex.movies_watched(
+            self.pages["tests/data/tommyatlon_watched_1.html"])
+        self.assertEqual(("6-underground", 9), movies[0])
+        self.assertEqual(("the-equalizer-2", 10), movies[-7])
+        self.assertEqual(("jurassic-world-fallen-kingdom", 0), movies[-1])
+        self.assertEqual([], parse_regex.movies_watched(""))
+
+    def test_parse_film(self):
+        for path in glob.glob("tests/data/film_*.html"):
+            a = parse.parse_film(self.pages[path])
+            b = parse_regex.parse_film(self.pages[path])
+            self.assertEqual((a.id, a.url, a.name, a.avg_rate),
+                             (b.id, b.url, b.name, b.avg_rate))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import glob
+import unittest
+from lmatch import parse, parse_regex, parse_stream, pipeline
+
+
+def chunked(page, size):
+    return [page[i:i + size] for i in range(0, len(page), size)]
+
+
+class ParseStream(unittest.TestCase):
+    """ Fed in chunks of any size, must agree with parse on every page. """
+
+    def setUp(self):
+        self.pages = {}
+        for path in sorted(glob.glob("tests/data/*.html")):
+            with open(path) as f:
+                self.pages[path] = f.read()
+
+    def check_same(self, parser):
+        for (path, page) in self.pages.items():
+            expected = pipeline.parse_listing(parser, page)
+            for size in (37, 1000, 8192, len(page)):
+                self.assertEqual(
+                    expected,
+                    parse_stream.parse_chunks(parser, chunked(page, size)),
+                    "{} differs on {} in chunks of {}".format(
+                        parser.__name__, path, size))
+
+    def test_following(self):
+        self.check_same(parse.following)
+
+    def test_movies_watched(self):
+        self.check_same(parse.movies_watched)
+
+    def test_for_parser(self):
+        self.assertIsInstance(parse_stream.for_parser(parse_regex.following),
+                              parse_stream.FollowingParser)
+        with self.assertRaises(KeyError):
+            parse_stream.for_parser(parse.parse_film)
+        # only the parsers of a kind of listing have an entry()
+        with self.assertRaises(TypeError):
+            parse_stream.ListingParser()
+
+    def test_entries_come_out_as_they_end(self):
+        page = self.pages["tests/data/tommyatlon_watched_1.html"]
+        listing = parse_stream.for_parser(parse.movies_watched)
+        fed = [listing.feed(chunk) for chunk in chunked(page, 4096)]
+        listing.close()
+        # the first film is out long before the page is over
+        first = next(i for (i, entries) in enumerate(fed) if entries)
+        self.assertTrue(first < len(fed) // 2)
+        self.assertEqual(("6-underground", 9), fed[first][0])
+        # a couple of chunks at most, not the whole page
+        self.assertTrue(listing.peak_buffer < 2 * 4096 + 1024)
+
+    def test_empty(self):
+        self.assertEqual(([], None, None),
+                         parse_stream.parse_chunks(parse.following, []))
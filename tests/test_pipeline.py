@@ -0,0 +1,88 @@
+import threading
+import unittest
+from lmatch import parse, parse_regex, pipeline
+
+# held by the test while the pool starts, see test_workers_not_forked
+_held = threading.Lock()
+
+
+def _held_free():
+    return _held.acquire(blocking=False)
+
+
+class TestStageStats(unittest.TestCase):
+    def test_record(self):
+        stats = pipeline.StageStats("fetch")
+        stats.record(.5, 100)
+        stats.record(.25, 50)
+        self.assertEqual(2, stats.pages)
+        self.assertEqual(150, stats.bytes)
+        self.assertEqual(.75, stats.busy_time)
+        self.assertTrue(stats.rate() > 0)
+        self.assertTrue(repr(stats).startswith("fetch: 2 pages"))
+
+
+class TestParsePool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = pipeline.ParsePool(2, max_queued=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def html_open(self, x):
+        with open(x) as f:
+            return f.read()
+
+    def test_parse_listing(self):
+        page = self.html_open("tests/data/jlcordeiro_watched_1.html")
+        self.assertEqual((parse.movies_watched(page),
+                          "jlcordeiro/films/page/2/", 7),
+                         pipeline.parse_listing(parse.movies_watched, page))
+
+        page = self.html_open("tests/data/jlcordeiro_following_2.html")
+        self.assertEqual((parse.following(page), None, None),
+                         pipeline.parse_listing(parse_regex.following, page))
+
+    def test_listing(self):
+        page = self.html_open("tests/data/jlcordeiro_following_1.html")
+        self.assertEqual(pipeline.parse_listing(parse.following, page),
+                         self.pool.listing(parse.following, page))
+
+    def test_call(self):
+        page = self.html_open("tests/data/film_the-way-back-2020.html")
+        film = self.pool.call(parse.parse_film, page)
+        self.assertEqual(458743, film.id)
+        self.assertEqual("the-way-back-2020", film.url)
+
+    def test_queue_is_bounded(self):
+        page = self.html_open("tests/data/jlcordeiro_watched_3.html")
+        expected = parse.movies_watched(page)
+        results = []
+
+        def fetcher():
+            for _ in range(5):
+                results.append(self.pool.call(parse.movies_watched, page))
+
+        threads = [threading.Thread(target=fetcher) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([expected] * 30, results)
+        self.assertEqual(0, self.pool.queued)
+        self.assertTrue(self.pool.peak_queued <= 3)
+        self.assertTrue(self.pool.stats.pages >= 30)
+
+    def test_workers_not_forked(self):
+        # a fork, while a thread holds a lock, would have it locked too
+        pool = pipeline.ParsePool(1)
+        with _held:
+            self.assertTrue(pool.call(_held_free))
+        pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,13 @@ class TestProfile(unittest.TestCase):
         p2 = Profile("j", 0, [], [])
         self.assertEqual(p2.isEmpty(), False)
 
+    def test_compact(self):
+        p = Profile("".join(["j", "oe"]), 1, ["a", "b"], {})
+        self.assertFalse(hasattr(p, "__dict__"))
+        self.assertIs(Profile("joe").username, p.username)
+        self.assertEqual(["a", "b"], p.following)
+        self.assertEqual(2, len(p.following.ids))
+
     def test_reptr(self):
         p1 = Profile("j", 0)
         self.assertEqual("j", repr(p1))
@@ -26,7 +26,7 @@ class TestProfileCrawler(unittest.TestCase):
 
     def test_cancel_ongoing(self):
         c = ProfileCrawler()
-        c.parsed_ = {1, 2, 3}  # put some junk in
+        c.parsed_ = {Profile("1"), Profile("2"), Profile("3")}  # put some junk in
         c.ongoing_ = {Profile("a"), Profile("b"), Profile("c")}
         c.queued_ = {Profile("d"), Profile("e"), Profile("f")}
 
@@ -34,7 +34,7 @@ class TestProfileCrawler(unittest.TestCase):
 
         # checked that the profiles already parsed don't get affected
         self.assertEqual(3, len(c.parsed_))
-        self.assertTrue({1, 2, 3}, c.parsed_)
+        self.assertEqual({Profile("1"), Profile("2"), Profile("3")}, c.parsed_)
 
         # all ongoing jobs should be gone...
         self.assertEqual(0, len(c.ongoing_))
@@ -101,7 +101,8 @@ class TestProfileCrawler(unittest.TestCase):
                              Profile("parsed2"),
                              Profile("parsed3")}
         c.ongoing_ = {Profile("ongoing1"), Profile("ongoing2")}
-        c.queued_ = {Profile("q1"), Profile("q2"), Profile("q3")}
+        for q in ("q1", "q2", "q3"):
+            c.queued_.add(Profile(q))
 
         c.on_parsed("ongoing2", 0,
                     ["newp1", "newp2", "newp3", "parsed2",
@@ -208,6 +209,95 @@ class TestProfileCrawler(unittest.TestCase):
         self.assertEqual({"p1", "p2"}, set(d["parsed"][0][2]))
         self.assertEqual({"p1", "p2", "p3"}, set([p[0] for p in d["queued"]]))
 
+    def test_index(self):
+        c = ProfileCrawler()
+        c.enqueue("a")
+        c.enqueue("b")
+        self.assertEqual(profile_crawler.QUEUED, c.index_["a"])
+        self.assertEqual(profile_crawler.QUEUED, c.index_["b"])
+        self.assertEqual(2, len(c.index_))
+        self.assertFalse("c" in c.index_)
+
+        job = c.next_job()
+        self.assertEqual(profile_crawler.ONGOING, c.index_[job.username])
+
+        c.on_parsed(job.username, 0, ["b", "c", job.username], {})
+        self.assertEqual(profile_crawler.PARSED, c.index_[job.username])
+        self.assertEqual(profile_crawler.QUEUED, c.index_["c"])
+        self.assertEqual(3, len(c.index_))
+
+        c.next_job()
+        c.cancel_ongoing_jobs()
+        self.assertEqual(2, len(c.queued_))
+        self.assertEqual(profile_crawler.QUEUED, c.index_["c"])
+
+    def test_on_parsed_journals_in_one_batch(self):
+        class Journal:
+            def __init__(self):
+                self.batches = []
+
+            def append(self, record):
+                self.batches.append([record])
+
+            def extend(self, records):
+                self.batches.append(records)
+
+            def due(self):
+                return False
+
+        j = Journal()
+        c = ProfileCrawler(j)
+        c.enqueue("a")
+        c.on_parsed("a", 0, ["b", "a", "c", "b"], {1: 5})
+        self.assertEqual([[["q", "a", 0]],
+                          [["q", "b", 1], ["q", "c", 1],
+                           ["p", "a", 0, ["b", "a", "c", "b"], [[1, 5]]]]],
+                         j.batches)
+
+    def test_refresh(self):
+        c = ProfileCrawler()
+        c.on_parsed("a", 0, ["b"], {1: 5, 2: 6})
+        c.next_job()
+        self.assertEqual(1, c.refresh())
+        self.assertEqual(0, c.refresh())
+
+        job = c.next_job()
+        self.assertEqual("a", job.username)
+        self.assertEqual({1: 5, 2: 6}, dict(job.movies))
+        # still parsed while it is refreshed
+        self.assertTrue(Profile("a") in c.parsed_)
+
+        c.on_refreshed(job, ["b", "c"], {2: 8, 3: 1}, 3)
+        (p,) = [p for p in c.parsed_ if p.username == "a"]
+        self.assertEqual({1: 5, 2: 8, 3: 1}, dict(p.movies))
+        self.assertEqual(["b", "c"], p.following)
+        self.assertEqual(3, p.newest)
+        self.assertTrue(Profile("c") in c.queued_)
+        self.assertEqual({Profile("b")}, c.ongoing_)
+
+    def test_profile_set(self):
+        a = Profile("a", 1, ["b"], {1: 5})
+        s = profile_crawler.ProfileSet([a, Profile("b")])
+        self.assertEqual({Profile("a"), Profile("b")}, s)
+        self.assertIs(a, s.get(Profile("a")))
+        self.assertIsNone(s.get(Profile("c")))
+        # like a set, adding an equal profile keeps the one it has
+        s.add(Profile("a"))
+        self.assertIs(a, s.get(Profile("a")))
+        s.discard(Profile("a"))
+        self.assertEqual({Profile("b")}, s)
+        self.assertEqual({Profile("b"), Profile("c")}, s | {Profile("c")})
+
+    def test_newest_record(self):
+        p = Profile("a", 1, ["b"], {1: 5}, 7)
+        record = ["p"] + list(profile_crawler._repr_profile(p))
+        self.assertEqual(["p", "a", 1, ["b"], [[1, 5]], 7], record)
+        self.assertEqual(7, profile_crawler.from_record(record).newest)
+
+        # records written before there were high-water marks
+        self.assertIsNone(profile_crawler.from_record(
+            ["p", "a", 1, ["b"], [[1, 5]]]).newest)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,134 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from lmatch import ratings
+from tests.test_neighbours import random_profiles
+try:
+    from lmatch import query_service, similarity
+except ImportError:
+    query_service = None
+
+
+@unittest.skipIf(query_service is None, "needs numpy and scipy")
+class TestQueryService(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "crawl.ratings")
+        self.profiles = random_profiles(60)
+        self.save(self.profiles)
+        # polled by hand, with reload()
+        self.service = query_service.QueryService(self.path, poll=3600)
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.dir)
+
+    def save(self, profiles):
+        ratings.RatingsMatrix.from_profiles(profiles).save(self.path)
+
+    def test_matches(self):
+        engine = similarity.SimilarityEngine(
+            ratings.RatingsMatrix.from_profiles(self.profiles))
+        for metric in similarity.METRICS:
+            expected = engine.matches("u3", metric)
+            self.assertEqual((0, expected[:10]),
+                             self.service.matches("u3", metric, 10))
+            # the same first k, without a full sort
+            self.assertEqual((0, expected[:7]),
+                             self.service.top("u3", 7, metric))
+        with self.assertRaises(KeyError):
+            self.service.top("nope")
+        with self.assertRaises(ValueError):
+            self.service.top("u3", 0)
+
+    def test_common(self):
+        (a, b) = (dict(self.profiles[1][1]), dict(self.profiles[2][1]))
+        expected = [(f, a[f], b[f]) for f in sorted(set(a) & set(b))]
+        self.assertEqual((0, expected), self.service.common("u1", "u2"))
+        with self.assertRaises(KeyError):
+            self.service.common("u1", "nope")
+
+    def test_reload(self):
+        self.assertFalse(self.service.reload())
+        self.save(self.profiles + [("new", {1: 8, 2: 4})])
+        self.assertTrue(self.service.reload())
+        (generation, films) = self.service.common("new", "new")
+        self.assertEqual(1, generation)
+        self.assertEqual([(1, 8, 8), (2, 4, 4)], films)
+        self.assertEqual(1, self.service.status()["reloads"])
+        self.assertEqual(61, self.service.status()["profiles"])
+
+    def test_watcher(self):
+        service = query_service.QueryService(self.path, poll=.01)
+        try:
+            self.save(self.profiles[:10])
+            for _ in range(500):
+                if service.status()["generation"]:
+                    break
+                service.stopped_.wait(.01)
+            self.assertEqual(10, service.status()["profiles"])
+        finally:
+            service.close()
+
+
+@unittest.skipIf(query_service is None, "needs numpy and scipy")
+class TestQueryServer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        path = os.path.join(self.dir, "crawl.ratings")
+        ratings.RatingsMatrix.from_profiles(random_profiles(30)).save(path)
+        self.service = query_service.QueryService(path, poll=3600)
+
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.dir)
+
+    def get(self, conn, url):
+        conn.request("GET", url)
+        response = conn.getresponse()
+        body = response.read()
+        return (response.status,
+                json.loads(body) if response.status == 200 else None)
+
+    def check(self, server):
+        conn = query_service.connect(server.start())
+        try:
+            (status, body) = self.get(conn, "/top?user=u1&k=3&metric=cosine")
+            self.assertEqual(200, status)
+            self.assertEqual("cosine", body["metric"])
+            self.assertEqual([list(m) for m in
+                              self.service.top("u1", 3, "cosine")[1]],
+                             body["matches"])
+            # same connection
+            (status, body) = self.get(conn, "/match?user=u1&limit=5")
+            self.assertEqual(5, len(body["matches"]))
+            (status, body) = self.get(conn, "/common?user=u1&other=u2")
+            self.assertEqual([list(f) for f in
+                              self.service.common("u1", "u2")[1]],
+                             body["films"])
+            (status, body) = self.get(conn, "/status")
+            self.assertEqual(30, body["profiles"])
+
+            self.assertEqual(404, self.get(conn, "/top?user=nope")[0])
+            self.assertEqual(404, self.get(conn, "/nope")[0])
+            self.assertEqual(400, self.get(conn, "/top?user=u1&k=x")[0])
+            self.assertEqual(400, self.get(conn, "/match?user=u1&metric=x")[0])
+            self.assertEqual(400, self.get(conn, "/common?user=u1")[0])
+        finally:
+            conn.close()
+            server.stop()
+
+    def test_http(self):
+        self.check(query_service.QueryServer(self.service))
+
+    def test_unix_socket(self):
+        path = os.path.join(self.dir, "lmatch.sock")
+        self.check(query_service.QueryServer(self.service,
+                                             socket_path=path))
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
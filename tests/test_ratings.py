@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from lmatch import ratings
+Ratings = ratings.Ratings
+RatingsMatrix = ratings.RatingsMatrix
+
+
+class TestRatings(unittest.TestCase):
+    def setUp(self):
+        self.r = Ratings({42: 7, 3: 0, 1000: 10})
+
+    def test_ctor(self):
+        self.assertEqual([3, 42, 1000], list(self.r.ids))
+        self.assertEqual([0, 7, 10], list(self.r.rates))
+        self.assertEqual(0, len(Ratings()))
+        self.assertEqual(Ratings({1: 2}), Ratings([(1, 2)]))
+
+    def test_mapping(self):
+        self.assertEqual(3, len(self.r))
+        self.assertEqual(7, self.r[42])
+        self.assertEqual(0, self.r[3])
+        self.assertTrue(1000 in self.r)
+        self.assertTrue(4 not in self.r)
+        self.assertTrue(2000 not in self.r)
+        self.assertEqual(None, self.r.get(4))
+        with self.assertRaises(KeyError):
+            self.r[4]
+
+        self.assertEqual([3, 42, 1000], list(self.r))
+        self.assertEqual([(3, 0), (42, 7), (1000, 10)], list(self.r.items()))
+        self.assertEqual({3: 0, 42: 7, 1000: 10}, self.r)
+        self.assertEqual("{3: 0, 42: 7, 1000: 10}", repr(self.r))
+
+
+class TestRatingsMatrix(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.m = RatingsMatrix.from_profiles([("a", {3: 1, 1: 2}),
+                                              ("b", {}),
+                                              ("c", Ratings({5: 10}))])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self, m):
+        self.assertEqual(3, len(m))
+        self.assertEqual(["a", "b", "c"], m.usernames)
+        self.assertEqual([0, 2, 2, 3], list(m.offsets))
+        self.assertEqual({1: 2, 3: 1}, m.get("a"))
+        self.assertEqual({}, m.get("b"))
+        self.assertEqual(10, m.get("c")[5])
+        self.assertEqual(None, m.get("d"))
+        self.assertEqual(["a", "b", "c"], [u for (u, _) in m.rows()])
+
+    def test_from_profiles(self):
+        self.check(self.m)
+
+    def test_save_load(self):
+        path = os.path.join(self.dir, "crawl.ratings")
+        self.m.save(path)
+        self.check(RatingsMatrix.load(path))
+
+    def test_save_load_empty(self):
+        path = os.path.join(self.dir, "crawl.ratings")
+        RatingsMatrix.from_profiles([]).save(path)
+        self.assertEqual(0, len(RatingsMatrix.load(path)))
+
+    def test_load_garbage(self):
+        path = os.path.join(self.dir, "crawl.ratings")
+        with open(path, "wb") as f:
+            f.write(b"not a matrix at all, really")
+        with self.assertRaises(ValueError):
+            RatingsMatrix.load(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import math
+import random
+import unittest
+from lmatch import ratings
+try:
+    from lmatch import similarity
+except ImportError:
+    similarity = None
+
+
+def reference_diff(main, profiles):
+    """ stats.py, before it was vectorised. """
+    matches = []
+    for (username, movies) in profiles:
+        if movies is main:
+            continue
+
+        deltas = []
+        for this_name, this_rating in movies.items():
+            if this_rating == 0 or this_name not in main:
+                continue
+            deltas.extend([this_rating - main[this_name]])
+
+        matches.extend([[username,
+                         len(deltas),
+                         (sum(deltas) * 1.0 / len(deltas)) if sum(deltas) else
+                         0]])
+        matches = sorted(matches, key=lambda m: abs(m[2]))
+
+    return [tuple(m) for m in matches if m[1]]
+
+
+@unittest.skipIf(similarity is None, "needs numpy and scipy")
+class TestSimilarityEngine(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(7)
+        self.profiles = []
+        for i in range(60):
+            films = rnd.sample(range(1, 80), rnd.randint(0, 30))
+            self.profiles.append(("u{}".format(i),
+                                  {f: rnd.randint(0, 10) for f in films}))
+        self.engine = similarity.SimilarityEngine(
+            ratings.RatingsMatrix.from_profiles(self.profiles))
+
+    def test_diff_matches_reference(self):
+        for (username, movies) in self.profiles:
+            expected = reference_diff(movies, self.profiles)
+            self.assertEqual(expected, self.engine.matches(username))
+
+    def test_small_diff(self):
+        engine = similarity.SimilarityEngine(
+            ratings.RatingsMatrix.from_profiles([
+                ("a", {1: 6, 2: 0, 3: 8}),
+                ("b", {1: 8, 2: 4, 4: 2}),
+                ("c", {1: 6, 3: 0}),
+                ("d", {5: 5})]))
+
+        self.assertEqual([("c", 1, 0.0), ("b", 2, 3.0)],
+                         engine.matches("a"))
+
+    def test_cosine(self):
+        engine = similarity.SimilarityEngine(
+            ratings.RatingsMatrix.from_profiles([
+                ("a", {1: 2, 2: 4}),
+                ("b", {1: 1, 2: 2}),
+                ("c", {1: 4, 3: 4}),
+                ("d", {})]))
+
+        matches = engine.matches("a", "cosine")
+        self.assertEqual(["b", "c"], [m[0] for m in matches])
+        self.assertAlmostEqual(1.0, matches[0][2])
+        self.assertAlmostEqual(8 / (math.sqrt(20) * math.sqrt(32)),
+                               matches[1][2])
+
+    def test_pearson(self):
+        engine = similarity.SimilarityEngine(
+            ratings.RatingsMatrix.from_profiles([
+                ("a", {1: 2, 2: 4, 3: 6, 9: 0}),
+                ("b", {1: 10, 2: 8, 3: 6, 4: 1}),
+                ("c", {1: 3, 2: 5, 3: 7})]))
+
+        matches = engine.matches("a", "pearson")
+        self.assertEqual(["c", "b"], [m[0] for m in matches])
+        self.assertAlmostEqual(1.0, matches[0][2])
+        self.assertAlmostEqual(-1.0, matches[1][2])
+
+    def test_unknown_metric(self):
+        with self.assertRaises(ValueError):
+            self.engine.matches("u0", "jaccard")
+
+
+if __name__ == '__main__':
+    unittest.main()
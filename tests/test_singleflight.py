@@ -0,0 +1,81 @@
+import threading
+import unittest
+from lmatch import singleflight
+SingleFlight = singleflight.SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.sf = SingleFlight()
+
+    def test_do(self):
+        self.assertEqual(4, self.sf.do("a", lambda: 4))
+        # nothing is cached
+        self.assertEqual(5, self.sf.do("a", lambda: 5))
+        self.assertEqual(2, self.sf.calls)
+        self.assertEqual(0, self.sf.shared)
+
+    def test_exception(self):
+        def fail():
+            raise ValueError("nope")
+
+        with self.assertRaises(ValueError):
+            self.sf.do("a", fail)
+        self.assertEqual(1, self.sf.do("a", lambda: 1))
+
+    def test_same_key_is_shared(self):
+        started = threading.Event()
+        release = threading.Event()
+        runs = []
+
+        def slow():
+            runs.append(1)
+            started.set()
+            release.wait()
+            return 42
+
+        results = []
+        def call():
+            results.append(self.sf.do("film", slow))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+
+        followers = [threading.Thread(target=call) for _ in range(5)]
+        for t in followers:
+            t.start()
+        while self.sf.shared < 5:
+            pass
+
+        release.set()
+        for t in [leader] + followers:
+            t.join()
+
+        self.assertEqual([1], runs)
+        self.assertEqual([42] * 6, results)
+        self.assertEqual(1, self.sf.calls)
+        self.assertEqual(5, self.sf.shared)
+
+    def test_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait_for_all():
+            # only returns if all three keys are running at the same time
+            barrier.wait()
+            return True
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda k=k: results.append(self.sf.do(k, wait_for_all)))
+            for k in ("a", "b", "c")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([True] * 3, results)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from requests import session
+from lmatch import throttle
+from benchmarks.stub_server import StubServer
+RateLimiter = throttle.RateLimiter
+ThrottledSession = throttle.ThrottledSession
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+
+class Session:
+    """ Gives back the responses (or raises the exceptions) in order. """
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_burst_then_rate(self):
+        limiter = RateLimiter(rate=10, burst=2, clock=self.clock)
+        self.assertEqual(0, limiter.reserve())
+        self.assertEqual(0, limiter.reserve())
+        self.assertAlmostEqual(0.1, limiter.reserve())
+        self.assertAlmostEqual(0.2, limiter.reserve())
+
+        self.clock.now += 1
+        self.assertEqual(0, limiter.reserve())
+        self.assertEqual(4 + 1, limiter.requests)
+
+    def test_throttled(self):
+        limiter = RateLimiter(rate=8, burst=1, min_rate=3, clock=self.clock)
+        limiter.on_throttled(5)
+        self.assertEqual(4, limiter.rate)
+        self.assertAlmostEqual(5, limiter.reserve())
+        # the other requests in flight
+        limiter.on_throttled()
+        self.assertEqual(4, limiter.rate)
+
+        self.clock.now += 1
+        limiter.on_throttled()
+        self.clock.now += 1
+        limiter.on_throttled()
+        self.assertEqual(3, limiter.rate)
+        self.assertEqual(4, limiter.throttled)
+
+        self.clock.now += 10
+        self.assertEqual(0, limiter.reserve())
+
+    def test_recovers(self):
+        limiter = RateLimiter(rate=8, increase=1, clock=self.clock)
+        limiter.on_throttled()
+        for _ in range(100):
+            limiter.on_success()
+        self.assertEqual(8, limiter.rate)
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_parse(self):
+        self.assertIsNone(throttle.retry_after({}))
+        self.assertEqual(3, throttle.retry_after({"Retry-After": "3"}))
+        self.assertIsNone(throttle.retry_after({"Retry-After": "soon"}))
+        import time
+        later = throttle.retry_after(
+            {"Retry-After": formatdate(time.time() + 60, usegmt=True)})
+        self.assertTrue(55 < later <= 60)
+
+
+class TestThrottledSession(unittest.TestCase):
+    def throttled(self, session, **kwargs):
+        return ThrottledSession(session, RateLimiter(rate=1000),
+                                backoff=0, **kwargs)
+
+    def test_ok(self):
+        s = self.throttled(Session(Response(200)))
+        self.assertEqual(200, s.get("u").status_code)
+        self.assertEqual(0, s.retried)
+
+    def test_retries(self):
+        session = Session(Response(503), OSError("reset"),
+                          Response(429, {"Retry-After": "0"}), Response(404))
+        s = self.throttled(session)
+        self.assertEqual(404, s.get("u").status_code)
+        self.assertEqual(4, session.calls)
+        self.assertEqual(3, s.retried)
+        self.assertEqual(2, s.limiter.throttled)
+
+    def test_gives_up(self):
+        s = self.throttled(Session(*[Response(500)] * 3), retries=2)
+        self.assertRaises(throttle.TooManyRetries, s.get, "u")
+
+        s = self.throttled(Session(*[OSError("reset")] * 3), retries=2)
+        self.assertRaises(OSError, s.get, "u")
+
+        s = self.throttled(Session(ValueError("bug")))
+        self.assertRaises(ValueError, s.get, "u")
+
+    def test_async(self):
+        class AsyncSession(Session):
+            async def get(self, url, **kwargs):
+                return Session.get(self, url, **kwargs)
+
+        s = self.throttled(AsyncSession(Response(503), Response(200)))
+        response = asyncio.run(s.get_async("u"))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, s.retried)
+
+
+class TestAgainstServer(unittest.TestCase):
+    PATHS = ["u{}/following/page/1".format(i) for i in range(40)]
+
+    def fetch_all(self, server, limiter, workers=8):
+        s = ThrottledSession(session(), limiter, retries=8, backoff=0.05)
+        with ThreadPoolExecutor(workers) as pool:
+            statuses = list(pool.map(
+                lambda path: s.get(server.base_url + path).status_code,
+                self.PATHS))
+        return (statuses, s)
+
+    def test_failures_are_retried(self):
+        with StubServer(fail_every=3) as server:
+            (statuses, s) = self.fetch_all(server, RateLimiter(rate=1000))
+        self.assertEqual([200] * len(self.PATHS), statuses)
+        self.assertTrue(server.failed > 0)
+        self.assertEqual(server.failed, s.retried)
+
+    def test_slows_down_to_the_server_limit(self):
+        with StubServer(limit=20, retry_after="0.1") as server:
+            limiter = RateLimiter(rate=400, burst=20)
+            (statuses, s) = self.fetch_all(server, limiter)
+        self.assertEqual([200] * len(self.PATHS), statuses)
+        self.assertTrue(limiter.throttled > 0)
+        self.assertTrue(limiter.rate < 400)
@@ -0,0 +1,79 @@
+import pickle
+import unittest
+from lmatch import usernames
+UsernameTable = usernames.UsernameTable
+Following = usernames.Following
+
+
+class TestUsernameTable(unittest.TestCase):
+    def test_ids(self):
+        t = UsernameTable()
+        self.assertEqual(0, t.id("a"))
+        self.assertEqual(1, t.id("b"))
+        self.assertEqual(0, t.id("a"))
+        self.assertEqual("b", t.name(1))
+        self.assertEqual(2, len(t))
+        self.assertTrue("a" in t)
+        self.assertFalse("c" in t)
+
+    def test_intern(self):
+        t = UsernameTable()
+        a = "".join(["us", "er"])
+        b = "".join(["use", "r"])
+        self.assertIsNot(a, b)
+        self.assertIs(t.intern(a), t.intern(b))
+
+
+class TestFollowing(unittest.TestCase):
+    def setUp(self):
+        self.table = UsernameTable()
+        self.f = Following(["b", "a", "c"], self.table)
+
+    def test_sequence(self):
+        self.assertEqual(3, len(self.f))
+        self.assertEqual("a", self.f[1])
+        self.assertEqual(["a", "c"], self.f[1:])
+        self.assertEqual(["b", "a", "c"], list(self.f))
+        self.assertTrue("c" in self.f)
+        self.assertFalse("d" in self.f)
+        self.assertFalse("d" in self.table)
+
+    def test_ids(self):
+        self.assertEqual([0, 1, 2], list(self.f.ids))
+        self.assertEqual([1, 2], list(Following(["a", "c"], self.table).ids))
+
+    def test_eq(self):
+        self.assertEqual(["b", "a", "c"], self.f)
+        self.assertEqual(self.f, ["b", "a", "c"])
+        self.assertNotEqual(self.f, ["a", "b", "c"])
+        self.assertNotEqual(self.f, "bac")
+        self.assertEqual([], Following([], self.table))
+
+    def test_pickle(self):
+        f = pickle.loads(pickle.dumps(Following(["x", "y"])))
+        self.assertEqual(["x", "y"], f)
+
+
+class TestUsernameStates(unittest.TestCase):
+    def test_states(self):
+        t = UsernameTable()
+        t.id("a")
+        s = usernames.UsernameStates(t)
+        self.assertEqual(0, len(s))
+        self.assertFalse("a" in s)
+        self.assertIsNone(s.get("b"))
+        self.assertRaises(KeyError, lambda: s["a"])
+
+        s["b"] = 1
+        s["a"] = 2
+        s["b"] = 3
+        self.assertEqual(3, s["b"])
+        self.assertEqual(2, s.get("a"))
+        self.assertEqual(2, len(s))
+
+        s.set_id(t.id("c"), 1)
+        self.assertEqual(1, s["c"])
+        self.assertEqual(1, s.get_id(t.id("c")))
+        # never given a state, past the end of the states or not
+        self.assertEqual(0, s.get_id(t.id("d")))
+        self.assertEqual(0, s.get_id(1000))